@@ -1,9 +1,10 @@
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import secrets
 import os
-import time
+from concurrent.futures import wait
+from mail_queue import MailQueue
+from verification_codes import CODE_TTL, RateLimitError, open_code_store
 
 # Try to load .env file if python-dotenv is available
 try:
@@ -12,6 +13,10 @@ try:
 except ImportError:
     pass  # dotenv not installed, will use system environment variables
 
+# Seconds registration waits for the mail server before asking for the
+# code: long enough for a rejected address or bad credentials to show up
+DELIVERY_WAIT = 10
+
 class AuthManager:
     def __init__(self):
         # Load email config from environment variables
@@ -19,7 +24,13 @@ class AuthManager:
         self.port = int(os.getenv("SMTP_PORT", "587"))
         self.username = os.getenv("EMAIL_ADDRESS")
         self.password = os.getenv("EMAIL_PASSWORD")
-        self.pending_codes = {}  # Store verification codes temporarily
+        # Pending verification codes; NOSWAG_CODE_STORE names a SQLite file
+        # that keeps them across restarts
+        self.codes = open_code_store(os.getenv("NOSWAG_CODE_STORE"))
+        # SMTP_STARTTLS=0 allows a plain local test server such as
+        # "python -m aiosmtpd -n -l localhost:8025"
+        self.mail = MailQueue(self.smtp_server, self.port, self.username, self.password,
+                              starttls=os.getenv("SMTP_STARTTLS", "1") != "0")
         
         if not self.username or not self.password:
             print("Warning: Email credentials not configured.")
@@ -27,7 +38,7 @@ class AuthManager:
             print("See README.md for detailed setup instructions.")
 
     def send_email(self, to_email, subject, body):
-        """Send email with verification code"""
+        """Queue an email for delivery; returns a Future that resolves to True once it is sent"""
         if not self.username or not self.password:
             print("Email credentials not configured. Cannot send verification email.")
             return False
@@ -39,28 +50,35 @@ class AuthManager:
 
         msg.attach(MIMEText(body, 'plain'))
 
-        try:
-            with smtplib.SMTP(self.smtp_server, self.port) as server:
-                server.starttls()
-                server.login(self.username, self.password)
-                server.send_message(msg)
-            print(f"Email sent to {to_email}")
-            return True
-        except Exception as e:
-            print(f"Failed to send email: {e}")
-            return False
+        # Delivery (with retries) happens on a background thread over a
+        # session that stays open for the next message
+        return self.mail.submit(msg)
+
+    def delivery_failed(self, delivery, timeout=0):
+        """Return the error of a failed delivery, waiting up to timeout seconds for it to finish
+        (None while still pending or once sent)"""
+        wait([delivery], timeout)
+        if delivery.done() and delivery.exception() is not None:
+            return delivery.exception()
+        return None
+
+    def close(self, timeout=None):
+        """Finish queued deliveries and close the SMTP session and code store"""
+        self.mail.close(timeout)
+        self.codes.close()
         
     def generate_verification_code(self, length=6):
         """Generate secure random verification code"""
         return ''.join(secrets.choice('0123456789') for _ in range(length))
 
     def send_verification_email(self, email):
-        """Send verification code to email and store it temporarily"""
+        """Queue the verification code email and store the code temporarily"""
         code = self.generate_verification_code()
-        self.pending_codes[email] = {
-            "code": code,
-            "timestamp": time.time()
-        }
+        try:
+            self.codes.add(email, code)
+        except RateLimitError as e:
+            print(e)
+            return False
         
         subject = "noSwag Password Manager - Verification Code"
         body = f"""
@@ -68,7 +86,7 @@ class AuthManager:
         
         Your verification code is: {code}
         
-        This code will expire in 10 minutes.
+        This code will expire in {CODE_TTL // 60} minutes.
         
         If you didn't request this code, please ignore this email.
         """
@@ -77,32 +95,8 @@ class AuthManager:
 
     def verify_code(self, email, input_code):
         """Verify the entered code against stored code"""
-        if email not in self.pending_codes:
-            return False
-            
-        stored_data = self.pending_codes[email]
-        stored_code = stored_data["code"]
-        timestamp = stored_data["timestamp"]
-        
-        # Check if code has expired (10 minutes)
-        if time.time() - timestamp > 600:
-            del self.pending_codes[email]
-            return False
-            
-        # Check if code matches
-        if input_code == stored_code:
-            del self.pending_codes[email]  # Clear used code
-            return True
-            
-        return False
+        return self.codes.verify(email, input_code)
 
     def cleanup_expired_codes(self):
         """Remove expired verification codes"""
-        current_time = time.time()
-        expired_emails = [
-            email for email, data in self.pending_codes.items()
-            if current_time - data["timestamp"] > 600
-        ]
-        
-        for email in expired_emails:
-            del self.pending_codes[email]
+        return self.codes.purge_expired()
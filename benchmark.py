@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# benchmark.py - times noSwag's hot paths and writes machine readable results
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+BENCH_PASSWORD = "benchmark master password"
+
+# Vault file name per backend; the extension picks the storage format
+BACKENDS = {"json": "data.json", "nsv": "data.nsv", "sqlite": "data.db"}
+
+class Benchmark:
+    def __init__(self, repeat=5, ops=100):
+        self.repeat = repeat
+        self.ops = ops
+        self.results = []
+
+    def measure(self, name, func, setup=None, backend=None, size=None, count=1):
+        """Run func repeat times and record the median (plus min) wall time"""
+        timings = []
+        for _ in range(self.repeat):
+            state = setup() if setup else None
+            start = time.perf_counter()
+            func(state) if setup else func()
+            timings.append(time.perf_counter() - start)
+
+        result = {
+            "name": name,
+            "backend": backend,
+            "size": size,
+            "count": count,
+            "median_s": statistics.median(timings),
+            "min_s": min(timings),
+            "per_op_us": statistics.median(timings) / count * 1e6,
+        }
+        self.results.append(result)
+        label = " ".join(str(part) for part in (name, backend, size) if part is not None)
+        print(f"  {label:<34} {result['median_s'] * 1000:10.2f} ms  ({result['per_op_us']:.1f} us/op)")
+        return result
+
+def synthetic_entries(n):
+    """Yield n entries shaped like real ones"""
+    for i in range(n):
+        yield {
+            "site": f"site-{i:06d}.example.com",
+            "username": f"user{i}@example.com",
+            "password": f"P@ss-{i:06d}-{'x' * 12}",
+            "notes": "synthetic benchmark entry"
+        }
+
+def build_vault(directory, backend, size):
+    """Create a vault with size entries and return the unlocked storage"""
+    from storage_backend import open_storage
+    storage = open_storage(os.path.join(directory, BACKENDS[backend]))
+    storage.initialize_new_user("bench@example.com", BENCH_PASSWORD)
+    storage.save_passwords(synthetic_entries(size))
+    if hasattr(storage, "compact"):
+        storage.compact()
+    return storage
+
+def bench_storage(bench, directory, backend, size):
+    """Time vault operations on a synthetic vault of the given size"""
+    from storage_backend import open_storage
+
+    # Built once per size, so this one is a single run
+    start = time.perf_counter()
+    storage = build_vault(directory, backend, size)
+    elapsed = time.perf_counter() - start
+    bench.results.append({"name": "build", "backend": backend, "size": size, "count": size,
+                          "median_s": elapsed, "min_s": elapsed, "per_op_us": elapsed / max(size, 1) * 1e6})
+    crypto = storage.crypto
+    path = storage.file_path
+    sites = [entry["site"] for entry in synthetic_entries(size)]
+    sample = random.Random(size).sample(sites, min(bench.ops, size))
+    ops = len(sample)
+
+    def fresh():
+        """A new storage object unlocked with the already derived key"""
+        other = open_storage(path)
+        other.unlock_with(crypto)
+        return other
+
+    def reopen():
+        return open_storage(path)
+
+    bench.measure("unlock (no KDF)", lambda s: s.unlock_with(crypto), reopen, backend, size)
+    bench.measure("get cold", lambda s: s.get_password(sample[0]), fresh, backend, size)
+    bench.measure("get warm", lambda: [storage.get_password(site) for site in sample], None, backend, size, ops)
+    bench.measure("list cold", lambda s: s.list_sites(), fresh, backend, size)
+    bench.measure("list warm", storage.list_sites, None, backend, size)
+    bench.measure("iter cold", lambda s: sum(1 for _ in s.iter_entries()), fresh, backend, size)
+    bench.measure("save", lambda: [storage.save_password(site, "u", "changed") for site in sample],
+                  None, backend, size, ops)
+    # The first audit scores every password; later ones reuse the cached scores
+    start = time.perf_counter()
+    storage.audit()
+    elapsed = time.perf_counter() - start
+    bench.results.append({"name": "audit uncached", "backend": backend, "size": size, "count": size,
+                          "median_s": elapsed, "min_s": elapsed, "per_op_us": elapsed / max(size, 1) * 1e6})
+    bench.measure("audit", storage.audit, None, backend, size)
+    bench.measure("delete", lambda _: [storage.delete_password(site) for site in sample],
+                  lambda: storage.save_passwords(
+                      {"site": site, "username": "u", "password": "p"} for site in sample),
+                  backend, size, ops)
+    storage.close()
+
+def bench_crypto(bench):
+    """Time key derivation at the parameters vaults actually use"""
+    from crypto_manager import CryptoManager, DEFAULT_KDF, calibrate_kdf
+    salt = os.urandom(16)
+    bench.measure("kdf pbkdf2 100k", lambda: CryptoManager(BENCH_PASSWORD, salt, DEFAULT_KDF))
+    calibrated = calibrate_kdf()
+    bench.measure(f"kdf pbkdf2 {calibrated['iterations'] // 1000}k (calibrated)",
+                  lambda: CryptoManager(BENCH_PASSWORD, salt, calibrated))
+
+    crypto = CryptoManager(BENCH_PASSWORD, salt, DEFAULT_KDF)
+    tokens = [crypto.encrypt(f"record {i}") for i in range(1000)]
+    bench.measure("encrypt record", lambda: [crypto.encrypt("record") for _ in range(1000)], count=1000)
+    bench.measure("decrypt record", lambda: [crypto.decrypt(token) for token in tokens], count=1000)
+    bench.measure("blind index", lambda: [crypto.blind_index(f"site-{i}") for i in range(1000)], count=1000)
+
+def bench_batch(bench, directory, vaults=8):
+    """Time a batch verify of several vaults with one worker and with one per CPU"""
+    from crypto_manager import DEFAULT_KDF
+    from vault_batch import VaultBatch
+    paths = []
+    for i in range(vaults):
+        vault_dir = os.path.join(directory, f"batch-{i}")
+        os.makedirs(vault_dir)
+        storage = build_vault(vault_dir, "json", 100)
+        # A real KDF cost, since that is the work the batch spreads out
+        storage.change_master_password(BENCH_PASSWORD, DEFAULT_KDF)
+        storage.close()
+        paths.append((storage.file_path, BENCH_PASSWORD))
+
+    for workers in sorted({1, os.cpu_count() or 1}):
+        batch = VaultBatch(workers)
+        bench.measure(f"batch verify workers={workers}", lambda: batch.run("verify", paths), count=vaults)
+
+def bench_generator(bench, count=10000):
+    """Time password and passphrase generation throughput"""
+    from password_generator import PasswordGenerator
+    generator = PasswordGenerator()
+    bench.measure("generate_password 16", lambda: [generator.generate_password(16) for _ in range(count)],
+                  count=count)
+    bench.measure("generate_many 16", lambda: list(generator.generate_many(count, 16)), count=count)
+    bench.measure("generate_passphrase 6", lambda: [generator.generate_passphrase(6) for _ in range(count)],
+                  count=count)
+    samples = ["password1", "correcthorsebatterystaple", "qwerty123", "13/05/1987"] + \
+              list(generator.generate_many(96, 16))
+    generator.check_password_strength("warm up")
+    bench.measure("check_password_strength", lambda: [generator.check_password_strength(p) for p in samples],
+                  count=len(samples))
+
+def bench_cli(bench):
+    """Time cold starts of the CLI in a fresh interpreter"""
+    script = os.path.join(HERE, "noSwag.py")
+    env = dict(os.environ, NOSWAG_VAULT=os.path.join(tempfile.gettempdir(), "noswag-bench-missing.json"))
+    def run(*args):
+        subprocess.run([sys.executable, script, *args], env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    bench.measure("python (baseline)", lambda: subprocess.run([sys.executable, "-c", "pass"], check=True))
+    bench.measure("cli generate", lambda: run("generate"))
+    bench.measure("cli --help", lambda: run("--help"))
+
+def git_commit():
+    """Return the current commit hash, if this is a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline_path, results):
+    """Print the change of every result against a saved baseline run"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    key = lambda r: (r["name"], r["backend"], r["size"])
+    old = {key(r): r for r in baseline["results"]}
+
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    for result in results:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        ratio = result["median_s"] / before["median_s"] if before["median_s"] else float("inf")
+        label = " ".join(str(part) for part in key(result) if part is not None)
+        flag = "  slower" if ratio > 1.1 else "  faster" if ratio < 0.9 else ""
+        print(f"  {label:<34} {before['median_s'] * 1000:10.2f} -> {result['median_s'] * 1000:10.2f} ms"
+              f"  x{ratio:.2f}{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark noSwag storage, crypto, generator and CLI startup")
+    parser.add_argument("--sizes", default="10,1000,10000",
+                        help="comma separated vault sizes (e.g. 10,1000,100000)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated: json,nsv,sqlite")
+    parser.add_argument("--only", default="storage,crypto,batch,generator,cli",
+                        help="comma separated groups to run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (median is reported)")
+    parser.add_argument("--ops", type=int, default=100, help="operations per save/get/delete measurement")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Vaults use the minimum KDF cost, so building them stays quick
+    os.environ["NOSWAG_KDF_TARGET_MS"] = "1"
+    groups = args.only.split(",")
+    bench = Benchmark(args.repeat, args.ops)
+    directory = tempfile.mkdtemp(prefix="noswag-bench-")
+    try:
+        if "storage" in groups:
+            for size in (int(size) for size in args.sizes.split(",")):
+                for backend in args.backends.split(","):
+                    print(f"Storage: {backend}, {size} entries")
+                    vault_dir = os.path.join(directory, f"{backend}-{size}")
+                    os.makedirs(vault_dir)
+                    bench_storage(bench, vault_dir, backend, size)
+                    shutil.rmtree(vault_dir)
+        if "crypto" in groups:
+            print("Crypto")
+            bench_crypto(bench)
+        if "batch" in groups:
+            print("Batch")
+            bench_batch(bench, directory)
+        if "generator" in groups:
+            print("Generator")
+            bench_generator(bench)
+        if "cli" in groups:
+            print("CLI startup")
+            bench_cli(bench)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": bench.results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(args.compare, bench.results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# breach_corpus.py - offline lookups in a downloaded list of breached password hashes
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+# The corpus is the Have I Been Pwned "SHA-1, ordered by hash" download:
+# one "HASH:COUNT" line per breached password, upper-case hex, sorted by
+# hash. It is tens of GB, so it is only ever read through a memory map.
+HASH_LENGTH = 40
+
+# Optional index kept next to the corpus (pwned.txt.idx): the byte offset
+# of the first line of every 16-bit hash prefix, then the file size, as
+# big-endian u64 values. One lookup then searches a range of a few KB.
+INDEX_SUFFIX = ".idx"
+INDEX_ENTRIES = 65536
+_OFFSET = struct.Struct(">Q")
+
+_corpora = {}  # path -> BreachCorpus, opened once per process
+
+def corpus_path():
+    """Return the corpus location from NOSWAG_BREACH_CORPUS, if set"""
+    return os.getenv("NOSWAG_BREACH_CORPUS")
+
+def default_corpus():
+    """Return the configured corpus, or None when no corpus has been downloaded"""
+    path = corpus_path()
+    if not path or not os.path.exists(path):
+        return None
+    corpus = _corpora.get(path)
+    if corpus is None:
+        corpus = _corpora[path] = BreachCorpus(path)
+    return corpus
+
+def sha1_hex(password):
+    """Return the upper-case SHA-1 hex digest the corpus is keyed by"""
+    return hashlib.sha1(password.encode()).hexdigest().upper()
+
+def breached_sites(entries):
+    """Return {site: breach count} for the (site, password) pairs found in the configured corpus"""
+    corpus = default_corpus()
+    if corpus is None:
+        return {}
+    digests = {site: sha1_hex(password) for site, password in entries if password}
+    counts = corpus.counts(digests.values())
+    return {site: counts[digest] for site, digest in digests.items() if digest in counts}
+
+class BreachCorpus:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # An empty file cannot be mapped, and has nothing to find anyway
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self._index = self._load_index()
+
+    def _load_index(self):
+        """Read the prefix index if it exists and is newer than the corpus"""
+        index_path = self.path + INDEX_SUFFIX
+        try:
+            if os.path.getmtime(index_path) < os.path.getmtime(self.path):
+                return None
+            with open(index_path, 'rb') as f:
+                index = f.read()
+        except OSError:
+            return None
+        if len(index) != (INDEX_ENTRIES + 1) * _OFFSET.size or \
+                _OFFSET.unpack_from(index, INDEX_ENTRIES * _OFFSET.size)[0] != self.size:
+            return None
+        return index
+
+    def _range(self, target):
+        """Return the byte range of lines that can hold target"""
+        if self._index is None:
+            return 0, self.size
+        prefix = int(target[:4], 16)
+        return (_OFFSET.unpack_from(self._index, prefix * _OFFSET.size)[0],
+                _OFFSET.unpack_from(self._index, (prefix + 1) * _OFFSET.size)[0])
+
+    def _search(self, target, lo, hi):
+        """Return the start of the first line in [lo, hi) whose hash is not below target"""
+        mm = self._map
+        while lo < hi:
+            mid = (lo + hi) // 2
+            # Back up to the start of the line holding mid; lo is always a line start
+            newline = mm.rfind(b"\n", lo, mid)
+            start = lo if newline < 0 else newline + 1
+            if mm[start:start + HASH_LENGTH] < target:
+                end = mm.find(b"\n", start, hi)
+                lo = hi if end < 0 else end + 1
+            else:
+                hi = start
+        return lo
+
+    def _count_at(self, position, target):
+        if self._map[position:position + HASH_LENGTH] != target:
+            return 0
+        end = self._map.find(b"\n", position)
+        line = self._map[position + HASH_LENGTH + 1:end if end >= 0 else self.size]
+        return int(line.strip() or 1)
+
+    def count_hash(self, digest):
+        """Return how often a SHA-1 hex digest appears in the corpus (0 if never)"""
+        target = digest.upper().encode()
+        lo, hi = self._range(target)
+        return self._count_at(self._search(target, lo, hi), target)
+
+    def count(self, password):
+        """Return how often password appears in the corpus (0 if never)"""
+        return self.count_hash(sha1_hex(password))
+
+    def counts(self, digests):
+        """Look up many digests; return {digest: count} for the breached ones"""
+        # Sorted targets land at increasing offsets, so every search starts
+        # where the previous one ended and the corpus is read front to back
+        found = {}
+        position = 0
+        for digest in sorted({digest.upper() for digest in digests}):
+            target = digest.encode()
+            lo, hi = self._range(target)
+            position = self._search(target, max(lo, position), hi)
+            count = self._count_at(position, target)
+            if count:
+                found[digest] = count
+        return found
+
+    def build_index(self):
+        """Write the prefix index next to the corpus; return its path"""
+        from vault_file import atomic_write
+        offsets = []
+        position = 0
+        for prefix in range(INDEX_ENTRIES):
+            position = self._search(f"{prefix:04X}".encode(), position, self.size)
+            offsets.append(position)
+        offsets.append(self.size)
+        index_path = self.path + INDEX_SUFFIX
+        atomic_write(index_path, b"".join(_OFFSET.pack(offset) for offset in offsets))
+        self._index = self._load_index()
+        return index_path
+
+    def close(self):
+        if self.size:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def main():
+    import argparse
+    import getpass
+    parser = argparse.ArgumentParser(description="Check passwords against a downloaded breached-password corpus")
+    parser.add_argument("command", choices=["index", "check"],
+                        help="index: build the prefix index; check: look up a password")
+    parser.add_argument("corpus", nargs="?", default=corpus_path(),
+                        help="the sorted SHA-1 corpus (default: NOSWAG_BREACH_CORPUS)")
+    args = parser.parse_args()
+    if not args.corpus or not os.path.exists(args.corpus):
+        print("No corpus found. Download the SHA-1 list ordered by hash and set NOSWAG_BREACH_CORPUS.")
+        return 1
+
+    with BreachCorpus(args.corpus) as corpus:
+        if args.command == "index":
+            print(f"Index written to {corpus.build_index()}")
+            return 0
+        count = corpus.count(getpass.getpass("Password to check: "))
+    if count:
+        print(f"Found in {count:,} breaches. Do not use this password.")
+        return 2
+    print("Not found in the corpus.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
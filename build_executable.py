@@ -23,7 +23,13 @@ def build_executable():
     
     # Check if required files exist
     required_files = ["noSwag.py", "storage_manager.py", "auth_manager.py", 
-                     "password_generator.py", "crypto_manager.py"]
+                     "password_generator.py", "crypto_manager.py", "vault_log.py",
+                     "storage_backend.py", "sqlite_storage.py", "unlock_agent.py",
+                     "password_importer.py", "vault_backup.py", "vault_container.py",
+                     "vault_file.py", "passphrase_generator.py", "eff_large_wordlist.txt",
+                     "strength_estimator.py", "strength_dictionaries.txt", "vault_audit.py",
+                     "breach_corpus.py", "mail_queue.py",
+                     "verification_codes.py", "parallel_decrypt.py"]
     
     missing_files = [f for f in required_files if not os.path.exists(f)]
     if missing_files:
@@ -40,6 +46,8 @@ def build_executable():
         "--distpath", "dist",          # Output directory
         "--workpath", "build",         # Build directory
         "--add-data", ".env.example;.", # Include .env.example
+        "--add-data", "eff_large_wordlist.txt;.", # Passphrase wordlist
+        "--add-data", "strength_dictionaries.txt;.", # Password strength dictionaries
         "--hidden-import", "cryptography",
         "--hidden-import", "dotenv",
         "noSwag.py"                    # Main file
@@ -2,55 +2,205 @@
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 import base64
+import hashlib
+import hmac
 import os
+import time
+
+# Parameters used by vaults that predate stored KDF settings
+DEFAULT_KDF = {"algorithm": "pbkdf2-sha256", "iterations": 100000}
+
+# Never calibrate below these, however slow the machine is
+MIN_PBKDF2_ITERATIONS = 100000
+MIN_SCRYPT_N = 2 ** 14
+
+# Unlock latency the calibration aims for
+DEFAULT_TARGET_MS = 250
+
+def kdf_from_metadata(metadata):
+    """Return the KDF parameters recorded in vault metadata"""
+    if "kdf" in metadata:
+        return dict(metadata["kdf"])
+    return dict(DEFAULT_KDF, iterations=metadata.get("iterations", DEFAULT_KDF["iterations"]))
+
+def kdf_cost(kdf):
+    """Return a number that grows with the work the KDF parameters demand"""
+    if kdf["algorithm"] == "scrypt":
+        return kdf["n"] * kdf["r"] * kdf["p"]
+    return kdf["iterations"]
+
+def kdf_is_weaker(current, target):
+    """Check whether stored parameters fall behind the target parameters"""
+    if current["algorithm"] != target["algorithm"]:
+        return True
+    return kdf_cost(current) < kdf_cost(target)
+
+def describe_kdf(kdf):
+    """Return a short human readable form of KDF parameters"""
+    if kdf["algorithm"] == "scrypt":
+        return f"scrypt n={kdf['n']} r={kdf['r']} p={kdf['p']}"
+    return f"PBKDF2-SHA256 {kdf['iterations']} iterations"
+
+def calibrate_kdf(algorithm="pbkdf2-sha256", target_ms=DEFAULT_TARGET_MS):
+    """Benchmark this machine and pick KDF parameters that take about target_ms"""
+    password = b"noSwag calibration"
+    salt = os.urandom(16)
+    
+    if algorithm == "scrypt":
+        # Time the cheapest setting and double n while it still fits
+        n = MIN_SCRYPT_N
+        start = time.perf_counter()
+        Scrypt(salt=salt, length=32, n=n, r=8, p=1).derive(password)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        while elapsed_ms * 2 <= target_ms:
+            n *= 2
+            elapsed_ms *= 2
+        return {"algorithm": "scrypt", "n": n, "r": 8, "p": 1}
+    
+    if algorithm != "pbkdf2-sha256":
+        raise ValueError(f"Unsupported KDF algorithm: {algorithm}")
+    
+    # PBKDF2 cost is linear in the iteration count; keep the best of a
+    # few short runs so a busy moment doesn't skew the result
+    sample = 50000
+    elapsed_ms = None
+    for _ in range(3):
+        start = time.perf_counter()
+        PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=sample).derive(password)
+        run_ms = (time.perf_counter() - start) * 1000
+        elapsed_ms = run_ms if elapsed_ms is None else min(elapsed_ms, run_ms)
+    iterations = int(sample * target_ms / max(elapsed_ms, 0.001)) // 1000 * 1000
+    return {"algorithm": "pbkdf2-sha256", "iterations": max(iterations, MIN_PBKDF2_ITERATIONS)}
 
 class CryptoManager:
-    def __init__(self, master_password=None, salt=None):
+    def __init__(self, master_password=None, salt=None, kdf=None, wrapped_key=None):
         """
         Initialize crypto manager with master password and salt.
         If salt is None, a new one will be generated.
+        kdf holds the key derivation parameters (PBKDF2 by default).
+        wrapped_key is the vault's data key encrypted under the password key;
+        without it the password key itself encrypts the data (older vaults).
         """
+        self.kdf = dict(kdf or DEFAULT_KDF)
+        self.derive_seconds = None
+        self.wrapped_key = None
+        self._index_key = None
         if salt is None:
             self.salt = os.urandom(16)
         else:
             self.salt = salt
             
+        self.key = None
+        self.cipher = None
         if master_password is not None:
-            self.key = self._derive_key(master_password, self.salt)
-            self.cipher = Fernet(self.key)
-        else:
-            self.key = None
-            self.cipher = None
+            password_key = self._derive_key(master_password, self.salt)
+            if wrapped_key is None:
+                self._use_key(password_key)
+            else:
+                # Fails with InvalidToken on a wrong master password
+                self._use_key(Fernet(password_key).decrypt(wrapped_key))
+                self.wrapped_key = wrapped_key
+
+    def _use_key(self, key):
+        """Make key the data encryption key"""
+        self.key = key
+        self.cipher = Fernet(key)
+        self._index_key = None
+
+    @classmethod
+    def from_key(cls, key, salt=None):
+        """Build a crypto manager around an existing data key, skipping the KDF"""
+        crypto = cls(salt=salt)
+        crypto._use_key(key)
+        return crypto
 
     def _derive_key(self, password, salt):
-        """Derive encryption key from password using PBKDF2"""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
+        """Derive encryption key from password using the configured KDF"""
+        algorithm = self.kdf["algorithm"]
+        if algorithm == "pbkdf2-sha256":
+            kdf = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=salt,
+                iterations=self.kdf["iterations"],
+            )
+        elif algorithm == "scrypt":
+            kdf = Scrypt(
+                salt=salt,
+                length=32,
+                n=self.kdf["n"],
+                r=self.kdf["r"],
+                p=self.kdf["p"],
+            )
+        else:
+            raise ValueError(f"Unsupported KDF algorithm: {algorithm}")
+        
+        start = time.perf_counter()
         key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+        self.derive_seconds = time.perf_counter() - start
         return key
 
+    def derive_subkey(self, purpose, length=32):
+        """Derive an independent subkey for the given purpose from the data key"""
+        if self.key is None:
+            raise ValueError("Master password not set. Call set_master_password() first.")
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=length,
+            salt=None,
+            info=purpose.encode(),
+        )
+        return hkdf.derive(base64.urlsafe_b64decode(self.key))
+
+    def blind_index(self, name):
+        """Return a keyed hash of name for lookups that must not reveal it"""
+        if self._index_key is None:
+            self._index_key = self.derive_subkey("noswag-site-index")
+        return hmac.new(self._index_key, name.encode(), hashlib.sha256).hexdigest()
+
     def get_salt_b64(self):
         """Return base64 encoded salt for storage"""
         return base64.b64encode(self.salt).decode()
 
-    def set_master_password(self, master_password):
-        """Set or change the master password"""
-        self.key = self._derive_key(master_password, self.salt)
-        self.cipher = Fernet(self.key)
+    def set_master_password(self, master_password, kdf=None):
+        """
+        Set or change the master password.
+        Only the data key is re-wrapped (under a fresh salt), so stored
+        data stays valid; a random data key is created if there is none.
+        """
+        if self.key is None:
+            self._use_key(Fernet.generate_key())
+        if kdf is not None:
+            self.kdf = dict(kdf)
+        self.salt = os.urandom(16)
+        password_key = self._derive_key(master_password, self.salt)
+        self.wrapped_key = Fernet(password_key).encrypt(self.key)
 
     def encrypt(self, data):
-        """Encrypt data using the derived key"""
+        """Encrypt data using the data key"""
         if self.cipher is None:
             raise ValueError("Master password not set. Call set_master_password() first.")
         return self.cipher.encrypt(data.encode())
 
     def decrypt(self, token):
-        """Decrypt data using the derived key"""
+        """Decrypt data using the data key"""
         if self.cipher is None:
             raise ValueError("Master password not set. Call set_master_password() first.")
         return self.cipher.decrypt(token).decode()
+
+def crypto_from_metadata(metadata, master_password):
+    """Derive the password key and unwrap the data key described by vault metadata"""
+    wrapped_key = metadata.get("wrapped_key")
+    return CryptoManager(
+        master_password,
+        base64.b64decode(metadata["salt"]),
+        kdf_from_metadata(metadata),
+        wrapped_key.encode() if wrapped_key else None
+    )
+
+def unwrap_data_key(metadata, master_password):
+    """Return the vault's data key; a plain function, so it can run in a worker process"""
+    return crypto_from_metadata(metadata, master_password).key
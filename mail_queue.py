@@ -0,0 +1,133 @@
+# mail_queue.py - background email delivery over one reused SMTP session
+import atexit
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import Future
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0       # seconds before the first retry, doubled after each
+IDLE_TIMEOUT = 30           # close the SMTP session after this long without mail
+SMTP_TIMEOUT = 30           # socket timeout for the SMTP connection
+
+def is_transient(error):
+    """Decide whether a failed delivery is worth retrying"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 4xx replies are temporary (greylisting, rate limits); 5xx are final
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)  # Network errors and timeouts
+
+class MailQueue:
+    """Sends queued messages from a worker thread, keeping the authenticated session open"""
+
+    def __init__(self, host, port, username=None, password=None, starttls=True,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, idle_timeout=IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.connections = 0  # SMTP sessions opened so far
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._server = None
+
+    def submit(self, msg):
+        """Queue a message and return a Future that resolves to True once it is sent"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ValueError("The mail queue is closed.")
+            if self._thread is None:
+                # Started on first use, so creating a queue never touches the network
+                self._thread = threading.Thread(target=self._run, name="noswag-mail", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._queue.put((msg, future))
+        return future
+
+    def close(self, timeout=None):
+        """Deliver what is already queued, then end the SMTP session and the worker"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            if item is None:
+                self._disconnect()
+                return
+
+            msg, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._deliver(msg))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+            if self.password and server.has_extn("auth"):
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.connections += 1
+        return server
+
+    def _disconnect(self):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _deliver(self, msg):
+        attempt = 0
+        while True:
+            reused = self._server is not None
+            try:
+                if self._server is None:
+                    self._server = self._connect()
+                self._server.send_message(msg)
+                return True
+            except Exception as e:
+                self._disconnect()
+                if reused and isinstance(e, smtplib.SMTPServerDisconnected):
+                    continue  # The server dropped the idle session; reconnect right away
+                if attempt >= self.retries or not is_transient(e):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
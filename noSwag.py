@@ -2,18 +2,56 @@
 import getpass
 import os
 import re
-from storage_manager import StorageManager
-from auth_manager import AuthManager
-from password_generator import PasswordGenerator
+import sys
+import time
+from contextlib import redirect_stdout
+
+# Heavier modules (cryptography, smtplib, dotenv, sockets) are imported by
+# the commands that need them, so one-shot commands start quickly. Time
+# from here to running the command should stay within this budget; set
+# NOSWAG_TIMING=1 to print it.
+STARTUP_BUDGET_MS = 50
+_STARTED = time.perf_counter()
+
+def load_environment():
+    """Load settings from a .env file, importing python-dotenv only if one exists"""
+    here = os.path.dirname(os.path.abspath(sys.argv[0]))
+    for directory in (here, os.getcwd()):
+        path = os.path.join(directory, ".env")
+        if os.path.exists(path):
+            break
+    else:
+        return
+    
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return  # dotenv not installed, will use system environment variables
+    load_dotenv(path)
+
+def vault_path():
+    """Return the vault location, overridable with NOSWAG_VAULT"""
+    return os.getenv("NOSWAG_VAULT", "data.json")
 
 class noSwagPasswordManager:
     def __init__(self):
-        self.storage = StorageManager()
-        self.auth = AuthManager()
+        from storage_backend import open_storage
+        from password_generator import PasswordGenerator
+        self.storage = open_storage(vault_path())
+        self._auth = None
         self.password_gen = PasswordGenerator()
+        self.agent = None
         self.current_user = None
         self.is_authenticated = False
 
+    @property
+    def auth(self):
+        """Email verification, set up only once registration needs it"""
+        if self._auth is None:
+            from auth_manager import AuthManager
+            self._auth = AuthManager()
+        return self._auth
+
     def is_valid_email(self, email):
         """Validate email format"""
         pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -25,6 +63,7 @@ class noSwagPasswordManager:
 
     def register_new_user(self):
         """Register a new user with email verification"""
+        from auth_manager import DELIVERY_WAIT
         print("\n=== noSwag Password Manager Registration ===")
         
         # Get email
@@ -44,11 +83,18 @@ class noSwagPasswordManager:
                 print("A different user account already exists on this system.")
                 return False
         
-        # Send verification email
+        # Send verification email; it is delivered in the background, but a
+        # permanent failure is reported before asking for the code
         print(f"Sending verification code to {email}...")
-        if not self.auth.send_verification_email(email):
+        delivery = self.auth.send_verification_email(email)
+        if not delivery:
             print("Failed to send verification email. Please check your email settings.")
             return False
+        error = self.auth.delivery_failed(delivery, DELIVERY_WAIT)
+        if error is not None:
+            print(f"Failed to send verification email: {error}")
+            print("Please check your email settings.")
+            return False
         
         # Get verification code
         max_attempts = 3
@@ -57,13 +103,19 @@ class noSwagPasswordManager:
             if self.auth.verify_code(email, code):
                 print("Email verified successfully!")
                 break
+            # Retries of a slow server may still fail after the prompt
+            error = self.auth.delivery_failed(delivery)
+            if error is not None:
+                print(f"Failed to send verification email: {error}")
+                print("Please check your email settings.")
+                return False
+            
+            remaining = max_attempts - attempt - 1
+            if remaining > 0:
+                print(f"Invalid code. {remaining} attempts remaining.")
             else:
-                remaining = max_attempts - attempt - 1
-                if remaining > 0:
-                    print(f"Invalid code. {remaining} attempts remaining.")
-                else:
-                    print("Too many failed attempts. Please restart registration.")
-                    return False
+                print("Too many failed attempts. Please restart registration.")
+                return False
         
         # Get master password
         while True:
@@ -98,6 +150,9 @@ class noSwagPasswordManager:
         email = self.storage.get_user_email()
         print(f"Logging in as: {email}")
         
+        if self.login_with_agent():
+            return True
+        
         max_attempts = 3
         for attempt in range(max_attempts):
             master_password = self.get_master_password()
@@ -107,6 +162,8 @@ class noSwagPasswordManager:
                 self.current_user = user_data
                 self.is_authenticated = True
                 print("Login successful!")
+                self.share_key_with_agent()
+                self.offer_vault_upgrade()
                 return True
             else:
                 remaining = max_attempts - attempt - 1
@@ -118,6 +175,63 @@ class noSwagPasswordManager:
         
         return False
 
+    def vault_id(self):
+        """Identify the vault to the unlock agent"""
+        return os.path.abspath(self.storage.file_path)
+
+    def login_with_agent(self):
+        """Unlock through a running noSwag agent, skipping the master password"""
+        from unlock_agent import AgentCrypto, connect_agent
+        if self.agent is None:
+            self.agent = connect_agent()
+        if self.agent is None:
+            return False
+        
+        try:
+            if not self.agent.is_unlocked(self.vault_id()):
+                return False
+            user_data = self.storage.unlock_with(AgentCrypto(self.agent, self.vault_id()))
+        except Exception as e:
+            print(f"Could not use the noSwag agent: {e}")
+            return False
+        
+        if user_data is None:
+            return False
+        
+        self.current_user = user_data
+        self.is_authenticated = True
+        print("Unlocked by the noSwag agent.")
+        self.offer_vault_upgrade()
+        return True
+
+    def share_key_with_agent(self):
+        """Cache the derived vault key in the agent so later runs skip the KDF"""
+        if self.agent is None or self.storage.crypto.key is None:
+            return
+        
+        try:
+            self.agent.add_key(self.vault_id(), self.storage.crypto.key)
+            print("Vault key cached in the noSwag agent.")
+        except Exception as e:
+            print(f"Could not reach the noSwag agent: {e}")
+
+    def offer_vault_upgrade(self):
+        """Offer to convert a 1.0 vault to the per-entry 2.0 format"""
+        if not self.storage.needs_upgrade():
+            return
+
+        print("Your vault uses the old 1.0 format, which re-encrypts everything on each change.")
+        choice = input("Upgrade it to the per-entry 2.0 format now? [Y/n]: ").lower()
+        if choice == 'n':
+            print("Keeping the 1.0 format.")
+            return
+
+        try:
+            self.storage.upgrade_vault()
+            print("Vault upgraded to format 2.0.")
+        except Exception as e:
+            print(f"Error upgrading vault: {e}")
+
     def add_password(self):
         """Add a new password entry"""
         if not self.is_authenticated:
@@ -156,6 +270,14 @@ class noSwagPasswordManager:
             if not password:
                 print("Password cannot be empty.")
                 return
+            
+            strength = self.password_gen.check_password_strength(password, (site, username))
+            print(f"Strength: {strength['strength']} (Score: {strength['score']}/4)")
+            if strength["breached"]:
+                print(f"Warning: this password appeared in {strength['breached']:,} data breaches.")
+                if input("Save it anyway? [y/N]: ").lower() != 'y':
+                    print("Password not saved.")
+                    return
         
         notes = input("Notes (optional): ").strip()
         
@@ -235,6 +357,136 @@ class noSwagPasswordManager:
         except Exception as e:
             print(f"Error deleting password: {e}")
 
+    def import_passwords(self):
+        """Import passwords exported from another password manager"""
+        if not self.is_authenticated:
+            print("Please login first.")
+            return
+        
+        print("\n=== Import Passwords ===")
+        print("Supports CSV exports (Bitwarden, LastPass, 1Password, KeePass, Chrome, Firefox)")
+        print("and Bitwarden JSON exports.")
+        path = input("Export file path: ").strip()
+        if not os.path.exists(path):
+            print(f"File not found: {path}")
+            return
+        
+        try:
+            from password_importer import PasswordImporter
+            importer = PasswordImporter()
+            count = importer.import_file(self.storage, path)
+            print(f"Imported {count} passwords.")
+            if importer.skipped:
+                print(f"Skipped {importer.skipped} records without a usable site or password.")
+            self.warn_breached(importer.breached)
+        except Exception as e:
+            print(f"Error importing passwords: {e}")
+
+    def export_passwords(self):
+        """Export the vault to an encrypted backup or a plaintext CSV"""
+        if not self.is_authenticated:
+            print("Please login first.")
+            return
+        
+        print("\n=== Export Passwords ===")
+        choice = input("Encrypted backup (b) or plaintext CSV (c)? [b/c]: ").lower()
+        path = input("Output file path: ").strip()
+        if not path:
+            print("Output path cannot be empty.")
+            return
+        
+        try:
+            if choice == 'c':
+                print("WARNING: a CSV export contains every password in plain text.")
+                confirm = input("Type 'export' to confirm: ").strip().lower()
+                if confirm != 'export':
+                    print("Export cancelled.")
+                    return
+                count = self.storage.export_csv(path)
+            else:
+                password = self.get_master_password("Backup password: ")
+                if password != self.get_master_password("Confirm backup password: "):
+                    print("Passwords don't match.")
+                    return
+                count = self.storage.export_backup(path, password)
+            print(f"Exported {count} passwords to {path}.")
+        except Exception as e:
+            print(f"Error exporting passwords: {e}")
+
+    def warn_breached(self, breached):
+        """Name the saved passwords found in the breach corpus"""
+        if breached:
+            sites = ", ".join(sorted(breached, key=lambda site: (-breached[site], site)))
+            print(f"Warning: {len(breached)} of these passwords appeared in data breaches: {sites}")
+            print("Change them soon; 'audit' lists them again later.")
+
+    def restore_passwords(self):
+        """Restore entries from an encrypted backup"""
+        if not self.is_authenticated:
+            print("Please login first.")
+            return
+        
+        print("\n=== Restore Backup ===")
+        path = input("Backup file path: ").strip()
+        if not os.path.exists(path):
+            print(f"File not found: {path}")
+            return
+        
+        password = self.get_master_password("Backup password: ")
+        breached = {}
+        try:
+            count = self.storage.restore_backup(path, password, breached)
+            print(f"Restored {count} passwords.")
+            self.warn_breached(breached)
+        except Exception as e:
+            print(f"Error restoring backup: {e or 'wrong backup password or damaged file'}")
+
+    def change_master_password(self):
+        """Change the master password"""
+        if not self.is_authenticated:
+            print("Please login first.")
+            return
+        
+        print("\n=== Change Master Password ===")
+        current = self.get_master_password("Current master password: ")
+        # Re-unlock with the password so the data key can be re-wrapped
+        if self.storage.load_user_data(current) is None:
+            print("Incorrect master password.")
+            return
+        
+        while True:
+            password1 = self.get_master_password("New master password: ")
+            if len(password1) < 8:
+                print("Master password must be at least 8 characters long.")
+                continue
+            
+            password2 = self.get_master_password("Confirm new master password: ")
+            if password1 == password2:
+                break
+            print("Passwords don't match. Please try again.")
+        
+        try:
+            self.storage.change_master_password(password1)
+            print("Master password changed successfully.")
+        except Exception as e:
+            print(f"Error changing master password: {e}")
+
+    def audit_passwords(self):
+        """Report reused, weak and old passwords"""
+        if not self.is_authenticated:
+            print("Please login first.")
+            return
+        
+        print("\n=== Password Audit ===")
+        days = input("Flag passwords older than how many days? (default 365): ").strip()
+        days = int(days) if days.isdigit() else 365
+        
+        try:
+            from vault_audit import format_report
+            print(format_report(self.storage.audit(max_age_days=days)))
+        except Exception as e:
+            print(f"Error auditing passwords: {e}")
+
     def generate_password_only(self):
         """Generate a password without storing it"""
         print("\n=== Password Generator ===")
@@ -260,7 +512,7 @@ class noSwagPasswordManager:
             
             # Show strength analysis
             strength = self.password_gen.check_password_strength(password)
-            print(f"Strength: {strength['strength']} (Score: {strength['score']}/6)")
+            print(f"Strength: {strength['strength']} (Score: {strength['score']}/4, about {strength['entropy']:.0f} bits)")
             
             # Option to generate passphrase
             passphrase_choice = input("\nGenerate a passphrase instead? [y/N]: ").lower()
@@ -268,8 +520,11 @@ class noSwagPasswordManager:
                 num_words = input("Number of words (default 4): ").strip()
                 num_words = int(num_words) if num_words.isdigit() else 4
                 
-                passphrase = self.password_gen.generate_passphrase(num_words=num_words)
+                from passphrase_generator import PassphraseGenerator
+                passphrases = PassphraseGenerator()
+                passphrase = passphrases.generate(num_words=num_words)
                 print(f"Generated passphrase: {passphrase}")
+                print(f"Entropy: {passphrases.entropy_bits(num_words):.1f} bits")
                 
         except Exception as e:
             print(f"Error generating password: {e}")
@@ -285,6 +540,11 @@ class noSwagPasswordManager:
         print("  list, ls    - List all stored sites")
         print("  delete, del - Delete a password")
         print("  generate    - Generate a password without storing")
+        print("  audit       - Find reused, weak and old passwords")
+        print("  import      - Import passwords from another manager")
+        print("  export      - Export an encrypted backup or CSV")
+        print("  restore     - Restore passwords from a backup")
+        print("  passwd      - Change your master password")
         print("  logout      - Logout from current session")
         print("  exit, quit  - Exit the program")
 
@@ -292,6 +552,16 @@ class noSwagPasswordManager:
         """Logout current user"""
         self.current_user = None
         self.is_authenticated = False
+        self.storage.close()
+        
+        # Logging out also locks the vault in the agent
+        if self.agent is not None:
+            try:
+                self.agent.lock(self.vault_id())
+            except Exception:
+                pass
+            self.agent.close()
+            self.agent = None
         print("Logged out successfully.")
 
     def main_loop(self):
@@ -330,9 +600,22 @@ class noSwagPasswordManager:
                     self.delete_password()
                 elif command == 'generate':
                     self.generate_password_only()
+                elif command == 'audit':
+                    self.audit_passwords()
+                elif command == 'import':
+                    self.import_passwords()
+                elif command == 'export':
+                    self.export_passwords()
+                elif command == 'restore':
+                    self.restore_passwords()
+                elif command == 'passwd':
+                    self.change_master_password()
                 elif command == 'logout':
                     self.logout()
                 elif command in ['exit', 'quit']:
+                    self.storage.close()
+                    if self._auth is not None:
+                        self._auth.close()
                     print("Goodbye!")
                     break
                 else:
@@ -343,13 +626,197 @@ class noSwagPasswordManager:
             except Exception as e:
                 print(f"An error occurred: {e}")
 
+def open_vault():
+    """Unlock the vault for a one-shot command, through the agent if it holds the key"""
+    from crypto_manager import crypto_from_metadata
+    from storage_backend import open_storage
+    from unlock_agent import AgentCrypto, connect_agent
+    
+    storage = open_storage(vault_path())
+    if not storage.user_exists():
+        raise SystemExit("No vault found. Run noSwag without arguments to register.")
+    
+    agent = connect_agent()
+    if agent is not None:
+        vault = os.path.abspath(storage.file_path)
+        try:
+            if agent.is_unlocked(vault) and \
+                    storage.unlock_with(AgentCrypto(agent, vault), read_only=True) is not None:
+                return storage, agent
+        except Exception as e:
+            print(f"Could not use the noSwag agent: {e}", file=sys.stderr)
+        agent.close()
+    
+    # Unlocked read-only: a command in a script takes only a shared lock and
+    # writes nothing, leaving the last login time and strengthening the key
+    # wrapping to the next interactive login
+    try:
+        crypto = crypto_from_metadata(storage.read_key_metadata(), getpass.getpass("Enter master password: "))
+    except Exception:
+        crypto = None
+    if crypto is None or storage.unlock_with(crypto, read_only=True) is None:
+        raise SystemExit("Invalid master password.")
+    return storage, None
+
+def close_vault(storage, agent):
+    storage.close()
+    if agent is not None:
+        agent.close()
+
+def command_get(args):
+    """Print one field (or, with --json, all fields) of a stored entry"""
+    # Only the requested output goes to stdout, so $(noSwag.py get site) captures just that
+    with redirect_stdout(sys.stderr):
+        storage, agent = open_vault()
+        try:
+            entry = storage.get_password(args.site)
+        finally:
+            close_vault(storage, agent)
+    
+    if entry is None:
+        print(f"No password found for '{args.site}'.", file=sys.stderr)
+        return 1
+    if args.json:
+        import json
+        print(json.dumps(dict(entry, site=args.site), indent=2))
+    else:
+        print(entry.get(args.field, ""))
+    return 0
+
+def command_list(args):
+    """Print the stored site names, one per line or as a JSON array"""
+    with redirect_stdout(sys.stderr):
+        storage, agent = open_vault()
+        try:
+            sites = sorted(storage.list_sites())
+        finally:
+            close_vault(storage, agent)
+    
+    if args.json:
+        import json
+        print(json.dumps(sites))
+    else:
+        for site in sites:
+            print(site)
+    return 0
+
+def command_audit(args):
+    """Print the audit report; the exit code is 1 if anything was flagged"""
+    with redirect_stdout(sys.stderr):
+        storage, agent = open_vault()
+        try:
+            report = storage.audit(max_age_days=args.max_age, min_score=args.min_score)
+        finally:
+            close_vault(storage, agent)
+    
+    if args.json:
+        import json
+        print(json.dumps(report, indent=2))
+    else:
+        from vault_audit import format_report
+        print(format_report(report))
+    return 1 if report["reused"] or report["weak"] or report["old"] or report["breached"] else 0
+
+def command_generate(args):
+    """Stream generated passwords (or passphrases) to stdout, one per line"""
+    if args.passphrase:
+        from passphrase_generator import PassphraseGenerator
+        generator = PassphraseGenerator()
+        settings = dict(num_words=args.words, digits=args.digits, symbols=args.symbols)
+        if args.entropy:
+            print(f"{generator.entropy_bits(**settings):.1f} bits", file=sys.stderr)
+        passwords = generator.generate_many(args.count, separator=args.separator,
+                                            capitalize=args.capitalize, **settings)
+    else:
+        from password_generator import PasswordGenerator
+        passwords = PasswordGenerator().generate_many(
+            args.count,
+            length=args.length,
+            use_uppercase=not args.no_uppercase,
+            use_digits=not args.no_digits,
+            use_symbols=not args.no_symbols,
+            exclude_ambiguous=args.exclude_ambiguous
+        )
+    sys.stdout.writelines(f"{password}\n" for password in passwords)
+    return 0
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="noswag",
+        description="noSwag password manager. Run without a command for the interactive shell."
+    )
+    commands = parser.add_subparsers(dest="command")
+    
+    get = commands.add_parser("get", help="print a stored password (or another field)")
+    get.add_argument("site")
+    get.add_argument("--field", default="password",
+                     choices=["password", "username", "notes", "created", "modified"])
+    get.add_argument("--json", action="store_true", help="print the whole entry as JSON")
+    get.set_defaults(run=command_get)
+    
+    listing = commands.add_parser("list", help="list stored sites")
+    listing.add_argument("--json", action="store_true", help="print a JSON array")
+    listing.set_defaults(run=command_list)
+    
+    audit = commands.add_parser("audit", help="find reused, weak and old passwords")
+    audit.add_argument("--max-age", type=int, default=365, help="flag passwords older than this many days")
+    audit.add_argument("--min-score", type=int, default=3, choices=range(5),
+                       help="flag passwords scoring below this (0-4)")
+    audit.add_argument("--json", action="store_true", help="print the report as JSON")
+    audit.set_defaults(run=command_audit)
+    
+    generate = commands.add_parser("generate", help="generate passwords without storing them")
+    generate.add_argument("-n", "--count", type=int, default=1, help="number of passwords")
+    generate.add_argument("-l", "--length", type=int, default=12)
+    generate.add_argument("--no-uppercase", action="store_true")
+    generate.add_argument("--no-digits", action="store_true")
+    generate.add_argument("--no-symbols", action="store_true")
+    generate.add_argument("--exclude-ambiguous", action="store_true", help="leave out 0O1lI|")
+    generate.add_argument("-p", "--passphrase", action="store_true", help="generate word passphrases instead")
+    generate.add_argument("-w", "--words", type=int, default=6, help="words per passphrase")
+    generate.add_argument("--separator", default="-", help="text between passphrase words")
+    generate.add_argument("--capitalize", action="store_true", help="capitalize passphrase words")
+    generate.add_argument("--digits", type=int, default=0, help="digits to append to passphrase words")
+    generate.add_argument("--symbols", type=int, default=0, help="symbols to append to passphrase words")
+    generate.add_argument("--entropy", action="store_true", help="print the passphrase entropy to stderr")
+    generate.set_defaults(run=command_generate)
+    return parser
+
+def report_startup():
+    """Print the startup time to stderr when NOSWAG_TIMING is set"""
+    if not os.getenv("NOSWAG_TIMING"):
+        return
+    elapsed_ms = (time.perf_counter() - _STARTED) * 1000
+    status = "over budget" if elapsed_ms > STARTUP_BUDGET_MS else "ok"
+    print(f"noSwag startup: {elapsed_ms:.1f} ms (budget {STARTUP_BUDGET_MS} ms, {status})", file=sys.stderr)
+
 def main():
     """Entry point"""
+    if len(sys.argv) > 1:
+        parser = build_parser()
+        args = parser.parse_args()
+        if args.command is None:
+            parser.print_help()
+            return 0
+        if args.command != "generate":
+            load_environment()
+        report_startup()
+        try:
+            return args.run(args)
+        except (KeyboardInterrupt, BrokenPipeError):
+            return 1
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    
     try:
+        load_environment()
         app = noSwagPasswordManager()
         app.main_loop()
     except Exception as e:
         print(f"Fatal error: {e}")
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,72 @@
+# parallel_decrypt.py - decrypts many vault records on a thread pool, in order
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Records per task: big enough that scheduling costs little next to the
+# decryption, small enough that the first results arrive right away
+CHUNK_SIZE = 256
+
+_executors = {}  # thread count -> pool
+_executor_lock = threading.Lock()
+
+def decrypt_threads():
+    """Return the number of decryption threads (NOSWAG_DECRYPT_THREADS, else one per CPU)"""
+    try:
+        configured = int(os.getenv("NOSWAG_DECRYPT_THREADS", ""))
+    except ValueError:
+        configured = 0
+    # Unset, not a number or not positive: one thread per CPU
+    return configured if configured > 0 else min(os.cpu_count() or 1, 16)
+
+def threads_for(crypto):
+    """Return how many threads may decrypt with crypto; stand-ins such as the agent proxy allow one"""
+    return decrypt_threads() if getattr(crypto, "thread_safe", True) else 1
+
+def _pool(threads):
+    """Return the process-wide pool of that many threads, started on first use"""
+    with _executor_lock:
+        if threads not in _executors:
+            _executors[threads] = ThreadPoolExecutor(threads, thread_name_prefix="noswag-decrypt")
+        return _executors[threads]
+
+def _decrypt_chunk(decrypt, chunk):
+    return [decrypt(item) for item in chunk]
+
+def decrypt_ordered(decrypt, items, threads=None, chunk_size=CHUNK_SIZE):
+    """Yield decrypt(item) for every item of a list, in order, decrypting chunks ahead on a thread pool"""
+    threads = decrypt_threads() if threads is None else threads
+    if threads <= 1 or len(items) <= chunk_size:
+        for item in items:
+            yield decrypt(item)
+        return
+    chunks = (items[start:start + chunk_size] for start in range(0, len(items), chunk_size))
+    yield from decrypt_chunks(decrypt, chunks, threads)
+
+def decrypt_chunks(decrypt, chunks, threads=None):
+    """Yield decrypt(item) for every item of an iterable of lists, such as database cursor batches"""
+    # cryptography releases the GIL while it checks the HMAC and runs AES,
+    # so chunks decrypted side by side use more than one core
+    threads = decrypt_threads() if threads is None else threads
+    if threads <= 1:
+        for chunk in chunks:
+            for item in chunk:
+                yield decrypt(item)
+        return
+
+    pool = _pool(threads)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.submit(_decrypt_chunk, decrypt, chunk))
+            # A couple of chunks in flight per thread keeps every core busy
+            # without reading and decrypting a large vault far ahead of the reader
+            if len(pending) > 2 * threads:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # The reader stopped early or a record failed: drop the work not started yet
+        for future in pending:
+            future.cancel()
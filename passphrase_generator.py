@@ -0,0 +1,94 @@
+# passphrase_generator.py - diceware-style passphrases from the EFF large wordlist
+import math
+import os
+import secrets
+import sys
+
+# The EFF large wordlist (7776 words, one per line), by the Electronic
+# Frontier Foundation, licensed CC BY 3.0 US:
+# https://www.eff.org/deeplinks/2016/07/new-wordlists-random-passphrases
+WORDLIST_FILE = "eff_large_wordlist.txt"
+
+# Injected symbols never include '-', which appears inside a few words
+INJECT_DIGITS = "0123456789"
+INJECT_SYMBOLS = "!@#$%^&*+=?"
+
+# Random 16-bit values are drawn from os.urandom in blocks of this many bytes
+ENTROPY_BLOCK = 16384
+
+_wordlists = {}  # path -> list of words, loaded once per process
+
+def wordlist_path():
+    """Return the bundled wordlist path (next to this module, or inside the executable)"""
+    base = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, WORDLIST_FILE)
+
+def load_wordlist(path=None):
+    """Read a wordlist the first time it is needed and keep it for the process"""
+    path = path or wordlist_path()
+    words = _wordlists.get(path)
+    if words is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            words = f.read().split()
+        if len(set(words)) != len(words):
+            raise ValueError(f"Wordlist has duplicate words: {path}")
+        _wordlists[path] = words
+    return words
+
+def _random_indices(bound, block=ENTROPY_BLOCK):
+    """Yield unbiased random integers below bound (at most 65536) from large urandom blocks"""
+    limit = 65536 - 65536 % bound
+    while True:
+        for value in memoryview(os.urandom(block)).cast("H"):
+            if value < limit:
+                yield value % bound
+
+class PassphraseGenerator:
+    def __init__(self, path=None):
+        self.path = path
+
+    @property
+    def words(self):
+        return load_wordlist(self.path)
+
+    def entropy_bits(self, num_words=6, digits=0, symbols=0):
+        """Return the exact entropy in bits of passphrases made with these settings (non-empty separator)"""
+        self._check(num_words, digits, symbols)
+        injected = digits + symbols
+        bits = num_words * math.log2(len(self.words))
+        # Which words carry an injected character, which of those are digits,
+        # and the characters themselves
+        bits += math.log2(math.comb(num_words, injected)) + math.log2(math.comb(injected, digits))
+        bits += digits * math.log2(len(INJECT_DIGITS)) + symbols * math.log2(len(INJECT_SYMBOLS))
+        return bits
+
+    def _check(self, num_words, digits, symbols):
+        if num_words < 1:
+            raise ValueError("A passphrase needs at least one word")
+        if digits < 0 or symbols < 0 or digits + symbols > num_words:
+            raise ValueError("Digits plus symbols cannot exceed the number of words")
+
+    def generate(self, num_words=6, separator="-", capitalize=False, digits=0, symbols=0):
+        """Generate one passphrase"""
+        return next(self.generate_many(1, num_words, separator, capitalize, digits, symbols))
+
+    def generate_many(self, n, num_words=6, separator="-", capitalize=False, digits=0, symbols=0):
+        """Yield n passphrases; digits and symbols are each appended to a different word"""
+        self._check(num_words, digits, symbols)
+        words = self.words
+        indices = _random_indices(len(words), min(ENTROPY_BLOCK, max(64, 4 * n * num_words)))
+        picker = secrets.SystemRandom()
+
+        for _ in range(n):
+            selected = [words[next(indices)] for _ in range(num_words)]
+            if capitalize:
+                selected = [word.capitalize() for word in selected]
+
+            # At most one injected character per word keeps the entropy exact
+            extras = ([secrets.choice(INJECT_DIGITS) for _ in range(digits)] +
+                      [secrets.choice(INJECT_SYMBOLS) for _ in range(symbols)])
+            picker.shuffle(extras)
+            for position, extra in zip(sorted(picker.sample(range(num_words), len(extras))), extras):
+                selected[position] += extra
+
+            yield separator.join(selected)
@@ -1,6 +1,12 @@
 # password_generator.py - secure password generation utilities
-import secrets
+import os
 import string
+from passphrase_generator import PassphraseGenerator
+
+AMBIGUOUS = "0O1lI|"
+
+# Random bytes are drawn from os.urandom in blocks of up to this size
+ENTROPY_BLOCK = 65536
 
 class PasswordGenerator:
     def __init__(self):
@@ -8,117 +14,93 @@ class PasswordGenerator:
         self.uppercase = string.ascii_uppercase
         self.digits = string.digits
         self.symbols = "!@#$%^&*()_+-=[]{}|;:,.<>?"
+
+    def _character_classes(self, use_uppercase, use_digits, use_symbols, exclude_ambiguous):
+        """Return the enabled character classes"""
+        classes = [self.lowercase]
+        if use_uppercase:
+            classes.append(self.uppercase)
+        if use_digits:
+            classes.append(self.digits)
+        if use_symbols:
+            classes.append(self.symbols)
+        
+        if exclude_ambiguous:
+            # Remove potentially ambiguous characters
+            classes = [''.join(c for c in chars if c not in AMBIGUOUS) for chars in classes]
+        return classes
         
     def generate_password(self, length=12, use_uppercase=True, use_digits=True, 
                          use_symbols=True, exclude_ambiguous=False):
         """Generate a secure random password"""
+        return next(self.generate_many(1, length, use_uppercase, use_digits, use_symbols, exclude_ambiguous))
+
+    def generate_many(self, n, length=12, use_uppercase=True, use_digits=True,
+                      use_symbols=True, exclude_ambiguous=False):
+        """Yield n secure random passwords, drawing randomness in large blocks"""
         if length < 4:
             raise ValueError("Password length must be at least 4 characters")
-            
-        character_set = self.lowercase
-        
-        if use_uppercase:
-            character_set += self.uppercase
-        if use_digits:
-            character_set += self.digits
-        if use_symbols:
-            character_set += self.symbols
-            
-        if exclude_ambiguous:
-            # Remove potentially ambiguous characters
-            ambiguous = "0O1lI|"
-            character_set = ''.join(c for c in character_set if c not in ambiguous)
         
-        # Ensure password contains at least one character from each enabled set
-        password = []
+        classes = [chars.encode() for chars in
+                   self._character_classes(use_uppercase, use_digits, use_symbols, exclude_ambiguous)]
+        alphabet = b"".join(classes)
         
-        # Add one character from each enabled set
-        password.append(secrets.choice(self.lowercase))
-        if use_uppercase:
-            password.append(secrets.choice(self.uppercase))
-        if use_digits:
-            password.append(secrets.choice(self.digits))
-        if use_symbols:
-            password.append(secrets.choice(self.symbols))
-            
-        # Fill the rest with random characters from the full set
-        for _ in range(length - len(password)):
-            password.append(secrets.choice(character_set))
-            
-        # Shuffle the password to avoid predictable patterns
-        secrets.SystemRandom().shuffle(password)
+        # Map random bytes onto the alphabet without modulo bias: bytes
+        # at or above the largest multiple of the alphabet size are dropped
+        limit = 256 - 256 % len(alphabet)
+        table = bytes(alphabet[b % len(alphabet)] if b < limit else 0 for b in range(256))
+        rejected = bytes(range(limit, 256))
+        block = min(ENTROPY_BLOCK, max(256, 2 * n * length))
         
-        return ''.join(password)
+        produced = 0
+        pending = b""
+        while produced < n:
+            pending += os.urandom(block).translate(table, rejected)
+            usable = len(pending) - len(pending) % length
+            for start in range(0, usable, length):
+                candidate = pending[start:start + length]
+                # Ensure password contains at least one character from each
+                # enabled set; redrawing keeps every such password equally likely
+                if all(len(candidate.translate(None, chars)) < length for chars in classes):
+                    yield candidate.decode()
+                    produced += 1
+                    if produced == n:
+                        return
+            pending = pending[usable:]
     
     def generate_passphrase(self, num_words=4, separator="-", capitalize=False):
-        """Generate a passphrase using random words"""
-        # Simple word list for demonstration
-        words = [
-            "apple", "beach", "chair", "dream", "eagle", "flame", "grape", "house",
-            "ocean", "piano", "queen", "river", "storm", "tiger", "umbrella", "violet",
-            "whale", "zebra", "brave", "calm", "dance", "earth", "forest", "golden",
-            "happy", "island", "jungle", "knight", "light", "magic", "nature", "peace",
-            "quick", "royal", "shine", "trust", "unity", "victory", "wisdom", "youth"
-        ]
-        
-        selected_words = [secrets.choice(words) for _ in range(num_words)]
-        
-        if capitalize:
-            selected_words = [word.capitalize() for word in selected_words]
-            
-        return separator.join(selected_words)
+        """Generate a passphrase from the EFF large wordlist (about 12.9 bits per word)"""
+        return PassphraseGenerator().generate(num_words, separator, capitalize)
     
-    def check_password_strength(self, password):
-        """Analyze password strength"""
-        score = 0
-        feedback = []
-        
-        if len(password) >= 12:
-            score += 2
-        elif len(password) >= 8:
-            score += 1
-        else:
-            feedback.append("Use at least 8 characters (12+ recommended)")
-            
-        if any(c in self.lowercase for c in password):
-            score += 1
-        else:
-            feedback.append("Include lowercase letters")
-            
-        if any(c in self.uppercase for c in password):
-            score += 1
-        else:
-            feedback.append("Include uppercase letters")
-            
-        if any(c in self.digits for c in password):
-            score += 1
-        else:
-            feedback.append("Include numbers")
-            
-        if any(c in self.symbols for c in password):
-            score += 1
-        else:
-            feedback.append("Include special characters")
-            
-        # Check for common patterns
-        if password.lower() in ["password", "123456", "qwerty", "admin"]:
+    def check_password_strength(self, password, user_inputs=(), breach_count=None):
+        """Analyze password strength from the guesses an attacker would need (see strength_estimator)"""
+        from strength_estimator import estimate
+        result = estimate(password, user_inputs)
+        score = result["score"]
+        feedback = result["feedback"]
+
+        # A password from a breach list is tried first, however random it looks
+        if breach_count is None:
+            from breach_corpus import default_corpus
+            corpus = default_corpus()
+            breach_count = corpus.count(password) if corpus is not None and password else 0
+        if breach_count:
             score = 0
-            feedback.append("Avoid common passwords")
-            
+            feedback = [f"This password appeared in {breach_count:,} data breaches; never use it"] + feedback
+
         strength_levels = {
             0: "Very Weak",
-            1: "Weak", 
-            2: "Weak",
-            3: "Fair",
-            4: "Good",
-            5: "Strong",
-            6: "Very Strong"
+            1: "Weak",
+            2: "Fair",
+            3: "Strong",
+            4: "Very Strong"
         }
-        
-        strength = strength_levels.get(score, "Very Weak")
-        
+
         return {
             "score": score,
-            "strength": strength,
-            "feedback": feedback
-        }
\ No newline at end of file
+            "strength": strength_levels[score],
+            "feedback": feedback,
+            "guesses": result["guesses"],
+            "entropy": result["entropy"],
+            "breached": breach_count
+        }
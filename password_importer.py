@@ -0,0 +1,149 @@
+# password_importer.py - streams entries exported by other password managers
+import csv
+import json
+import os
+from urllib.parse import urlparse
+
+# Column names used by common exports (Bitwarden, LastPass, 1Password,
+# KeePass/KeePassXC, Chrome/Edge/Brave, Firefox and noSwag's own CSV)
+FIELD_ALIASES = {
+    "site": ["site", "name", "title", "account"],
+    "url": ["url", "login_uri", "website", "web site", "uri"],
+    "username": ["username", "login_username", "user name", "login", "email"],
+    "password": ["password", "login_password"],
+    "notes": ["notes", "note", "extra", "comments"],
+}
+
+class PasswordImporter:
+    def __init__(self):
+        self.skipped = 0
+        self.breached = {}  # site -> breach count, for imported passwords in the breach corpus
+
+    def _site_from_url(self, url):
+        """Use the host name of a URL as the site name"""
+        try:
+            host = urlparse(url if "://" in url else f"//{url}").hostname
+        except ValueError:
+            return None  # Malformed, such as an unclosed IPv6 bracket
+        return host[4:] if host and host.startswith("www.") else host
+
+    def _text(self, value):
+        """Return a field value as text; numbers are converted, anything else is unusable"""
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return None
+
+    def _normalize(self, fields):
+        """Map one exported record onto noSwag's fields; None if unusable"""
+        # Exports are hand-edited now and then: nulls, numbers and nested
+        # values must not stop the import halfway
+        fields = {field: self._text(value) for field, value in fields.items()}
+        site = fields.get("site") or self._site_from_url(fields.get("url") or "")
+        password = fields.get("password")
+        if not site or not password:
+            self.skipped += 1
+            return None
+        return {
+            "site": site.strip(),
+            "username": (fields.get("username") or "").strip(),
+            "password": password,
+            "notes": (fields.get("notes") or "").strip()
+        }
+
+    def _pick(self, record, columns):
+        """Resolve alias columns of one record to noSwag field names"""
+        return {field: record.get(column) for field, column in columns.items()}
+
+    def _iter_csv(self, path):
+        """Stream rows of a CSV export one at a time"""
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            header = {name.strip().lower(): name for name in reader.fieldnames or []}
+            columns = {}
+            for field, aliases in FIELD_ALIASES.items():
+                for alias in aliases:
+                    if alias in header:
+                        columns[field] = header[alias]
+                        break
+            if "password" not in columns:
+                raise ValueError("Unrecognized CSV export: no password column found.")
+
+            for row in reader:
+                entry = self._normalize(self._pick(row, columns))
+                if entry is not None:
+                    yield entry
+
+    def _iter_json(self, path):
+        """Read a JSON export (Bitwarden items or a plain list of records)"""
+        # The json module cannot stream, so only the parsed document is held
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            document = json.load(f)
+
+        if isinstance(document, dict) and "items" in document:
+            items = document["items"] if isinstance(document["items"], list) else []
+            for item in items:
+                if not isinstance(item, dict):
+                    self.skipped += 1
+                    continue
+                login = item.get("login") if isinstance(item.get("login"), dict) else {}
+                uris = login.get("uris") if isinstance(login.get("uris"), list) else []
+                uri = uris[0] if uris and isinstance(uris[0], dict) else {}
+                entry = self._normalize({
+                    "site": item.get("name"),
+                    "url": uri.get("uri"),
+                    "username": login.get("username"),
+                    "password": login.get("password"),
+                    "notes": item.get("notes")
+                })
+                if entry is not None:
+                    yield entry
+            return
+
+        records = document.get("passwords") or [] if isinstance(document, dict) else document
+        if isinstance(records, dict):
+            # Some exports key the records by site name instead of listing them
+            records = list(records.items())
+        elif isinstance(records, list):
+            records = [(None, record) for record in records]
+        else:
+            raise ValueError("Unrecognized JSON export: no list of password records found.")
+
+        for name, record in records:
+            if not isinstance(record, dict):
+                self.skipped += 1
+                continue
+            lowered = {key.lower(): value for key, value in record.items()}
+            fields = {}
+            for field, aliases in FIELD_ALIASES.items():
+                fields[field] = next((lowered[a] for a in aliases if lowered.get(a)), None)
+            if not fields["site"]:
+                fields["site"] = name
+            entry = self._normalize(fields)
+            if entry is not None:
+                yield entry
+
+    def iter_entries(self, path, fmt=None):
+        """Yield importable entries from a CSV or JSON export, one at a time"""
+        fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt == "csv":
+            entries = self._iter_csv(path)
+        elif fmt == "json":
+            entries = self._iter_json(path)
+        else:
+            raise ValueError(f"Unsupported import format: {fmt}")
+
+        # Keep same-named accounts apart instead of overwriting one another
+        seen = set()
+        for entry in entries:
+            if entry["site"] in seen and entry["username"]:
+                entry["site"] = f"{entry['site']} ({entry['username']})"
+            seen.add(entry["site"])
+            yield entry
+
+    def import_file(self, storage, path, fmt=None):
+        """Import an export file into storage with one batched write"""
+        self.skipped = 0
+        self.breached = {}
+        return storage.save_passwords(self.iter_entries(path, fmt), self.breached)
@@ -0,0 +1,276 @@
+# sqlite_storage.py - SQLite vault backend with one encrypted row per site
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from storage_backend import FLUSH_DELAY, StorageBackend
+from parallel_decrypt import CHUNK_SIZE, decrypt_chunks, threads_for
+
+# Known plaintext used to check the master password
+CHECK_VALUE = "noSwag"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    site_index TEXT PRIMARY KEY,
+    token BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+class SQLiteStorageManager(StorageBackend):
+    def __init__(self, file_path="data.db"):
+        self.file_path = file_path
+        self.crypto = None
+        self._conn = None
+        self._pending_user = {}
+        self._flush_timer = None
+        self._flush_lock = threading.Lock()
+
+    def _connect(self):
+        """Open the database in WAL mode so readers don't block the writer"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.file_path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _get_meta(self, key, conn=None):
+        """Read a JSON value from the meta table"""
+        row = (conn or self._connect()).execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, key, value, conn=None):
+        """Write a JSON value to the meta table"""
+        (conn or self._connect()).execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, json.dumps(value))
+        )
+
+    def _require_crypto(self):
+        if self.crypto is None:
+            raise ValueError("Storage not initialized. Load user data first.")
+
+    def _encrypt_record(self, site, entry):
+        """Encrypt a single site entry into a record token"""
+        return self.crypto.encrypt(json.dumps(dict(entry, site=site)))
+
+    def _decrypt_record(self, token):
+        """Decrypt a record token into (site, entry)"""
+        entry = json.loads(self.crypto.decrypt(token))
+        site = entry.pop("site")
+        return site, entry
+
+    def initialize_new_user(self, email, master_password, kdf=None):
+        """Initialize storage for a new user"""
+        self.crypto = self._new_crypto(master_password, kdf)
+        
+        # Create directory if it doesn't exist
+        if os.path.dirname(self.file_path):
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM records")
+            metadata = {
+                "version": "2.0",
+                "created": datetime.now().isoformat(),
+                "check": self.crypto.encrypt(CHECK_VALUE).decode()
+            }
+            metadata.update(self._key_metadata(self.crypto))
+            self._set_meta("metadata", metadata)
+            self._set_meta("user", {
+                "email": email,
+                "verified": True,
+                "last_login": datetime.now().isoformat()
+            })
+        
+        return True
+
+    def load_user_data(self, master_password, rehash=True):
+        """Derive the vault key from the master password and unlock the vault"""
+        if not self.user_exists():
+            return None
+        
+        try:
+            crypto = self._crypto_from_metadata(self.read_key_metadata(), master_password)
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            return None
+        
+        user_data = self.unlock_with(crypto)
+        if user_data is not None and rehash:
+            self._maybe_rehash(master_password)
+        return user_data
+
+    def read_key_metadata(self):
+        """Return the vault metadata needed to derive its key (salt, KDF, wrapped key)"""
+        return self._get_meta("metadata")
+
+    def unlock_with(self, crypto, read_only=False):
+        """Unlock the vault with an already derived key; entries are decrypted on demand"""
+        if not self.user_exists():
+            return None
+        
+        try:
+            metadata = self._get_meta("metadata")
+            user = self._get_meta("user")
+            
+            # Fails with InvalidToken on a wrong master password
+            crypto.decrypt(metadata["check"])
+            self.crypto = crypto
+            
+            if not read_only:
+                # Written at close, so unlocking alone never writes the database
+                user["last_login"] = datetime.now().isoformat()
+                self._defer_user_update(last_login=user["last_login"])
+            
+            return {
+                "user": user
+            }
+            
+        except Exception as e:
+            self.crypto = None
+            print(f"Error loading data: {e}")
+            return None
+
+    def save_password(self, site, username, password, notes=""):
+        """Add or update a password entry"""
+        self._require_crypto()
+        
+        token = self._encrypt_record(site, self._new_entry(username, password, notes))
+        
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO records (site_index, token) VALUES (?, ?)",
+                (self.crypto.blind_index(site), token)
+            )
+        return True
+
+    def apply_changes(self, changes):
+        """Apply {site: entry or None} in a single SQLite transaction"""
+        self._require_crypto()
+        
+        puts = []
+        deletes = []
+        for site, entry in changes.items():
+            if entry is None:
+                deletes.append((self.crypto.blind_index(site),))
+            else:
+                puts.append((self.crypto.blind_index(site), self._encrypt_record(site, entry)))
+        
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO records (site_index, token) VALUES (?, ?)", puts)
+            conn.executemany("DELETE FROM records WHERE site_index = ?", deletes)
+        return True
+
+    def get_password(self, site):
+        """Retrieve a password entry with a single indexed lookup"""
+        self._require_crypto()
+        
+        row = self._connect().execute(
+            "SELECT token FROM records WHERE site_index = ?",
+            (self.crypto.blind_index(site),)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._decrypt_record(row[0])[1]
+
+    def list_sites(self):
+        """List all stored sites"""
+        self._require_crypto()
+        
+        return [site for site, _ in self.iter_entries()]
+
+    def iter_entries(self):
+        """Yield (site, entry) for every row, decrypting chunks of rows on a thread pool"""
+        self._require_crypto()
+        cursor = self._connect().execute("SELECT token FROM records")
+        
+        def batches():
+            # Rows are fetched a chunk at a time, only as fast as they are decrypted,
+            # so memory stays bounded however large the vault is
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    return
+                yield [token for (token,) in rows]
+        
+        yield from decrypt_chunks(self._decrypt_record, batches(), threads_for(self.crypto))
+
+    def delete_password(self, site):
+        """Delete a password entry"""
+        self._require_crypto()
+        
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM records WHERE site_index = ?",
+                (self.crypto.blind_index(site),)
+            )
+        return cursor.rowcount > 0
+
+    def change_master_password(self, master_password, kdf=None):
+        """Re-wrap the data key under a new master password and/or KDF parameters"""
+        self._require_crypto()
+        self.crypto.set_master_password(master_password, kdf)
+        
+        with self._connect():
+            metadata = self._get_meta("metadata")
+            metadata.pop("iterations", None)
+            metadata.update(self._key_metadata(self.crypto))
+            self._set_meta("metadata", metadata)
+        return True
+
+    def user_exists(self):
+        """Check if the database holds a vault"""
+        if not os.path.exists(self.file_path):
+            return False
+        return self._get_meta("user") is not None
+
+    def get_user_email(self):
+        """Get user email from storage"""
+        if not self.user_exists():
+            return None
+        return self._get_meta("user")["email"]
+
+    def _defer_user_update(self, **fields):
+        """Buffer user metadata changes and flush them once the session idles"""
+        with self._flush_lock:
+            self._pending_user.update(fields)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(FLUSH_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """Write buffered user metadata changes in one transaction"""
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending_user or self._conn is None:
+                return False
+            
+            # The idle flush runs on the timer's thread, and a connection may
+            # only be used by the thread that opened it, so it gets its own
+            conn = sqlite3.connect(self.file_path, timeout=30)
+            try:
+                with conn:
+                    user = self._get_meta("user", conn)
+                    user.update(self._pending_user)
+                    self._set_meta("user", user, conn)
+            finally:
+                conn.close()
+            self._pending_user = {}
+            return True
+
+    def close(self):
+        """Flush buffered metadata and close the database connection"""
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
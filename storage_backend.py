@@ -0,0 +1,263 @@
+# storage_backend.py - common interface for vault storage backends
+import os
+import csv
+from datetime import datetime
+from crypto_manager import (
+    CryptoManager, calibrate_kdf, crypto_from_metadata, describe_kdf, kdf_is_weaker, DEFAULT_TARGET_MS
+)
+
+from breach_corpus import breached_sites
+from vault_backup import VaultBackup, DEFAULT_CHUNK_SIZE
+from vault_audit import VaultAudit, DEFAULT_MAX_AGE_DAYS, DEFAULT_MIN_SCORE
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# Column order of plaintext CSV exports (readable by password_importer)
+CSV_FIELDS = ["site", "username", "password", "notes", "created", "modified"]
+
+# Seconds buffered user metadata (last login time) may wait before it is
+# flushed, so a crash loses at most that much of it
+FLUSH_DELAY = 60
+
+class VaultTransaction:
+    """Puts and deletes buffered in memory and applied together on exit"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.changes = {}  # site -> new entry, or None to delete
+        self.breached = {}  # site -> breach count of the passwords written
+
+    def save_password(self, site, username, password, notes=""):
+        self.changes[site] = self.storage._new_entry(username, password, notes)
+
+    def put_entry(self, site, entry):
+        """Store an entry as-is, keeping its timestamps (used by restore)"""
+        self.changes[site] = entry
+
+    def delete_password(self, site):
+        self.changes[site] = None
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Nothing is written if the block raised
+        if exc_type is None and self.changes:
+            self.storage.apply_changes(self.changes)
+            # Every batched write path (import, restore) reports breached
+            # passwords the same way, from one sorted pass over the corpus
+            self.breached = breached_sites((site, entry.get("password")) for site, entry in self.changes.items()
+                                           if entry is not None)
+        return False
+
+class StorageBackend:
+    """Operations every vault storage backend provides"""
+
+    def initialize_new_user(self, email, master_password, kdf=None):
+        """Initialize storage for a new user; kdf defaults to parameters calibrated on this machine"""
+        raise NotImplementedError
+
+    def load_user_data(self, master_password, rehash=True):
+        """Unlock the vault; return {"user": ...} or None on failure.
+        With rehash, an outdated key wrapping is strengthened, rewriting the vault."""
+        raise NotImplementedError
+
+    def unlock_with(self, crypto, read_only=False):
+        """Unlock the vault with an already derived key (CryptoManager or agent proxy).
+        A read_only unlock changes nothing on disk, not even the last login time."""
+        raise NotImplementedError
+
+    def save_password(self, site, username, password, notes=""):
+        """Add or update a password entry"""
+        raise NotImplementedError
+
+    def get_password(self, site):
+        """Retrieve a password entry, or None if the site is unknown"""
+        raise NotImplementedError
+
+    def list_sites(self):
+        """List all stored sites"""
+        raise NotImplementedError
+
+    def delete_password(self, site):
+        """Delete a password entry; return False if the site is unknown"""
+        raise NotImplementedError
+
+    def apply_changes(self, changes):
+        """Apply {site: entry or None} with a single encrypt-and-write pass"""
+        raise NotImplementedError
+
+    def transaction(self):
+        """Return a context manager that batches saves and deletes"""
+        return VaultTransaction(self)
+
+    def save_passwords(self, entries, breached=None):
+        """Add or update many entries (dicts with site, username, password, notes) in one write;
+        sites whose password is in the breach corpus are added to the breached dict, if given"""
+        with self.transaction() as txn:
+            for entry in entries:
+                txn.save_password(entry["site"], entry["username"], entry["password"], entry.get("notes", ""))
+        if breached is not None:
+            breached.update(txn.breached)
+        return len(txn)
+
+    def iter_entries(self):
+        """Yield (site, entry) for every entry, decrypting one record at a time"""
+        raise NotImplementedError
+
+    def export_backup(self, path, password, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Stream all entries into an encrypted, chunked backup file"""
+        return VaultBackup(password, chunk_size).write(path, self.iter_entries())
+
+    def restore_backup(self, path, password, breached=None):
+        """Stream a backup into the vault with one batched write per chunk; breached is filled
+        like save_passwords does"""
+        # Memory stays bounded by the chunk size; a damaged backup is
+        # reported at the first bad chunk, after earlier chunks are applied
+        count = 0
+        for chunk in VaultBackup(password).read_chunks(path):
+            with self.transaction() as txn:
+                for site, entry in chunk:
+                    txn.put_entry(site, entry)
+            if breached is not None:
+                breached.update(txn.breached)
+            count += len(chunk)
+        return count
+
+    def export_csv(self, path):
+        """Stream all entries into a plaintext CSV file readable only by the owner"""
+        count = 0
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            for site, entry in self.iter_entries():
+                writer.writerow([site] + [entry.get(field, "") for field in CSV_FIELDS[1:]])
+                count += 1
+        return count
+
+    def audit(self, max_age_days=DEFAULT_MAX_AGE_DAYS, min_score=DEFAULT_MIN_SCORE):
+        """Report reused, weak and old passwords from one pass over the entries"""
+        return VaultAudit(self, max_age_days, min_score).run()
+
+    def _sidecar_path(self, suffix):
+        """Return the path of a file kept next to the vault (data.log, data.nsv.log)"""
+        base, ext = os.path.splitext(self.file_path)
+        # Only data.json drops its extension, so a converted data.nsv
+        # never shares a log with the data.json it came from
+        return base + suffix if ext.lower() == ".json" else self.file_path + suffix
+
+    def _defer_user_update(self, **fields):
+        """Buffer user metadata changes (such as last_login) until the next flush"""
+        self._pending_user.update(fields)
+
+    def flush(self):
+        """Write buffered user metadata changes; return True if anything was written"""
+        raise NotImplementedError
+
+    def _new_entry(self, username, password, notes=""):
+        """Build the stored form of a password entry"""
+        return {
+            "username": username,
+            "password": password,
+            "notes": notes,
+            "created": datetime.now().isoformat(),
+            "modified": datetime.now().isoformat()
+        }
+
+    def read_key_metadata(self):
+        """Return the vault metadata needed to derive its key (salt, KDF, wrapped key)"""
+        raise NotImplementedError
+
+    def user_exists(self):
+        """Check if a vault exists at this location"""
+        raise NotImplementedError
+
+    def get_user_email(self):
+        """Get user email without unlocking the vault"""
+        raise NotImplementedError
+
+    def change_master_password(self, master_password, kdf=None):
+        """Re-wrap the data key under a new master password and/or KDF parameters"""
+        raise NotImplementedError
+
+    def _kdf_preferences(self):
+        """Return the preferred KDF algorithm and unlock latency target (ms)"""
+        algorithm = os.getenv("NOSWAG_KDF", "pbkdf2-sha256")
+        target_ms = int(os.getenv("NOSWAG_KDF_TARGET_MS", DEFAULT_TARGET_MS))
+        return algorithm, target_ms
+
+    def _new_crypto(self, master_password, kdf=None):
+        """Create a random data key wrapped under the given or freshly calibrated KDF parameters"""
+        crypto = CryptoManager(kdf=kdf or calibrate_kdf(*self._kdf_preferences()))
+        crypto.set_master_password(master_password)
+        return crypto
+
+    def _crypto_from_metadata(self, metadata, master_password):
+        """Derive the password key and unwrap the data key described by metadata"""
+        return crypto_from_metadata(metadata, master_password)
+
+    def _key_metadata(self, crypto):
+        """Return the metadata fields that describe how the data key is wrapped"""
+        return {
+            "salt": crypto.get_salt_b64(),
+            "kdf": dict(crypto.kdf),
+            "wrapped_key": crypto.wrapped_key.decode()
+        }
+
+    def _maybe_rehash(self, master_password):
+        """Re-wrap the data key once this machine outgrows the KDF parameters"""
+        algorithm, target_ms = self._kdf_preferences()
+        crypto = self.crypto
+        if crypto.derive_seconds is None:
+            return False
+        outdated = crypto.kdf["algorithm"] != algorithm or crypto.derive_seconds * 1000 < target_ms / 2
+        # Vaults from before envelope encryption get their key wrapped too
+        if not outdated and crypto.wrapped_key is not None:
+            return False
+        
+        try:
+            kdf = None
+            if outdated:
+                calibrated = calibrate_kdf(algorithm, target_ms)
+                if kdf_is_weaker(crypto.kdf, calibrated):
+                    kdf = calibrated
+            if kdf is None and crypto.wrapped_key is not None:
+                return False
+            self.change_master_password(master_password, kdf)
+            if kdf is not None:
+                print(f"Key derivation strengthened to {describe_kdf(kdf)}.")
+            return True
+        except Exception as e:
+            print(f"Could not strengthen key derivation: {e}")
+            return False
+
+    def needs_upgrade(self):
+        """Check whether the vault uses an outdated format"""
+        return False
+
+    def upgrade_vault(self):
+        """Convert the vault to the current format in place"""
+        return False
+
+    def close(self):
+        """Release files, connections and background work"""
+        pass
+
+def open_storage(file_path="data.json"):
+    """Return the storage backend for a vault path, sniffing existing files"""
+    is_sqlite = file_path.lower().endswith(SQLITE_EXTENSIONS)
+    if os.path.exists(file_path):
+        with open(file_path, 'rb') as f:
+            is_sqlite = f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    
+    if is_sqlite:
+        from sqlite_storage import SQLiteStorageManager
+        return SQLiteStorageManager(file_path)
+    
+    from storage_manager import StorageManager
+    return StorageManager(file_path)
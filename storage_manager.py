@@ -2,162 +2,585 @@
 import json
 import os
 import base64
+import threading
 from datetime import datetime
-from crypto_manager import CryptoManager
+from storage_backend import FLUSH_DELAY, StorageBackend
+from vault_log import VaultLog, OP_PUT, OP_DELETE
+from vault_container import is_container, read_container, encode_container, token_of
+from vault_file import atomic_write, VaultFileLock
+from parallel_decrypt import decrypt_ordered, threads_for
 
-class StorageManager:
+# On-disk formats: 1.0 keeps the whole vault in one ciphertext blob,
+# 2.0 stores every site as its own Fernet token
+LEGACY_VERSION = "1.0"
+VAULT_VERSION = "2.0"
+
+# 2.0 records are keyed by a blind index (keyed hash) of the site name,
+# so a lookup finds its record without decrypting any other
+INDEX_SCHEME = "hmac-sha256"
+
+# Known plaintext used to check the master password on 2.0 vaults
+CHECK_VALUE = "noSwag"
+
+# 2.0 changes are appended to a log next to data.json; the log is folded
+# back into data.json once it holds more dead records than live ones
+COMPACT_MIN_DEAD = 64
+
+class StorageManager(StorageBackend):
     def __init__(self, file_path="data.json"):
         self.file_path = file_path
         self.crypto = None
+        self._log = None
+        self._lock = threading.RLock()
+        # Advisory lock shared with other noSwag processes: readers share
+        # it, writers (log appends and snapshot rewrites) hold it alone
+        self._file_lock = VaultFileLock(self._sidecar_path(".lock"))
+        self._compactor = None
+        # User metadata changes not yet written, and the timer that will
+        # flush them to the state file if the session stays open
+        self._pending_user = {}
+        self._flush_timer = None
+        # Live view of the vault, valid while the file stamp is unchanged:
+        # record tokens by id, and the records decrypted so far
+        self._data = None
+        self._records = None
+        self._decrypted = None
+        self._stamp = None
+        self._generation = 0
+        self._log_offset = 0
+        self._dead = 0
+
+    def _state_path(self):
+        """Return the path of the state file that buffers user metadata updates"""
+        return self._sidecar_path(".state")
+
+    def _read_state(self):
+        """Read user metadata updates flushed to the state file but not yet to the vault"""
+        try:
+            with open(self._state_path(), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _log_path(self):
+        """Return the path of the record log that belongs to this vault"""
+        return self._sidecar_path(".log")
+
+    def _open_log(self):
+        """Attach the record log once the vault key is known"""
+        self._log = VaultLog(self._log_path(), self.crypto.derive_subkey("noswag-vault-log"))
+
+    def _file_stamp(self):
+        """Return a cheap fingerprint of the vault file (inode, size, mtime)"""
+        st = os.stat(self.file_path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _read_data(self):
+        """Read the raw vault document from disk (JSON or binary container)"""
+        if is_container(self.file_path):
+            return read_container(self.file_path)
+        with open(self.file_path, 'r') as f:
+            return json.load(f)
+
+    def _write_data(self, data):
+        """Atomically replace the vault document on disk, in the file's own format"""
+        if is_container(self.file_path):
+            atomic_write(self.file_path, encode_container(data))
+            return
+        if any(isinstance(record, bytes) for record in data.get("records", {}).values()):
+            data = dict(data, records={rid: token_of(r) for rid, r in data["records"].items()})
+        atomic_write(self.file_path, json.dumps(data, indent=2).encode())
+
+    def _is_legacy(self, data):
+        """Check whether a vault document uses the monolithic 1.0 format"""
+        return data["metadata"].get("version", LEGACY_VERSION) == LEGACY_VERSION
+
+    def _encrypt_record(self, site, entry):
+        """Encrypt a single site entry into a record token"""
+        record = dict(entry, site=site)
+        return self.crypto.encrypt(json.dumps(record)).decode()
+
+    def _decrypt_record(self, token):
+        """Decrypt a record (token, or raw ciphertext from a container) into (site, entry)"""
+        entry = json.loads(self.crypto.decrypt(token_of(token)))
+        site = entry.pop("site")
+        return site, entry
+
+    def _put_record(self, record_id, token, site=None, entry=None):
+        """Add or replace a record in the live view"""
+        if self._records.get(record_id) == token:
+            return  # Our own frame read back from the log
+        if record_id in self._records:
+            self._dead += 1
+        self._records[record_id] = token
+        if site is None:
+            self._decrypted.pop(record_id, None)
+        else:
+            self._decrypted[record_id] = (site, entry)
+
+    def _delete_record(self, record_id):
+        """Remove a record from the live view"""
+        self._dead += 1
+        if self._records.pop(record_id, None) is not None:
+            self._dead += 1
+        self._decrypted.pop(record_id, None)
+
+    def _replay_log(self, repair=False):
+        """Apply log records written since the last replay"""
+        offset = self._log_offset
+        for op, record_id, token, end in self._log.read(offset):
+            if op == OP_PUT:
+                self._put_record(record_id, token.decode())
+            elif op == OP_DELETE:
+                self._delete_record(record_id)
+            offset = end
+        
+        # Anything past the last intact record is a torn write from a crash
+        if repair and offset < self._log.size():
+            self._log.truncate(offset)
+        self._log_offset = offset
+
+    def _set_view(self, data, repair=False):
+        """Load a vault document and its log into the live view"""
+        self._data = data
+        self._records = {}
+        self._decrypted = {}
+        self._generation = data["metadata"].get("generation", 0)
+        self._log_offset = 0
+        self._dead = 0
+        
+        if self._is_legacy(data):
+            # 1.0 vaults can only be decrypted as a whole
+            encrypted_data = base64.b64decode(data["encrypted_data"])
+            passwords = json.loads(self.crypto.decrypt(encrypted_data))["passwords"]
+            for site, entry in passwords.items():
+                self._decrypted[self.crypto.blind_index(site)] = (site, entry)
+            return
+        
+        # Fails with InvalidToken on a wrong master password
+        self.crypto.decrypt(data["metadata"]["check"])
+        self._records.update(data["records"])
+        self._replay_log(repair)
+
+    def _refresh(self):
+        """Bring the live view up to date, re-reading only what changed on disk"""
+        if self.crypto is None:
+            raise ValueError("Storage not initialized. Load user data first.")
+
+        stamp = self._file_stamp()
+        if self._records is None or stamp != self._stamp:
+            self._set_view(self._read_data())
+            self._stamp = stamp
+        elif not self._is_legacy(self._data) and self._log.size() != self._log_offset:
+            if self._log.size() < self._log_offset:
+                self._set_view(self._data)
+            else:
+                self._replay_log()
+
+    def _lookup(self, site):
+        """Return the entry for site, decrypting only its own record"""
+        record_id = self.crypto.blind_index(site)
+        cached = self._decrypted.get(record_id)
+        if cached is None:
+            token = self._records.get(record_id)
+            if token is None:
+                return None
+            cached = self._decrypted[record_id] = self._decrypt_record(token)
+        return cached[1]
 
-    def initialize_new_user(self, email, master_password):
+    def _all_entries(self):
+        """Return (site, entry) for every record, decrypting those not seen yet"""
+        if self._is_legacy(self._data):
+            return list(self._decrypted.values())
+        missing = [(record_id, token) for record_id, token in self._records.items()
+                   if record_id not in self._decrypted]
+        pairs = decrypt_ordered(lambda item: self._decrypt_record(item[1]), missing,
+                                threads_for(self.crypto))
+        for (record_id, _), pair in zip(missing, pairs):
+            self._decrypted[record_id] = pair
+        return [self._decrypted[record_id] for record_id in self._records]
+
+    def _store_legacy(self):
+        """Re-encrypt the whole 1.0 blob from the live view and write it"""
+        passwords = dict(self._decrypted.values())
+        encrypted_data = self.crypto.encrypt(json.dumps({"passwords": passwords}))
+        self._data["encrypted_data"] = base64.b64encode(encrypted_data).decode()
+        self._commit()
+
+    def _commit(self, check_generation=True):
+        """Write the cached vault document as the next generation"""
+        try:
+            # Optimistic check against writers that bypassed the file lock
+            # (e.g. on systems without flock): never overwrite a newer snapshot
+            if check_generation and os.path.exists(self.file_path):
+                on_disk = self._read_data()["metadata"].get("generation", 0)
+                if on_disk != self._generation:
+                    raise ValueError("The vault was changed by another noSwag process; please try again.")
+            
+            # Buffered user metadata rides along with the snapshot
+            self._data["user"].update(self._read_state(), **self._pending_user)
+            self._data["metadata"]["generation"] = self._generation + 1
+            self._write_data(self._data)
+            self._generation += 1
+            self._stamp = self._file_stamp()
+            self._pending_user = {}
+            if os.path.exists(self._state_path()):
+                os.remove(self._state_path())
+        except Exception:
+            self.invalidate_cache()
+            raise
+
+    def _write_snapshot(self):
+        """Write all live records into data.json and empty the log"""
+        # Replaying the log over the new snapshot is idempotent,
+        # so a crash before the truncate loses nothing
+        self._data = dict(self._data, records=dict(self._records))
+        self._commit()
+        self._log.truncate(0)
+        self._log_offset = 0
+        self._dead = 0
+
+    def _reindex(self):
+        """Re-key records written with random ids under their blind index"""
+        newest = {}
+        for site, entry in self._all_entries():
+            current = newest.get(site)
+            if current is None or entry.get("modified", "") >= current.get("modified", ""):
+                newest[site] = entry
+        
+        self._records = {}
+        self._decrypted = {}
+        for site, entry in newest.items():
+            self._put_record(self.crypto.blind_index(site), self._encrypt_record(site, entry), site, entry)
+        self._data["metadata"]["index"] = INDEX_SCHEME
+        self._write_snapshot()
+
+    def _track_append(self, size):
+        """Skip our own just-appended frame on the next replay when possible"""
+        # If nobody else appended meanwhile, the frame ends exactly here
+        if self._log.size() == self._log_offset + size:
+            self._log_offset += size
+
+    def _append(self, op, record_id, token=b""):
+        """Append one operation to the log"""
+        self._track_append(self._log.append(op, record_id, token))
+
+    def _maybe_compact(self):
+        """Start a background compaction once dead log records pile up"""
+        if self._dead <= max(COMPACT_MIN_DEAD, len(self._records)):
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="noswag-compact")
+        self._compactor.start()
+
+    def compact(self):
+        """Fold the record log into data.json and empty the log"""
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            if self._is_legacy(self._data):
+                return False
+            self._write_snapshot()
+            return True
+
+    def convert(self, target_path):
+        """Copy the vault, log included, to target_path (.nsv container or JSON)"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            if self._is_legacy(self._data):
+                raise ValueError("Upgrade the vault to format 2.0 before converting it.")
+            
+            target = StorageManager(target_path)
+            target._write_data(dict(self._data, records=dict(self._records)))
+            return target
+
+    def _defer_user_update(self, **fields):
+        """Buffer user metadata changes and flush them once the session idles"""
+        with self._lock:
+            self._pending_user.update(fields)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(FLUSH_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """Write buffered user metadata to the state file instead of rewriting the vault"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending_user:
+                return False
+            
+            with self._file_lock.exclusive():
+                state = self._read_state()
+                state.update(self._pending_user)
+                atomic_write(self._state_path(), json.dumps(state).encode())
+            self._pending_user = {}
+            return True
+
+    def close(self):
+        """Flush buffered metadata, wait for any compaction and release the lock file"""
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        self.flush()
+        self._file_lock.close()
+
+    def invalidate_cache(self):
+        """Drop the live view so the next read goes back to disk"""
+        self._data = None
+        self._records = None
+        self._decrypted = None
+        self._stamp = None
+        self._generation = 0
+        self._log_offset = 0
+        self._dead = 0
+
+    def initialize_new_user(self, email, master_password, kdf=None):
         """Initialize storage for a new user"""
-        self.crypto = CryptoManager(master_password)
+        self.crypto = self._new_crypto(master_password, kdf)
+        self._open_log()
         
         # Create initial data structure
-        initial_passwords = {"passwords": {}}
-        encrypted_data = self.crypto.encrypt(json.dumps(initial_passwords))
-        
+        metadata = {
+            "version": VAULT_VERSION,
+            "created": datetime.now().isoformat(),
+            "index": INDEX_SCHEME,
+            "check": self.crypto.encrypt(CHECK_VALUE).decode()
+        }
+        metadata.update(self._key_metadata(self.crypto))
         data = {
-            "metadata": {
-                "version": "1.0",
-                "created": datetime.now().isoformat(),
-                "salt": self.crypto.get_salt_b64(),
-                "iterations": 100000
-            },
+            "metadata": metadata,
             "user": {
                 "email": email,
                 "verified": True,
                 "last_login": datetime.now().isoformat()
             },
-            "encrypted_data": base64.b64encode(encrypted_data).decode()
+            "records": {}
         }
         
         # Create directory if it doesn't exist
         if os.path.dirname(self.file_path):
             os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
         
-        with open(self.file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        with self._lock, self._file_lock.exclusive():
+            # Drop any log or state left behind by a previous vault at this path
+            self._log.truncate(0)
+            if os.path.exists(self._state_path()):
+                os.remove(self._state_path())
+            self._set_view(data)
+            self._commit(check_generation=False)
         
         return True
 
-    def load_user_data(self, master_password):
-        """Load and decrypt user data"""
+    def load_user_data(self, master_password, rehash=True):
+        """Derive the vault key from the master password and unlock the vault"""
+        if not os.path.exists(self.file_path):
+            return None
+        
+        try:
+            # Unwrap the data key with the stored salt and KDF parameters
+            crypto = self._crypto_from_metadata(self.read_key_metadata(), master_password)
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            return None
+        
+        user_data = self.unlock_with(crypto)
+        if user_data is not None and rehash:
+            self._maybe_rehash(master_password)
+        return user_data
+
+    def read_key_metadata(self):
+        """Return the vault metadata needed to derive its key (salt, KDF, wrapped key)"""
+        with self._file_lock.shared():
+            return self._read_data()["metadata"]
+
+    def unlock_with(self, crypto, read_only=False):
+        """Unlock the vault with an already derived key; entries are decrypted on demand"""
         if not os.path.exists(self.file_path):
             return None
             
         try:
-            with open(self.file_path, 'r') as f:
-                data = json.load(f)
+            # Read-only unlocks neither repair a torn log nor re-index, so a
+            # shared lock is enough and nothing on disk changes
+            file_lock = self._file_lock.shared() if read_only else self._file_lock.exclusive()
+            with self._lock, file_lock:
+                data = self._read_data()
+                self.crypto = crypto
+                self._open_log()
+                
+                self._set_view(data, repair=not read_only)
+                if read_only:
+                    return {"user": dict(data["user"])}
+                if not self._is_legacy(data) and data["metadata"].get("index") != INDEX_SCHEME:
+                    self._reindex()
+                
+                # Buffered rather than written, so unlocking alone never
+                # rewrites the vault; it is flushed at close or when idle
+                user = dict(data["user"], last_login=datetime.now().isoformat())
+                self._defer_user_update(last_login=user["last_login"])
+                
+                return {
+                    "user": user
+                }
             
-            # Initialize crypto with stored salt
-            salt = base64.b64decode(data["metadata"]["salt"])
-            self.crypto = CryptoManager(master_password, salt)
+        except Exception as e:
+            self.crypto = None
+            self.invalidate_cache()
+            print(f"Error loading data: {e}")
+            return None
+
+    def change_master_password(self, master_password, kdf=None):
+        """Re-wrap the data key under a new master password and/or KDF parameters"""
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            self.crypto.set_master_password(master_password, kdf)
             
-            # Decrypt password data
-            encrypted_data = base64.b64decode(data["encrypted_data"])
-            decrypted_json = self.crypto.decrypt(encrypted_data)
-            password_data = json.loads(decrypted_json)
+            metadata = self._data["metadata"]
+            metadata.pop("iterations", None)
+            metadata.update(self._key_metadata(self.crypto))
+            self._commit()
+            return True
+
+    def needs_upgrade(self):
+        """Check whether the loaded vault still uses the 1.0 format"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return self._is_legacy(self._data)
+
+    def upgrade_vault(self):
+        """Convert a loaded 1.0 vault to per-entry records in place"""
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            data = self._data
+            if not self._is_legacy(data):
+                return False
             
-            # Update last login
-            data["user"]["last_login"] = datetime.now().isoformat()
-            with open(self.file_path, 'w') as f:
-                json.dump(data, f, indent=2)
+            records = {}
+            for record_id, (site, entry) in self._decrypted.items():
+                records[record_id] = self._encrypt_record(site, entry)
             
-            return {
-                "user": data["user"],
-                "passwords": password_data["passwords"]
-            }
+            data["metadata"]["version"] = VAULT_VERSION
+            data["metadata"]["index"] = INDEX_SCHEME
+            data["metadata"]["check"] = self.crypto.encrypt(CHECK_VALUE).decode()
+            data["records"] = records
+            del data["encrypted_data"]
             
-        except Exception as e:
-            print(f"Error loading data: {e}")
-            return None
+            self._records = records
+            self._write_snapshot()
+            return True
 
     def save_password(self, site, username, password, notes=""):
         """Add or update a password entry"""
-        if self.crypto is None:
-            raise ValueError("Storage not initialized. Load user data first.")
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
             
-        # Load current data
-        with open(self.file_path, 'r') as f:
-            data = json.load(f)
-        
-        # Decrypt existing passwords
-        encrypted_data = base64.b64decode(data["encrypted_data"])
-        decrypted_json = self.crypto.decrypt(encrypted_data)
-        password_data = json.loads(decrypted_json)
-        
-        # Add new password
-        password_data["passwords"][site] = {
-            "username": username,
-            "password": password,
-            "notes": notes,
-            "created": datetime.now().isoformat(),
-            "modified": datetime.now().isoformat()
-        }
-        
-        # Re-encrypt and save
-        new_encrypted_data = self.crypto.encrypt(json.dumps(password_data))
-        data["encrypted_data"] = base64.b64encode(new_encrypted_data).decode()
-        
-        with open(self.file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+            entry = self._new_entry(username, password, notes)
+            record_id = self.crypto.blind_index(site)
             
-        return True
+            if self._is_legacy(self._data):
+                # 1.0 vaults re-encrypt the whole blob
+                self._decrypted[record_id] = (site, entry)
+                self._store_legacy()
+                return True
+            
+            # 2.0 vaults encrypt and append only the record being written
+            token = self._encrypt_record(site, entry)
+            self._append(OP_PUT, record_id, token.encode())
+            self._put_record(record_id, token, site, entry)
+            self._maybe_compact()
+            return True
+
+    def apply_changes(self, changes):
+        """Apply {site: entry or None} with one encryption pass and one write"""
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            
+            if self._is_legacy(self._data):
+                for site, entry in changes.items():
+                    record_id = self.crypto.blind_index(site)
+                    if entry is None:
+                        self._decrypted.pop(record_id, None)
+                    else:
+                        self._decrypted[record_id] = (site, entry)
+                self._store_legacy()
+                return True
+            
+            operations = []
+            for site, entry in changes.items():
+                record_id = self.crypto.blind_index(site)
+                if entry is None:
+                    if record_id in self._records:
+                        operations.append((OP_DELETE, record_id, b"", None, None))
+                else:
+                    token = self._encrypt_record(site, entry)
+                    operations.append((OP_PUT, record_id, token.encode(), site, entry))
+            if not operations:
+                return True
+            
+            # One atomic log frame for the whole batch
+            self._track_append(self._log.append_batch([op[:3] for op in operations]))
+            
+            for op, record_id, token, site, entry in operations:
+                if op == OP_PUT:
+                    self._put_record(record_id, token.decode(), site, entry)
+                else:
+                    self._delete_record(record_id)
+            self._maybe_compact()
+            return True
 
     def get_password(self, site):
         """Retrieve a password entry"""
-        if self.crypto is None:
-            raise ValueError("Storage not initialized. Load user data first.")
-            
-        with open(self.file_path, 'r') as f:
-            data = json.load(f)
-        
-        encrypted_data = base64.b64decode(data["encrypted_data"])
-        decrypted_json = self.crypto.decrypt(encrypted_data)
-        password_data = json.loads(decrypted_json)
-        
-        return password_data["passwords"].get(site)
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return self._lookup(site)
 
     def list_sites(self):
         """List all stored sites"""
-        if self.crypto is None:
-            raise ValueError("Storage not initialized. Load user data first.")
-            
-        with open(self.file_path, 'r') as f:
-            data = json.load(f)
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return [site for site, _ in self._all_entries()]
+
+    def iter_entries(self):
+        """Yield (site, entry) for every entry, in order, without caching what it decrypts"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            legacy = self._is_legacy(self._data)
+            decrypted = self._decrypted
+            items = list(decrypted.values()) if legacy else list(self._records.items())
+        
+        if legacy:
+            yield from items
+            return
         
-        encrypted_data = base64.b64decode(data["encrypted_data"])
-        decrypted_json = self.crypto.decrypt(encrypted_data)
-        password_data = json.loads(decrypted_json)
+        def decrypt(item):
+            cached = decrypted.get(item[0])
+            return cached if cached is not None else self._decrypt_record(item[1])
         
-        return list(password_data["passwords"].keys())
+        # Records are decrypted a chunk at a time on a thread pool, while the
+        # caller already works through the first ones
+        yield from decrypt_ordered(decrypt, items, threads_for(self.crypto))
 
     def delete_password(self, site):
         """Delete a password entry"""
-        if self.crypto is None:
-            raise ValueError("Storage not initialized. Load user data first.")
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            record_id = self.crypto.blind_index(site)
             
-        with open(self.file_path, 'r') as f:
-            data = json.load(f)
-        
-        encrypted_data = base64.b64decode(data["encrypted_data"])
-        decrypted_json = self.crypto.decrypt(encrypted_data)
-        password_data = json.loads(decrypted_json)
-        
-        if site in password_data["passwords"]:
-            del password_data["passwords"][site]
+            if self._is_legacy(self._data):
+                if self._decrypted.pop(record_id, None) is None:
+                    return False
+                self._store_legacy()
+                return True
             
-            # Re-encrypt and save
-            new_encrypted_data = self.crypto.encrypt(json.dumps(password_data))
-            data["encrypted_data"] = base64.b64encode(new_encrypted_data).decode()
+            if record_id not in self._records:
+                return False
             
-            with open(self.file_path, 'w') as f:
-                json.dump(data, f, indent=2)
-                
+            self._append(OP_DELETE, record_id)
+            self._delete_record(record_id)
+            self._maybe_compact()
             return True
-        return False
 
     def user_exists(self):
         """Check if user data file exists"""
@@ -168,7 +591,7 @@ class StorageManager:
         if not os.path.exists(self.file_path):
             return None
             
-        with open(self.file_path, 'r') as f:
-            data = json.load(f)
+        with self._file_lock.shared():
+            data = self._read_data()
             
-        return data["user"]["email"]
\ No newline at end of file
+        return data["user"]["email"]
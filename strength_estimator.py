@@ -0,0 +1,472 @@
+# strength_estimator.py - estimates how many guesses it takes to crack a password
+# Finds dictionary words (plain, reversed and l33t), keyboard walks, repeats,
+# sequences and dates, then scores the cheapest way to cover the password
+# with those patterns, in the manner of zxcvbn.
+import functools
+import math
+import os
+import re
+import sys
+import time
+
+DICTIONARY_FILE = "strength_dictionaries.txt"
+
+# Guess counts at which the 0-4 score steps up
+SCORE_THRESHOLDS = (1e3, 1e6, 1e8, 1e10)
+
+BRUTEFORCE_CARDINALITY = 10
+MIN_GUESSES_SINGLE_CHAR = 10
+MIN_GUESSES_MULTI_CHAR = 50
+# Each extra pattern in a sequence must beat this many guesses to be worth it
+MIN_GUESSES_BEFORE_GROWING_SEQUENCE = 10000
+
+REFERENCE_YEAR = time.localtime().tm_year
+MIN_YEAR_SPACE = 20
+
+# Longer passwords are only matched against patterns in their first part
+MAX_ESTIMATE_LENGTH = 100
+
+L33T_TABLES = (
+    {"4": "a", "@": "a", "8": "b", "(": "c", "{": "c", "[": "c", "<": "c", "3": "e", "6": "g",
+     "9": "g", "1": "i", "!": "i", "|": "i", "0": "o", "$": "s", "5": "s", "7": "t", "+": "t",
+     "%": "x", "2": "z"},
+    {"1": "l", "|": "l", "7": "l"},
+)
+
+_L33T_TRANSLATIONS = tuple(str.maketrans(table) for table in L33T_TABLES)
+
+# Keyboard rows as (unshifted, shifted, x offset of the first key)
+QWERTY_ROWS = (
+    ("`1234567890-=", "~!@#$%^&*()_+", 0.0),
+    ("qwertyuiop[]\\", "QWERTYUIOP{}|", 1.5),
+    ("asdfghjkl;'", "ASDFGHJKL:\"", 1.75),
+    ("zxcvbnm,./", "ZXCVBNM<>?", 2.25),
+)
+KEYPAD_ROWS = (
+    ("/*-", "/*-", 1.0),
+    ("789+", "789+", 0.0),
+    ("456", "456", 0.0),
+    ("123", "123", 0.0),
+    ("0.", "0.", 0.0),
+)
+
+_ranked = None      # (word -> (rank, dictionary name), stem -> longest word), loaded once per process
+_graphs = None
+
+def dictionary_path():
+    """Return the bundled dictionary path (next to this module, or inside the executable)"""
+    base = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, DICTIONARY_FILE)
+
+def _index(ranked):
+    """Pair the words with the length of the longest word starting with each three letter stem"""
+    longest = {}
+    for word in ranked:
+        if len(word) > 3 and len(word) > longest.get(word[:3], 0):
+            longest[word[:3]] = len(word)
+    return ranked, longest
+
+def _load_dictionaries():
+    """Build the word -> rank index from the frequency lists the first time it is needed"""
+    global _ranked
+    if _ranked is None:
+        ranked = {}
+        name = None
+        rank = 0
+        with open(dictionary_path(), 'r', encoding='utf-8') as f:
+            for line in f.read().split("\n"):
+                if not line or line.startswith("# "):
+                    continue
+                if line.startswith("== "):
+                    name = line.strip("= ")
+                    rank = 0
+                    continue
+                rank += 1
+                if line not in ranked:
+                    ranked[line] = (rank, name)
+        _ranked = _index(ranked)
+    return _ranked
+
+def _build_graph(rows, slanted):
+    """Map every key character to (x, y, shifted) and precompute its neighbours"""
+    positions = {}
+    for y, (plain, shifted, offset) in enumerate(rows):
+        for i, (a, b) in enumerate(zip(plain, shifted)):
+            positions.setdefault(a, (i + offset, y, False))
+            positions.setdefault(b, (i + offset, y, a != b))
+
+    keys = {(x, y) for x, y, _ in positions.values()}
+    degree = 0
+    for x, y in keys:
+        for other_x, other_y in keys:
+            dx, dy = other_x - x, other_y - y
+            if slanted:
+                degree += (dy == 0 and abs(dx) == 1) or (abs(dy) == 1 and abs(dx) < 1)
+            else:
+                degree += (dx, dy) != (0, 0) and abs(dx) <= 1 and abs(dy) <= 1
+    return {"positions": positions, "slanted": slanted, "keys": len(keys), "degree": degree / len(keys)}
+
+def _get_graphs():
+    global _graphs
+    if _graphs is None:
+        _graphs = {"qwerty": _build_graph(QWERTY_ROWS, True), "keypad": _build_graph(KEYPAD_ROWS, False)}
+    return _graphs
+
+class Match:
+    __slots__ = ("pattern", "i", "j", "token", "guesses", "info")
+
+    def __init__(self, pattern, i, j, token, guesses, info=None):
+        self.pattern = pattern
+        self.i = i
+        self.j = j
+        self.token = token
+        self.guesses = guesses
+        self.info = info or {}
+
+def _ncr(n, k):
+    return math.comb(n, k) if 0 <= k <= n else 0
+
+def _uppercase_variations(token):
+    """Ways to capitalize a word the way token is capitalized"""
+    if token.islower() or not any(c.isalpha() for c in token):
+        return 1
+    if token.isupper() or (token[0].isupper() and token[1:].islower()) or \
+            (token[-1].isupper() and token[:-1].islower()):
+        return 2
+    upper = sum(c.isupper() for c in token)
+    lower = sum(c.islower() for c in token)
+    return sum(_ncr(upper + lower, i) for i in range(1, min(upper, lower) + 1))
+
+def _l33t_variations(token, subs):
+    """Ways to apply the l33t substitutions found in token"""
+    variations = 1
+    lower = token.lower()
+    for subbed, original in subs.items():
+        s = lower.count(subbed)
+        u = lower.count(original)
+        if s == 0 or u == 0:
+            variations *= 2
+        else:
+            variations *= sum(_ncr(s + u, i) for i in range(1, min(s, u) + 1))
+    return variations
+
+def _dictionary_matches(password, index, reversed_=False, subs_table=None, original=None):
+    ranked, longest = index
+    matches = []
+    lower = password.lower()
+    n = len(password)
+    for i in range(n):
+        # Only stems that start a longer word are scanned past three letters
+        end = min(n, i + max(3, longest.get(lower[i:i + 3], 0)))
+        for j in range(i + 1, end + 1):
+            found = ranked.get(lower[i:j])
+            if found is None:
+                continue
+            rank, name = found
+            token = (original or password)[i:j]
+            subs = {}
+            if subs_table is not None:
+                subs = {c: subs_table[ord(c)] for c in set(token) if ord(c) in subs_table}
+                if not subs or len(token) == 1:
+                    continue
+            guesses = rank * _uppercase_variations(token) * _l33t_variations(token, subs)
+            info = {"word": lower[i:j], "rank": rank, "dictionary": name}
+            if subs:
+                info["l33t"] = True
+            start, stop = i, j
+            if reversed_:
+                guesses *= 2
+                info["reversed"] = True
+                start, stop = n - j, n - i
+                token = token[::-1]
+            matches.append(Match("dictionary", start, stop - 1, token, guesses, info))
+    return matches
+
+def _spatial_matches(password):
+    matches = []
+    for name, graph in _get_graphs().items():
+        positions = graph["positions"]
+        i = 0
+        while i < len(password) - 2:
+            j = i + 1
+            last_direction = None
+            turns = 0
+            shifted = 1 if positions.get(password[i], (0, 0, False))[2] else 0
+            while j < len(password) and password[j - 1] in positions and password[j] in positions:
+                x1, y1, _ = positions[password[j - 1]]
+                x2, y2, is_shifted = positions[password[j]]
+                dx, dy = x2 - x1, y2 - y1
+                if graph["slanted"]:
+                    adjacent = (dy == 0 and abs(dx) == 1) or (abs(dy) == 1 and abs(dx) < 1)
+                else:
+                    adjacent = (dx, dy) != (0, 0) and abs(dx) <= 1 and abs(dy) <= 1
+                if not adjacent:
+                    break
+                direction = (math.copysign(1, dx) if dx else 0, dy)
+                if direction != last_direction:
+                    turns += 1
+                    last_direction = direction
+                shifted += is_shifted
+                j += 1
+            if j - i >= 3:
+                token = password[i:j]
+                matches.append(Match("spatial", i, j - 1, token,
+                                     _spatial_guesses(graph, len(token), turns, shifted),
+                                     {"graph": name, "turns": turns}))
+            i = j if j - i >= 3 else i + 1
+    return matches
+
+def _spatial_guesses(graph, length, turns, shifted):
+    starts, degree = graph["keys"], graph["degree"]
+    guesses = 0
+    for i in range(2, length + 1):
+        for j in range(1, min(turns, i - 1) + 1):
+            guesses += _ncr(i - 1, j - 1) * starts * degree ** j
+    if shifted:
+        unshifted = length - shifted
+        if unshifted == 0:
+            guesses *= 2
+        else:
+            guesses *= sum(_ncr(shifted + unshifted, i) for i in range(1, min(shifted, unshifted) + 1))
+    return guesses
+
+def _repeat_matches(password, user_words):
+    matches = []
+    for m in re.finditer(r"(.+?)\1+", password):
+        token, base = m.group(0), m.group(1)
+        # Prefer the longest repeating unit that covers the whole run
+        whole = re.fullmatch(r"(.+)\1+", token)
+        if whole and len(whole.group(1)) > len(base):
+            base = whole.group(1)
+        base_guesses = _base_guesses(base, user_words)
+        matches.append(Match("repeat", m.start(), m.end() - 1, token,
+                             base_guesses * (len(token) // len(base)), {"base": base}))
+    return matches
+
+@functools.lru_cache(maxsize=4096)
+def _base_guesses(base, user_words):
+    """Guesses for the unit of a repeat; short units such as 'x' recur constantly"""
+    return estimate_guesses(base, user_words)
+
+def _sequence_matches(password):
+    matches = []
+    n = len(password)
+    i = 0
+    while i < n - 2:
+        delta = ord(password[i + 1]) - ord(password[i])
+        j = i + 1
+        if 1 <= abs(delta) <= 5:
+            while j + 1 < n and ord(password[j + 1]) - ord(password[j]) == delta:
+                j += 1
+        if j - i >= 2:
+            token = password[i:j + 1]
+            if token[0] in "aAzZ019":
+                base = 4
+            elif token[0].isdigit():
+                base = 10
+            else:
+                base = 26
+            guesses = base * len(token) * (1 if delta > 0 else 2)
+            matches.append(Match("sequence", i, j, token, guesses, {"ascending": delta > 0}))
+            i = j
+        else:
+            i += 1
+    return matches
+
+def _valid_year(year):
+    if year < 100:
+        year += 2000 if year <= REFERENCE_YEAR % 100 + 5 else 1900
+    return year if 1000 <= year <= 2050 else None
+
+def _date_guesses(year, separator):
+    return max(abs(year - REFERENCE_YEAR), MIN_YEAR_SPACE) * 365 * (4 if separator else 1)
+
+def _date_matches(password):
+    matches = []
+    n = len(password)
+    for i in range(n):
+        for j in range(i + 4, min(n, i + 8) + 1):
+            token = password[i:j]
+            if not token.isdigit():
+                break
+            if len(token) == 4 and 1900 <= int(token) <= 2050:
+                year = int(token)
+                matches.append(Match("date", i, j - 1, token,
+                                     max(abs(year - REFERENCE_YEAR), MIN_YEAR_SPACE), {"year": year}))
+            year = _split_date(token)
+            if year is not None:
+                matches.append(Match("date", i, j - 1, token, _date_guesses(year, False), {"year": year}))
+
+    for m in re.finditer(r"(\d{1,4})([\s/\\_.-])(\d{1,2})\2(\d{1,4})", password):
+        year = _date_from_parts([int(m.group(1)), int(m.group(3)), int(m.group(4))], (m.group(1), m.group(4)))
+        if year is not None:
+            matches.append(Match("date", m.start(), m.end() - 1, m.group(0),
+                                 _date_guesses(year, True), {"year": year}))
+    return matches
+
+def _split_date(digits):
+    """Return the year if the digits read as a day, month and year in some order"""
+    for year_len in (4, 2):
+        for year_first in (True, False):
+            if year_first:
+                year_part, rest = digits[:year_len], digits[year_len:]
+            else:
+                year_part, rest = digits[-year_len:], digits[:-year_len]
+            if not 2 <= len(rest) <= 4:
+                continue
+            year = _valid_year(int(year_part))
+            if year is None:
+                continue
+            for k in range(1, len(rest)):
+                a, b = int(rest[:k]), int(rest[k:])
+                if len(rest[:k]) <= 2 and len(rest[k:]) <= 2 and \
+                        ((1 <= a <= 31 and 1 <= b <= 12) or (1 <= a <= 12 and 1 <= b <= 31)):
+                    return year
+    return None
+
+def _date_from_parts(parts, ends):
+    first, middle, last = parts
+    for year_raw, a, b in ((last, first, middle), (first, middle, last)):
+        year = _valid_year(year_raw)
+        if year is not None and ((1 <= a <= 31 and 1 <= b <= 12) or (1 <= a <= 12 and 1 <= b <= 31)):
+            return year
+    return None
+
+def _omnimatch(password, user_words):
+    lower = password.lower()
+    dictionaries = [_load_dictionaries()]
+    # Most passwords contain none of the user's words in any form, so skip the scans
+    forms = [lower, lower[::-1]] + [lower.translate(table) for table in _L33T_TRANSLATIONS]
+    user_ranked = {}
+    for rank, word in enumerate(user_words, 1):
+        if any(word in form for form in forms):
+            user_ranked.setdefault(word, (rank, "user_inputs"))
+    if user_ranked:
+        dictionaries.append(_index(user_ranked))
+
+    matches = []
+    for ranked in dictionaries:
+        matches += _dictionary_matches(password, ranked)
+        matches += _dictionary_matches(password[::-1], ranked, reversed_=True)
+        for table in _L33T_TRANSLATIONS:
+            subbed = lower.translate(table)
+            if subbed != lower:
+                matches += _dictionary_matches(subbed, ranked, subs_table=table, original=password)
+    matches += _spatial_matches(password)
+    matches += _repeat_matches(password, tuple(user_ranked))
+    matches += _sequence_matches(password)
+    matches += _date_matches(password)
+    return matches
+
+def _bruteforce_guesses(length):
+    guesses = BRUTEFORCE_CARDINALITY ** length
+    return max(guesses, MIN_GUESSES_SINGLE_CHAR + 1 if length == 1 else MIN_GUESSES_MULTI_CHAR + 1)
+
+def _cheapest_sequence(password, matches):
+    """Find the sequence of patterns covering the password with the fewest guesses"""
+    n = len(password)
+    by_end = [[] for _ in range(n)]
+    for m in matches:
+        minimum = MIN_GUESSES_SINGLE_CHAR if len(m.token) == 1 else MIN_GUESSES_MULTI_CHAR
+        m.guesses = max(m.guesses, minimum)
+        by_end[m.j].append(m)
+    bruteforce = [0] + [_bruteforce_guesses(length) for length in range(1, n + 1)]
+    factorials = [math.factorial(length) for length in range(n + 1)]
+    growth = [0] + [MIN_GUESSES_BEFORE_GROWING_SEQUENCE ** (length - 1) for length in range(1, n + 1)]
+
+    # best[k][l] = (total guesses, product of guesses, match, start) for the
+    # cheapest l-pattern cover of password[:k + 1]; match is None for bruteforce
+    best = [{} for _ in range(n)]
+    pattern_ends = []  # positions right after the end of a non-bruteforce cover
+
+    def update(k, length, product, m, start):
+        guesses = factorials[length] * product + growth[length]
+        slot = best[k]
+        for other_length, other in slot.items():
+            if other_length <= length and other[0] <= guesses:
+                return
+        slot[length] = (guesses, product, m, start)
+
+    for k in range(n):
+        for m in by_end[k]:
+            if m.i == 0:
+                update(k, 1, m.guesses, m, 0)
+            else:
+                for length, (_, product, _, _) in list(best[m.i - 1].items()):
+                    update(k, length + 1, product * m.guesses, m, m.i)
+        # Bruteforce from the start, or after a non-bruteforce pattern
+        update(k, 1, bruteforce[k + 1], None, 0)
+        for i in pattern_ends:
+            for length, (_, product, last, _) in list(best[i - 1].items()):
+                if last is not None:
+                    update(k, length + 1, product * bruteforce[k + 1 - i], None, i)
+        if any(entry[2] is not None for entry in best[k].values()):
+            pattern_ends.append(k + 1)
+
+    length, (guesses, _, _, _) = min(best[n - 1].items(), key=lambda item: item[1][0])
+    sequence = []
+    k = n - 1
+    while k >= 0:
+        _, _, m, start = best[k][length]
+        if m is None:
+            m = Match("bruteforce", start, k, password[start:k + 1], bruteforce[k + 1 - start])
+        sequence.append(m)
+        k = start - 1
+        length -= 1
+    return guesses, sequence[::-1]
+
+def estimate_guesses(password, user_words=()):
+    """Return the estimated number of guesses needed to find password"""
+    if not password:
+        return 1
+    return _cheapest_sequence(password, _omnimatch(password, user_words))[0]
+
+def _feedback(sequence, score, password):
+    if score >= 3:
+        return []
+    longest = max(sequence, key=lambda m: len(m.token))
+    feedback = []
+    if longest.pattern == "dictionary":
+        dictionary = longest.info["dictionary"]
+        if dictionary == "passwords":
+            feedback.append("This is similar to a commonly used password")
+        elif dictionary in ("names", "surnames"):
+            feedback.append("Names and surnames by themselves are easy to guess")
+        elif dictionary == "user_inputs":
+            feedback.append("Avoid your own name, email or the site name")
+        elif len(sequence) == 1:
+            feedback.append("A word by itself is easy to guess")
+        if longest.info.get("reversed"):
+            feedback.append("Reversed words aren't much harder to guess")
+        if longest.info.get("l33t"):
+            feedback.append("Predictable substitutions like '@' instead of 'a' don't help very much")
+    elif longest.pattern == "spatial":
+        feedback.append("Keyboard patterns like qwerty or 12345 are easy to guess")
+    elif longest.pattern == "repeat":
+        feedback.append("Repeats like 'abcabcabc' are only slightly harder to guess than 'abc'")
+    elif longest.pattern == "sequence":
+        feedback.append("Sequences like abc or 6543 are easy to guess")
+    elif longest.pattern == "date":
+        feedback.append("Dates and years are often easy to guess")
+    feedback.append("Add another word or two; uncommon words are better")
+    return feedback
+
+def estimate(password, user_inputs=()):
+    """Estimate password strength: guesses, entropy in bits, a 0-4 score and feedback"""
+    user_words = [str(word).lower() for word in user_inputs if word]
+    scored = password[:MAX_ESTIMATE_LENGTH]
+    if scored:
+        guesses, sequence = _cheapest_sequence(scored, _omnimatch(scored, user_words))
+    else:
+        guesses, sequence = 1, []
+    # Whatever is past the estimated part counts as bruteforce
+    guesses *= BRUTEFORCE_CARDINALITY ** (len(password) - len(scored))
+
+    score = sum(guesses >= threshold for threshold in SCORE_THRESHOLDS)
+    return {
+        "guesses": guesses,
+        "entropy": math.log2(guesses) if guesses > 1 else 0.0,
+        "score": score,
+        "sequence": [(m.pattern, m.token) for m in sequence],
+        "feedback": _feedback(sequence, score, password) if sequence else ["Enter a password"],
+    }
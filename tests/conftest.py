@@ -0,0 +1,25 @@
+# conftest.py - shared setup for the noSwag tests
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = "correct horse battery"
+
+@pytest.fixture(autouse=True)
+def fast_kdf(monkeypatch):
+    """Calibrate vault keys for the minimum cost, so tests create vaults quickly"""
+    monkeypatch.setenv("NOSWAG_KDF_TARGET_MS", "1")
+    monkeypatch.delenv("NOSWAG_KDF", raising=False)
+
+def make_vault(path, entries=0):
+    """Create a vault at path holding entries numbered site-00000, site-00001, ..."""
+    from storage_backend import open_storage
+    storage = open_storage(str(path))
+    storage.initialize_new_user("test@example.com", PASSWORD)
+    if entries:
+        storage.save_passwords({"site": f"site-{i:05d}", "username": f"user{i}", "password": f"pw{i}"}
+                               for i in range(entries))
+    return storage
@@ -0,0 +1,62 @@
+# test_breach_warnings.py - every write path reports passwords found in the breach corpus
+import asyncio
+
+from breach_corpus import sha1_hex
+from conftest import PASSWORD, make_vault
+from password_importer import PasswordImporter
+from test_vault_server import call, serve_and
+from vault_server import VaultServer
+
+def write_corpus(tmp_path, monkeypatch, counts):
+    path = tmp_path / "pwned.txt"
+    path.write_text("".join(f"{sha1_hex(password)}:{count}\n"
+                            for password, count in sorted(counts.items(), key=lambda item: sha1_hex(item[0]))))
+    monkeypatch.setenv("NOSWAG_BREACH_CORPUS", str(path))
+
+def test_import_names_breached_passwords(tmp_path, monkeypatch):
+    write_corpus(tmp_path, monkeypatch, {"password1": 2400000, "letmein": 7})
+    export = tmp_path / "export.csv"
+    export.write_text("name,username,password\ngithub,octocat,password1\nmail,me,x9#Lq!v2@Zr\nbank,me,letmein\n")
+    storage = make_vault(tmp_path / "data.json")
+    importer = PasswordImporter()
+    assert importer.import_file(storage, str(export)) == 3
+    assert importer.breached == {"github": 2400000, "bank": 7}
+    storage.close()
+
+def test_restore_names_breached_passwords(tmp_path, monkeypatch):
+    source = make_vault(tmp_path / "source.json")
+    source.save_passwords([{"site": "github", "username": "octocat", "password": "password1"},
+                           {"site": "mail", "username": "me", "password": "x9#Lq!v2@Zr"}])
+    source.export_backup(str(tmp_path / "backup.nsb"), "backup password")
+    source.close()
+
+    write_corpus(tmp_path, monkeypatch, {"password1": 12})
+    storage = make_vault(tmp_path / "data.json")
+    breached = {}
+    assert storage.restore_backup(str(tmp_path / "backup.nsb"), "backup password", breached) == 2
+    assert breached == {"github": 12}
+    storage.close()
+
+def test_nothing_is_reported_without_a_corpus(tmp_path, monkeypatch):
+    monkeypatch.delenv("NOSWAG_BREACH_CORPUS", raising=False)
+    storage = make_vault(tmp_path / "data.json")
+    breached = {}
+    storage.save_passwords([{"site": "github", "username": "octocat", "password": "password1"}], breached)
+    assert breached == {}
+    storage.close()
+
+def test_server_reports_breached_passwords(tmp_path, monkeypatch):
+    write_corpus(tmp_path, monkeypatch, {"password1": 99})
+    socket_path = str(tmp_path / "server.sock")
+    server = VaultServer(str(tmp_path / "vaults"), ttl=60, workers=1)
+
+    async def scenario():
+        alice = {"user": "alice", "email": "alice@example.com", "password": PASSWORD}
+        assert (await call(socket_path, "POST", "/vaults", alice))[0] == 201
+        token = (await call(socket_path, "POST", "/sessions", alice))[1]["token"]
+        assert await call(socket_path, "PUT", "/entries/github", {"password": "password1"}, token) == \
+            (200, {"site": "github", "breached": 99})
+        assert await call(socket_path, "PUT", "/entries/mail", {"password": "x9#Lq!v2@Zr"}, token) == \
+            (200, {"site": "mail", "breached": 0})
+
+    asyncio.run(serve_and(server, socket_path, scenario))
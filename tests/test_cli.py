@@ -0,0 +1,65 @@
+# test_cli.py - the one-shot commands stay scriptable
+import os
+import subprocess
+import sys
+
+from conftest import PASSWORD, make_vault
+from vault_file import VaultFileLock
+
+NOSWAG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "noSwag.py")
+
+def run(tmp_path, *args, password=PASSWORD):
+    env = dict(os.environ, NOSWAG_VAULT=str(tmp_path / "data.json"), NOSWAG_AGENT_SOCK=str(tmp_path / "none.sock"),
+               # The vault's key wrapping is far cheaper than this target, so an
+               # interactive login would strengthen it and say so
+               NOSWAG_KDF_TARGET_MS="1000")
+    # No controlling terminal, so getpass reads the password from stdin
+    return subprocess.run([sys.executable, NOSWAG, *args], input=password + "\n", capture_output=True,
+                          text=True, cwd=tmp_path, env=env, start_new_session=True, timeout=60)
+
+def test_get_prints_only_the_password(tmp_path):
+    storage = make_vault(tmp_path / "data.json")
+    storage.save_password("github", "octocat", "hunter2")
+    storage.close()
+    before = open(tmp_path / "data.json", 'rb').read()
+
+    result = run(tmp_path, "get", "github")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "hunter2\n"
+    # Unlocking for a one-shot command leaves the key wrapping alone
+    assert open(tmp_path / "data.json", 'rb').read() == before
+
+def test_diagnostics_go_to_stderr(tmp_path):
+    make_vault(tmp_path / "data.json").close()
+    result = run(tmp_path, "get", "missing")
+    assert result.returncode == 1
+    assert result.stdout == ""
+    assert "No password found" in result.stderr
+
+    result = run(tmp_path, "list")
+    assert result.returncode == 0 and result.stdout == ""
+
+def snapshot(directory):
+    return {name: open(os.path.join(directory, name), 'rb').read() for name in sorted(os.listdir(directory))}
+
+def test_one_shot_reads_leave_the_vault_alone(tmp_path):
+    storage = make_vault(tmp_path / "data.json", 3)
+    storage.close()
+    before = snapshot(tmp_path)
+
+    # Another process reading the vault holds a shared lock; a read-only
+    # unlock shares it instead of waiting for an exclusive one
+    reader = VaultFileLock(str(tmp_path / "data.lock"))
+    with reader.shared():
+        result = run(tmp_path, "get", "site-00001")
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == "pw1\n"
+        result = run(tmp_path, "list")
+        assert result.stdout.split() == ["site-00000", "site-00001", "site-00002"]
+    reader.close()
+    # Not even data.state records a last login
+    assert snapshot(tmp_path) == before
+
+    result = run(tmp_path, "get", "site-00001", password="wrong password")
+    assert result.returncode == 1 and result.stdout == ""
+    assert "Invalid master password." in result.stderr
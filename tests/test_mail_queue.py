@@ -0,0 +1,139 @@
+# test_mail_queue.py - delivery against a local stand-in SMTP server
+import builtins
+import smtplib
+import socketserver
+import threading
+from email.message import EmailMessage
+
+import pytest
+
+from mail_queue import MailQueue
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """A minimal SMTP server; replies holds canned answers to MAIL FROM, used up in order"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, replies=()):
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.replies = list(replies)
+        self.connections = 0
+        self.attempts = 0
+        self.messages = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 fake ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250-fake")
+                self.reply("250 8BITMIME")
+            elif command.startswith("MAIL FROM"):
+                server.attempts += 1
+                self.reply(server.replies.pop(0) if server.replies else "250 OK")
+            elif command.startswith("DATA"):
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                while (line := self.rfile.readline()) not in (b".\r\n", b""):
+                    body.append(line)
+                server.messages.append(b"".join(body))
+                self.reply("250 Queued")
+            elif command.startswith("QUIT"):
+                self.reply("221 Bye")
+                return
+            else:  # RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+@pytest.fixture
+def smtp():
+    servers = []
+
+    def start(*replies):
+        servers.append(FakeSMTPServer(replies))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.stop()
+
+def message(i=0):
+    msg = EmailMessage()
+    msg["From"] = "noswag@example.com"
+    msg["To"] = "user@example.com"
+    msg["Subject"] = f"Code {i}"
+    msg.set_content(f"Your verification code is: {i:06d}")
+    return msg
+
+def test_messages_share_one_session(smtp):
+    server = smtp()
+    mail = MailQueue("127.0.0.1", server.port, starttls=False)
+    deliveries = [mail.submit(message(i)) for i in range(3)]
+    assert [delivery.result(10) for delivery in deliveries] == [True] * 3
+    mail.close(10)
+    assert len(server.messages) == 3
+    assert server.connections == mail.connections == 1
+
+def test_temporary_failures_are_retried(smtp):
+    server = smtp("451 Greylisted, try again", "421 Too busy")
+    mail = MailQueue("127.0.0.1", server.port, starttls=False, backoff=0.01)
+    assert mail.submit(message()).result(10) is True
+    mail.close(10)
+    assert server.attempts == 3
+    assert len(server.messages) == 1
+
+def test_permanent_failure_is_not_retried(smtp):
+    server = smtp("550 No such user")
+    mail = MailQueue("127.0.0.1", server.port, starttls=False, backoff=0.01)
+    with pytest.raises(smtplib.SMTPSenderRefused):
+        mail.submit(message()).result(10)
+    # The session is opened again for the next message
+    assert mail.submit(message(1)).result(10) is True
+    mail.close(10)
+    assert server.attempts == 2
+    assert len(server.messages) == 1
+
+def test_registration_reports_a_failed_send_before_asking_for_the_code(smtp, tmp_path, monkeypatch, capsys):
+    server = smtp("550 Sender rejected")
+    monkeypatch.setenv("SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(server.port))
+    monkeypatch.setenv("SMTP_STARTTLS", "0")
+    monkeypatch.setenv("EMAIL_ADDRESS", "noswag@example.com")
+    monkeypatch.setenv("EMAIL_PASSWORD", "secret")
+    monkeypatch.setenv("NOSWAG_VAULT", str(tmp_path / "data.json"))
+    monkeypatch.delenv("NOSWAG_CODE_STORE", raising=False)
+
+    prompts = []
+
+    def answer(prompt=""):
+        prompts.append(prompt)
+        if "verification code" in prompt:
+            raise AssertionError("asked for a code that was never sent")
+        return "user@example.com"
+    monkeypatch.setattr(builtins, "input", answer)
+
+    from noSwag import noSwagPasswordManager
+    manager = noSwagPasswordManager()
+    try:
+        assert manager.register_new_user() is False
+    finally:
+        manager.auth.close(10)
+    assert prompts == ["Enter your email address: "]
+    assert "Failed to send verification email" in capsys.readouterr().out
@@ -0,0 +1,139 @@
+# test_parallel_decrypt.py - ordered decryption on the thread pool
+import threading
+
+import pytest
+
+from conftest import make_vault
+from parallel_decrypt import decrypt_ordered, decrypt_threads, threads_for
+
+def test_results_keep_input_order():
+    items = list(range(5000))
+    assert list(decrypt_ordered(lambda x: x * 2, items, threads=4, chunk_size=64)) == [x * 2 for x in items]
+
+def test_failure_reaches_the_reader():
+    def decrypt(x):
+        if x == 3000:
+            raise ValueError("bad record")
+        return x
+    with pytest.raises(ValueError):
+        list(decrypt_ordered(decrypt, list(range(5000)), threads=4, chunk_size=64))
+
+@pytest.mark.parametrize("configured", ["", "many", "0", "-2"])
+def test_bad_thread_counts_fall_back_to_the_cpus(monkeypatch, configured):
+    monkeypatch.delenv("NOSWAG_DECRYPT_THREADS", raising=False)
+    default = decrypt_threads()
+    monkeypatch.setenv("NOSWAG_DECRYPT_THREADS", configured)
+    assert decrypt_threads() == default
+    list(decrypt_ordered(lambda x: x, list(range(1000)), chunk_size=64))
+
+def test_each_thread_count_gets_its_own_pool():
+    seen = {}
+
+    def decrypt(x):
+        seen.setdefault(threading.current_thread().name, x)
+        return x
+    # A later caller asking for more threads than the first one gets them
+    for threads in (2, 6):
+        seen.clear()
+        barrier = threading.Barrier(threads, timeout=5)
+
+        def wait_for_all(x):
+            if x % 64 == 0:
+                barrier.wait()  # Only passes if threads chunks run at once
+            return decrypt(x)
+        assert list(decrypt_ordered(wait_for_all, list(range(64 * threads)), threads, chunk_size=64)) == \
+            list(range(64 * threads))
+        assert len(seen) == threads
+
+def test_agent_crypto_is_decrypted_on_one_thread(tmp_path, monkeypatch):
+    from unlock_agent import AgentClient, AgentCrypto, UnlockAgent
+    monkeypatch.setenv("NOSWAG_DECRYPT_THREADS", "4")
+
+    socket_path = str(tmp_path / "agent.sock")
+    agent = UnlockAgent(socket_path)
+    thread = threading.Thread(target=agent.run, daemon=True)
+    thread.start()
+    client = AgentClient(socket_path)
+    assert client.connect()
+    try:
+        path = tmp_path / "data.json"
+        storage = make_vault(path, 3000)
+        client.add_key(str(path), storage.crypto.key)
+        storage.close()
+
+        from storage_backend import open_storage
+        storage = open_storage(str(path))
+        crypto = AgentCrypto(client, str(path))
+        assert threads_for(crypto) == 1
+        assert storage.unlock_with(crypto) is not None
+        # list_sites caches every record it decrypts; each must land under its own site
+        assert len(storage.list_sites()) == 3000
+        for i in range(0, 3000, 7):
+            assert storage.get_password(f"site-{i:05d}")["username"] == f"user{i}"
+        storage.close()
+    finally:
+        client.request("stop")
+        client.close()
+        thread.join(5)
+
+def test_agent_client_serializes_concurrent_requests(tmp_path):
+    from unlock_agent import AgentClient, UnlockAgent
+    from crypto_manager import CryptoManager
+    socket_path = str(tmp_path / "agent.sock")
+    agent = UnlockAgent(socket_path)
+    thread = threading.Thread(target=agent.run, daemon=True)
+    thread.start()
+    client = AgentClient(socket_path)
+    assert client.connect()
+    try:
+        crypto = CryptoManager(kdf={"algorithm": "pbkdf2-sha256", "iterations": 1000})
+        crypto.set_master_password("x", {"algorithm": "pbkdf2-sha256", "iterations": 1000})
+        client.add_key("v", crypto.key)
+        tokens = [crypto.encrypt(f"record {i}").decode() for i in range(400)]
+        # Threads sharing one client must each get the reply to their own request
+        results = list(decrypt_ordered(lambda item: client.request("decrypt", "v", token=item)["data"],
+                                       tokens, threads=4, chunk_size=16))
+        assert results == [f"record {i}" for i in range(400)]
+    finally:
+        client.request("stop")
+        client.close()
+        thread.join(5)
+
+class CountingCursor:
+    """Wraps a cursor and counts the rows read from it"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.rows = 0
+
+    def fetchmany(self, size):
+        rows = self.cursor.fetchmany(size)
+        self.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.rows += 1
+            yield row
+
+@pytest.mark.parametrize("threads", ["1", "4"])
+def test_sqlite_entries_stream_from_the_cursor(tmp_path, monkeypatch, threads):
+    monkeypatch.setenv("NOSWAG_DECRYPT_THREADS", threads)
+    storage = make_vault(tmp_path / "data.db", 6000)
+    connection = storage._connect()
+    cursors = []
+
+    class Connection:
+        def execute(self, *args):
+            cursors.append(CountingCursor(connection.execute(*args)))
+            return cursors[-1]
+
+    monkeypatch.setattr(storage, "_connect", Connection)
+    entries = storage.iter_entries()
+    next(entries)
+    # Only the chunks in flight have been read, not the whole table
+    assert cursors[0].rows < 6000 // 2
+    assert sum(1 for _ in entries) + 1 == 6000
+    monkeypatch.undo()
+    assert sorted(storage.list_sites()) == [f"site-{i:05d}" for i in range(6000)]
+    storage.close()
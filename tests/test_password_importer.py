@@ -0,0 +1,59 @@
+# test_password_importer.py - malformed exports are skipped record by record
+import json
+
+import pytest
+
+from password_importer import PasswordImporter
+
+def import_json(tmp_path, document):
+    path = tmp_path / "export.json"
+    path.write_text(json.dumps(document))
+    importer = PasswordImporter()
+    return list(importer.iter_entries(str(path))), importer.skipped
+
+def test_null_and_numeric_fields(tmp_path):
+    entries, skipped = import_json(tmp_path, {"passwords": [
+        {"site": "github", "username": None, "password": "hunter2", "notes": None},
+        {"site": "bank", "username": 12345678, "password": 4242},
+        {"site": None, "url": None, "password": "orphan"},
+        {"site": "mail", "password": None},
+        {"site": ["not", "text"], "password": "pw"},
+        {"site": "flag", "password": True},
+    ]})
+    assert entries == [
+        {"site": "github", "username": "", "password": "hunter2", "notes": ""},
+        {"site": "bank", "username": "12345678", "password": "4242", "notes": ""},
+    ]
+    assert skipped == 4
+
+def test_records_that_are_not_objects(tmp_path):
+    entries, skipped = import_json(tmp_path, ["github", None, 7, [], {"name": "mail", "password": "pw"}])
+    assert [entry["site"] for entry in entries] == ["mail"]
+    assert skipped == 4
+
+def test_passwords_keyed_by_site(tmp_path):
+    entries, skipped = import_json(tmp_path, {"passwords": {
+        "github": {"username": "octocat", "password": "hunter2"},
+        "bank": {"site": "Bank", "password": "pw"},
+        "broken": "pw",
+    }})
+    assert [(entry["site"], entry["username"]) for entry in entries] == [("github", "octocat"), ("Bank", "")]
+    assert skipped == 1
+
+def test_malformed_bitwarden_items(tmp_path):
+    entries, skipped = import_json(tmp_path, {"items": [
+        {"name": "github", "login": {"username": "octocat", "password": "hunter2", "uris": None}},
+        {"name": None, "login": {"password": "pw", "uris": ["https://mail.example.com"]}},
+        {"name": None, "login": {"password": "pw", "uris": [{"uri": "http://[broken"}]}},
+        {"name": "bank", "login": "not an object"},
+        "not an item",
+        {"name": None, "login": {"password": "pw", "uris": [{"uri": "https://www.example.org/login"}]}},
+    ]})
+    assert [entry["site"] for entry in entries] == ["github", "example.org"]
+    assert skipped == 4
+
+def test_unrecognized_documents_are_refused(tmp_path):
+    for document in ("just text", 42, {"passwords": "hunter2"}):
+        with pytest.raises(ValueError):
+            import_json(tmp_path, document)
+    assert import_json(tmp_path, {"passwords": None}) == ([], 0)
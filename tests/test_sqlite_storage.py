@@ -0,0 +1,46 @@
+# test_sqlite_storage.py - the SQLite backend's buffered user metadata
+import json
+import sqlite3
+import time
+
+import sqlite_storage
+from conftest import PASSWORD, make_vault
+from sqlite_storage import SQLiteStorageManager
+
+def stored_user(path):
+    conn = sqlite3.connect(str(path))
+    try:
+        return json.loads(conn.execute("SELECT value FROM meta WHERE key = 'user'").fetchone()[0])
+    finally:
+        conn.close()
+
+def test_last_login_is_flushed_once_idle(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_storage, "FLUSH_DELAY", 0.2)
+    path = tmp_path / "data.db"
+    make_vault(path).close()
+    before = stored_user(path)["last_login"]
+
+    storage = SQLiteStorageManager(str(path))
+    user = storage.load_user_data(PASSWORD, rehash=False)["user"]
+    assert stored_user(path)["last_login"] == before  # Unlocking alone writes nothing
+    # Written by the idle timer on its own thread, without waiting for close()
+    deadline = time.monotonic() + 10
+    while stored_user(path)["last_login"] != user["last_login"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert storage.flush() is False
+    # The vault's own connection still works after the timer's flush
+    storage.save_password("github", "octocat", "hunter2")
+    assert storage.get_password("github")["password"] == "hunter2"
+    storage.close()
+
+def test_close_flushes_and_stops_the_timer(tmp_path, monkeypatch):
+    path = tmp_path / "data.db"
+    make_vault(path).close()
+    storage = SQLiteStorageManager(str(path))
+    user = storage.load_user_data(PASSWORD, rehash=False)["user"]
+    timer = storage._flush_timer
+    assert timer is not None
+    storage.close()
+    assert stored_user(path)["last_login"] == user["last_login"]
+    assert timer.finished.is_set()  # Cancelled
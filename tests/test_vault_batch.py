@@ -0,0 +1,61 @@
+# test_vault_batch.py - batch jobs over many vault files
+import os
+
+import pytest
+
+from conftest import PASSWORD, make_vault
+from vault_batch import VaultBatch
+
+def snapshot(directory):
+    """Map every file (SQLite's own journal files aside) to its contents"""
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(("-wal", "-shm")):
+            with open(os.path.join(directory, name), 'rb') as f:
+                files[name] = f.read()
+    return files
+
+@pytest.mark.parametrize("extension", [".json", ".nsv", ".db"])
+def test_verify_changes_nothing(tmp_path, extension):
+    path = tmp_path / f"vault{extension}"
+    storage = make_vault(path, 50)
+    storage.save_password("extra", "user", "pw")  # Leaves a log next to JSON and .nsv vaults
+    storage.close()
+    if extension != ".db":
+        # A torn write at the end of the log is left for a normal unlock to repair
+        with open(storage._log_path(), 'ab') as f:
+            f.write(b"\x00\x01torn")
+    before = snapshot(tmp_path)
+
+    [result] = VaultBatch(1).run("verify", [(str(path), PASSWORD)])
+    assert result["ok"], result["error"]
+    assert result["entries"] == 51
+    assert snapshot(tmp_path) == before
+
+def test_wrong_password_fails_only_that_vault(tmp_path):
+    vaults = []
+    for i in range(3):
+        make_vault(tmp_path / f"v{i}.json", 5).close()
+        vaults.append((str(tmp_path / f"v{i}.json"), PASSWORD if i != 1 else "wrong"))
+    results = VaultBatch(2).run("verify", vaults)
+    assert [result["ok"] for result in results] == [True, False, True]
+    assert results[1]["error"] == "wrong password or damaged file"
+
+def test_migrate_uses_the_kdf_calibrated_once(tmp_path):
+    kdf = {"algorithm": "pbkdf2-sha256", "iterations": 123000}
+    vaults = []
+    for i in range(3):
+        make_vault(tmp_path / f"v{i}.json", 20 + i).close()
+        vaults.append((str(tmp_path / f"v{i}.json"), PASSWORD))
+
+    results = VaultBatch(2).run("migrate", vaults, extension=".db", kdf=kdf)
+    assert [result["ok"] for result in results] == [True] * 3
+
+    from storage_backend import open_storage
+    for i in range(3):
+        storage = open_storage(str(tmp_path / f"v{i}.db"))
+        # Every new vault gets the parameters handed in, none calibrated by a worker
+        assert storage.read_key_metadata()["kdf"] == kdf
+        assert storage.load_user_data(PASSWORD, rehash=False) is not None
+        assert len(storage.list_sites()) == 20 + i
+        storage.close()
@@ -0,0 +1,104 @@
+# test_vault_file.py - crash-safe replacement, the vault file lock and the generation check
+import os
+import stat
+import threading
+
+import pytest
+
+import vault_file
+from conftest import PASSWORD, make_vault
+from storage_manager import StorageManager
+from vault_file import VaultFileLock, atomic_write
+
+def test_atomic_write_replaces_the_file_owner_only(tmp_path):
+    path = tmp_path / "data.json"
+    atomic_write(str(path), b"old")
+    atomic_write(str(path), b"new")
+    assert path.read_bytes() == b"new"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.listdir(tmp_path) == ["data.json"]
+
+def test_failed_atomic_write_keeps_the_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "data.json"
+    atomic_write(str(path), b"old")
+
+    def crash(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(vault_file.os, "replace", crash)
+    with pytest.raises(OSError):
+        atomic_write(str(path), b"new")
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["data.json"]  # No temporary file left behind
+
+def acquired_within(lock, exclusive, timeout=0.5):
+    """Try to take lock on another thread; return an Event set once it is held, and the thread"""
+    held = threading.Event()
+    release = threading.Event()
+
+    def take():
+        with (lock.exclusive() if exclusive else lock.shared()):
+            held.set()
+            release.wait(10)
+    thread = threading.Thread(target=take, daemon=True)
+    thread.start()
+    return held.wait(timeout), held, release, thread
+
+def test_exclusive_lock_waits_for_readers_and_writers(tmp_path):
+    # Two lock objects have their own file descriptors, like two processes
+    path = str(tmp_path / "data.lock")
+    mine, theirs = VaultFileLock(path), VaultFileLock(path)
+
+    with mine.shared():
+        got, _, release, thread = acquired_within(theirs, exclusive=False)
+        assert got  # Readers share
+        release.set()
+        thread.join()
+        got, held, release, thread = acquired_within(theirs, exclusive=True)
+        assert not got  # A writer waits for the reader
+    assert held.wait(5)  # ...and proceeds once it is gone
+    release.set()
+    thread.join()
+
+    with mine.exclusive():
+        got, held, release, thread = acquired_within(theirs, exclusive=False)
+        assert not got
+    assert held.wait(5)
+    release.set()
+    thread.join()
+
+def test_upgrade_is_undone_on_release(tmp_path):
+    path = str(tmp_path / "data.lock")
+    mine, theirs = VaultFileLock(path), VaultFileLock(path)
+    with mine.shared():
+        with mine.exclusive():  # Reentrant upgrade
+            got, held, release, thread = acquired_within(theirs, exclusive=False)
+            assert not got
+        # Back to shared: the waiting reader gets in while the outer hold remains
+        assert held.wait(5)
+        release.set()
+        thread.join()
+
+def test_commit_refuses_to_overwrite_a_newer_generation(tmp_path):
+    path = tmp_path / "data.json"
+    make_vault(path, 5).close()
+    stale = StorageManager(str(path))
+    stale.load_user_data(PASSWORD, rehash=False)
+    assert len(stale.list_sites()) == 5
+
+    other = StorageManager(str(path))
+    other.load_user_data(PASSWORD, rehash=False)
+    other.save_password("other", "u", "p")
+    assert other.compact()
+    other.close()
+
+    # A writer that skipped the lock and its refresh still must not clobber the newer snapshot
+    stale._refresh = lambda: None
+    with pytest.raises(ValueError, match="changed by another noSwag process"):
+        stale.compact()
+    stale.close()
+
+    fresh = StorageManager(str(path))
+    fresh.load_user_data(PASSWORD, rehash=False)
+    assert fresh.get_password("other") is not None
+    assert len(fresh.list_sites()) == 6
+    fresh.close()
@@ -0,0 +1,148 @@
+# test_vault_log.py - the record log: torn writes, batch frames, compaction and concurrent writers
+import json
+import os
+import stat
+import subprocess
+import sys
+
+from conftest import PASSWORD, make_vault
+from storage_manager import StorageManager
+from vault_log import OP_DELETE, OP_PUT, VaultLog
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEY = b"k" * 32
+
+def run_python(code, *args):
+    """Run code in a separate noSwag process; args are available as sys.argv[1:]"""
+    return subprocess.Popen([sys.executable, "-c", f"import sys; sys.path.insert(0, {ROOT!r})\n{code}", *args])
+
+def unlock(path):
+    storage = StorageManager(str(path))
+    assert storage.load_user_data(PASSWORD, rehash=False) is not None
+    return storage
+
+def test_log_is_owner_only(tmp_path):
+    old_umask = os.umask(0o022)
+    try:
+        log = VaultLog(str(tmp_path / "data.log"), KEY)
+        log.append(OP_PUT, "a", b"token-a")
+    finally:
+        os.umask(old_umask)
+    assert stat.S_IMODE(os.stat(log.file_path).st_mode) == 0o600
+
+def test_read_stops_at_a_torn_frame(tmp_path):
+    log = VaultLog(str(tmp_path / "data.log"), KEY)
+    log.append(OP_PUT, "a", b"token-a")
+    intact = log.size()
+    log.append(OP_PUT, "b", b"token-b")
+    with open(log.file_path, 'r+b') as f:
+        f.truncate(log.size() - 5)
+
+    assert [(op, rid, token) for op, rid, token, _ in log.read()] == [(OP_PUT, "a", b"token-a")]
+    assert [end for *_, end in log.read()] == [intact]
+
+def test_read_stops_at_a_frame_with_a_bad_mac(tmp_path):
+    log = VaultLog(str(tmp_path / "data.log"), KEY)
+    log.append(OP_PUT, "a", b"token-a")
+    log.append(OP_PUT, "b", b"token-b")
+    log.append(OP_DELETE, "a")
+    with open(log.file_path, 'rb') as f:
+        data = bytearray(f.read())
+    data[-1] ^= 1  # In the last frame's MAC
+    with open(log.file_path, 'wb') as f:
+        f.write(data)
+    assert [rid for _, rid, _, _ in log.read()] == ["a", "b"]
+    # A different key trusts nothing
+    assert list(VaultLog(log.file_path, b"x" * 32).read()) == []
+
+def test_half_written_batch_frame_applies_none_of_its_operations(tmp_path):
+    log = VaultLog(str(tmp_path / "data.log"), KEY)
+    log.append(OP_PUT, "before", b"token")
+    before = log.size()
+    log.append_batch([(OP_PUT, f"r{i}", b"x" * 100) for i in range(5)])
+    assert len(list(log.read())) == 6
+    with open(log.file_path, 'r+b') as f:
+        f.truncate(before + (log.size() - before) // 2)
+    assert [rid for _, rid, _, _ in log.read()] == ["before"]
+
+def test_unlock_repairs_a_torn_tail_and_keeps_every_intact_write(tmp_path):
+    path = tmp_path / "data.json"
+    storage = make_vault(path, 10)
+    storage.save_password("site-00003", "changed", "new")
+    storage.save_passwords([{"site": "batch-1", "username": "u", "password": "p"},
+                            {"site": "batch-2", "username": "u", "password": "p"}])
+    storage.close()
+    log_path = storage._log_path()
+    intact = os.path.getsize(log_path)
+    # A crash halfway through appending a frame
+    frame = VaultLog(log_path, storage.crypto.derive_subkey("noswag-vault-log"))._frame(b"P\x01xpartial")
+    with open(log_path, 'ab') as f:
+        f.write(frame[:len(frame) // 2])
+
+    storage = unlock(path)
+    assert os.path.getsize(log_path) == intact
+    assert storage.get_password("site-00003")["username"] == "changed"
+    assert storage.get_password("batch-2") is not None
+    # A write after the repair is not hidden behind the torn bytes
+    storage.save_password("after", "u", "p")
+    storage.close()
+    storage = unlock(path)
+    assert storage.get_password("after") is not None
+    assert len(storage.list_sites()) == 13
+    storage.close()
+
+def test_replay_after_another_process_compacts(tmp_path):
+    path = tmp_path / "data.json"
+    storage = make_vault(path, 20)
+    storage.close()
+    reader = unlock(path)
+    assert len(reader.list_sites()) == 20
+    reader.save_password("from-reader", "u", "p")
+
+    writer = run_python(
+        "from storage_manager import StorageManager\n"
+        "s = StorageManager(sys.argv[1]); s.load_user_data(sys.argv[2], rehash=False)\n"
+        "s.save_passwords({'site': f'new-{i}', 'username': 'u', 'password': 'p'} for i in range(30))\n"
+        "for i in range(10): s.delete_password(f'site-{i:05d}')\n"
+        "s.save_password('site-00015', 'rewritten', 'p')\n"
+        "assert s.compact(); s.close()\n",
+        str(path), PASSWORD)
+    assert writer.wait(60) == 0
+    assert os.path.getsize(reader._log_path()) == 0
+
+    # The reader's cached view and log offset are stale; it must pick up the new snapshot
+    sites = set(reader.list_sites())
+    assert len(sites) == 20 + 1 + 30 - 10
+    assert "from-reader" in sites and "site-00000" not in sites
+    assert reader.get_password("site-00015")["username"] == "rewritten"
+    reader.save_password("after-compaction", "u", "p")
+    reader.close()
+    assert unlock(path).get_password("after-compaction") is not None
+
+def test_two_processes_writing_at_once_lose_nothing(tmp_path):
+    path = tmp_path / "data.json"
+    make_vault(path).close()
+    with open(path) as f:
+        generation = json.load(f)["metadata"]["generation"]
+    code = (
+        "from storage_manager import StorageManager\n"
+        "s = StorageManager(sys.argv[1]); s.load_user_data(sys.argv[2], rehash=False)\n"
+        "name = sys.argv[3]\n"
+        # Rewriting entries leaves dead records, so compactions run while the other process writes
+        "for round in range(3):\n"
+        "    for i in range(60):\n"
+        "        s.save_password(f'{name}-{i}', name, f'{round}')\n"
+        "s.close()\n"
+    )
+    writers = [run_python(code, str(path), PASSWORD, name) for name in ("left", "right")]
+    assert [writer.wait(120) for writer in writers] == [0, 0]
+    with open(path) as f:
+        assert json.load(f)["metadata"]["generation"] > generation  # Compaction did run
+
+    storage = unlock(path)
+    assert len(storage.list_sites()) == 120
+    for name in ("left", "right"):
+        for i in range(60):
+            entry = storage.get_password(f"{name}-{i}")
+            assert entry["username"] == name and entry["password"] == "2"
+    storage.close()
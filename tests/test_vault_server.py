@@ -0,0 +1,133 @@
+# test_vault_server.py - the multi-user vault service over its Unix socket
+import asyncio
+import json
+import os
+
+import pytest
+
+from vault_server import VaultServer
+
+async def call(socket_path, method, path, body=None, token=None):
+    """Send one HTTP request and return (status, JSON payload)"""
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    data = json.dumps(body).encode() if body is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\nConnection: close\r\n"
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    writer.write(head.encode() + b"\r\n" + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, payload = response.partition(b"\r\n\r\n")
+    return int(status_line.split()[1]), json.loads(payload)
+
+async def serve_and(server, socket_path, scenario):
+    ready = asyncio.Event()
+    task = asyncio.create_task(server.serve(socket_path, ready=ready))
+    await ready.wait()
+    try:
+        await scenario()
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+@pytest.mark.parametrize("extension", [".json", ".nsv", ".db"])
+def test_users_work_on_their_own_vaults(tmp_path, extension):
+    socket_path = str(tmp_path / "server.sock")
+    server = VaultServer(str(tmp_path / "vaults"), ttl=60, workers=2, extension=extension)
+    users = ["alice", "bob", "carol"]
+
+    async def scenario():
+        assert oct(os.stat(socket_path).st_mode & 0o777) == "0o600"
+        results = await asyncio.gather(*[
+            call(socket_path, "POST", "/vaults", {"user": user, "email": f"{user}@example.com",
+                                                  "password": f"{user} master password"})
+            for user in users])
+        assert [status for status, _ in results] == [201] * 3
+        assert os.path.exists(tmp_path / "vaults" / f"alice{extension}")
+
+        results = await asyncio.gather(*[
+            call(socket_path, "POST", "/sessions", {"user": user, "password": f"{user} master password"})
+            for user in users])
+        tokens = {user: payload["token"] for user, (_, payload) in zip(users, results)}
+
+        # Many requests at once: each vault's calls run on that vault's own thread
+        await asyncio.gather(*[
+            call(socket_path, "PUT", f"/entries/site{i}", {"username": user, "password": f"pw{i}"}, tokens[user])
+            for user in users for i in range(10)])
+        for user in users:
+            status, payload = await call(socket_path, "GET", "/entries", token=tokens[user])
+            assert status == 200 and len(payload["sites"]) == 10
+            status, payload = await call(socket_path, "GET", "/entries/site3", token=tokens[user])
+            assert status == 200 and payload["username"] == user and payload["password"] == "pw3"
+
+        assert (await call(socket_path, "DELETE", "/entries/site3", token=tokens["bob"]))[0] == 200
+        assert (await call(socket_path, "GET", "/entries/site3", token=tokens["bob"]))[0] == 404
+        assert (await call(socket_path, "DELETE", "/sessions", token=tokens["carol"]))[0] == 200
+        assert (await call(socket_path, "GET", "/entries", token=tokens["carol"]))[0] == 401
+        assert (await call(socket_path, "GET", "/status"))[1] == {"vaults": 2, "sessions": 2}
+
+    asyncio.run(serve_and(server, socket_path, scenario))
+    # Shutdown closed every vault on its own thread
+    assert not os.path.exists(socket_path)
+
+def test_bad_requests_are_refused(tmp_path):
+    socket_path = str(tmp_path / "server.sock")
+    server = VaultServer(str(tmp_path / "vaults"), ttl=60, workers=1, extension=".db")
+
+    async def scenario():
+        register = {"user": "alice", "email": "alice@example.com", "password": "alice master password"}
+        assert (await call(socket_path, "POST", "/vaults", register))[0] == 201
+        assert (await call(socket_path, "POST", "/vaults", register))[0] == 409
+        assert (await call(socket_path, "POST", "/vaults", dict(register, user="../evil")))[0] == 400
+        assert (await call(socket_path, "POST", "/sessions", {"user": "alice", "password": "wrong"}))[0] == 401
+        status, payload = await call(socket_path, "POST", "/sessions",
+                                     {"user": "alice", "password": "alice master password"})
+        assert status == 201
+        # A second unlock of an open vault still checks the password
+        assert (await call(socket_path, "POST", "/sessions", {"user": "alice", "password": "wrong"}))[0] == 401
+        assert (await call(socket_path, "GET", "/entries", token="not a token"))[0] == 401
+        assert (await call(socket_path, "GET", "/entries", token=payload["token"]))[1] == {"sites": []}
+
+    asyncio.run(serve_and(server, socket_path, scenario))
+
+def test_user_names_cannot_share_another_vaults_files(tmp_path):
+    # User "bob.nsv" would get bob.nsv.json, whose log and lock are bob's bob.nsv.log and bob.nsv.lock
+    socket_path = str(tmp_path / "server.sock")
+    server = VaultServer(str(tmp_path / "vaults"), ttl=60, workers=1, extension=".nsv")
+
+    async def scenario():
+        bob = {"user": "bob", "email": "bob@example.com", "password": "bob master password"}
+        assert (await call(socket_path, "POST", "/vaults", bob))[0] == 201
+        token = (await call(socket_path, "POST", "/sessions", bob))[1]["token"]
+        assert (await call(socket_path, "PUT", "/entries/mail", {"password": "pw"}, token))[0] == 200
+
+        status, payload = await call(socket_path, "POST", "/vaults", dict(bob, user="bob.nsv"))
+        assert status == 400 and payload == {"error": "Invalid user name."}
+        assert (await call(socket_path, "POST", "/sessions", dict(bob, user="bob.nsv")))[0] == 400
+        assert not os.path.exists(tmp_path / "vaults" / "bob.nsv.json")
+        assert (await call(socket_path, "GET", "/entries/mail", token=token))[1]["password"] == "pw"
+
+    asyncio.run(serve_and(server, socket_path, scenario))
+
+def test_new_vaults_use_the_kdf_calibrated_at_startup(tmp_path):
+    socket_path = str(tmp_path / "server.sock")
+    server = VaultServer(str(tmp_path / "vaults"), ttl=60, workers=2)
+    kdf = {"algorithm": "pbkdf2-sha256", "iterations": 123000}
+
+    async def scenario():
+        assert server.kdf is not None  # Calibrated before the first request
+        server.kdf = kdf
+        results = await asyncio.gather(*[
+            call(socket_path, "POST", "/vaults", {"user": user, "email": f"{user}@example.com",
+                                                  "password": f"{user} master password"})
+            for user in ("alice", "bob")])
+        assert [status for status, _ in results] == [201, 201]
+
+    asyncio.run(serve_and(server, socket_path, scenario))
+    from storage_backend import open_storage
+    for user in ("alice", "bob"):
+        storage = open_storage(str(tmp_path / "vaults" / f"{user}.json"))
+        assert storage.read_key_metadata()["kdf"] == kdf
+        storage.close()
@@ -0,0 +1,287 @@
+# unlock_agent.py - background agent that keeps unlocked vault keys in memory
+import base64
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+DEFAULT_TTL = 900  # Forget a vault key after 15 idle minutes
+
+# Windows builds of Python may lack Unix domain sockets entirely
+_UnixStreamServer = getattr(socketserver, "UnixStreamServer", object)
+
+def default_socket_path():
+    """Return the agent socket path, overridable with NOSWAG_AGENT_SOCK"""
+    return os.getenv("NOSWAG_AGENT_SOCK") or os.path.join(
+        os.path.expanduser("~"), ".noswag", "agent.sock"
+    )
+
+def agent_supported():
+    """Unix domain sockets are required for the agent"""
+    return hasattr(socket, "AF_UNIX")
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+class UnlockAgent(socketserver.ThreadingMixIn, _UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, ttl=DEFAULT_TTL):
+        self.socket_path = socket_path
+        self.ttl = ttl
+        self.running = True
+        self.timeout = 1
+        self._keys = {}  # vault path -> (CryptoManager, last used)
+        self._keys_lock = threading.Lock()
+        self._last_activity = time.monotonic()
+
+        # Only the owning user may reach the socket
+        directory = os.path.dirname(socket_path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _AgentHandler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(socket_path, 0o600)
+
+    def verify_request(self, request, client_address):
+        """Reject peers running as another user where the OS tells us"""
+        if hasattr(socket, "SO_PEERCRED"):
+            creds = request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+            _, uid, _ = struct.unpack("3i", creds)
+            return uid == os.getuid()
+        return True
+
+    def _crypto(self, vault):
+        """Return the unlocked crypto for a vault and refresh its idle timer"""
+        with self._keys_lock:
+            if vault not in self._keys:
+                raise KeyError(f"Vault is locked: {vault}")
+            crypto, _ = self._keys[vault]
+            self._keys[vault] = (crypto, time.monotonic())
+            return crypto
+
+    def dispatch(self, request):
+        """Answer one request from a client"""
+        from crypto_manager import CryptoManager
+
+        self._last_activity = time.monotonic()
+        op = request.get("op")
+        vault = request.get("vault")
+
+        if op == "status":
+            with self._keys_lock:
+                return {"ok": True, "unlocked": vault in self._keys, "vaults": len(self._keys)}
+        if op == "add":
+            crypto = CryptoManager.from_key(request["key"].encode())
+            with self._keys_lock:
+                self._keys[vault] = (crypto, time.monotonic())
+            return {"ok": True}
+        if op == "lock":
+            with self._keys_lock:
+                if vault is None:
+                    self._keys.clear()
+                else:
+                    self._keys.pop(vault, None)
+            return {"ok": True}
+        if op == "stop":
+            self.running = False
+            return {"ok": True}
+        if op == "encrypt":
+            return {"ok": True, "token": self._crypto(vault).encrypt(request["data"]).decode()}
+        if op == "decrypt":
+            return {"ok": True, "data": self._crypto(vault).decrypt(request["token"])}
+        if op == "index":
+            return {"ok": True, "index": self._crypto(vault).blind_index(request["name"])}
+        if op == "subkey":
+            key = self._crypto(vault).derive_subkey(request["purpose"], request.get("length", 32))
+            return {"ok": True, "key": base64.b64encode(key).decode()}
+        return {"ok": False, "error": f"Unknown operation: {op}"}
+
+    def expire_keys(self):
+        """Forget keys that have been idle longer than the TTL"""
+        now = time.monotonic()
+        with self._keys_lock:
+            for vault in [v for v, (_, used) in self._keys.items() if now - used > self.ttl]:
+                del self._keys[vault]
+            # Nothing left to serve, so the agent goes away too
+            if not self._keys and now - self._last_activity > self.ttl:
+                self.running = False
+
+    def run(self):
+        """Serve requests until stopped or idle"""
+        try:
+            while self.running:
+                self.handle_request()
+                self.expire_keys()
+        finally:
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+class AgentClient:
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path or default_socket_path()
+        self._sock = None
+        self._file = None
+        # One request and its reply at a time, so threads never read each other's replies
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Connect to a running agent; return False if none is listening"""
+        if not agent_supported() or not os.path.exists(self.socket_path):
+            return False
+        try:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(self.socket_path)
+            self._file = self._sock.makefile('rwb')
+            return True
+        except OSError:
+            self.close()
+            return False
+
+    def request(self, op, vault=None, **fields):
+        """Send one request and return the response fields"""
+        if self._file is None:
+            raise ConnectionError("Not connected to the noSwag agent.")
+        fields.update(op=op, vault=vault)
+        with self._lock:
+            self._file.write(json.dumps(fields).encode() + b"\n")
+            self._file.flush()
+            response = json.loads(self._file.readline())
+        if not response.get("ok"):
+            raise ValueError(response.get("error", "Agent request failed"))
+        return response
+
+    def is_unlocked(self, vault):
+        return self.request("status", vault)["unlocked"]
+
+    def add_key(self, vault, key):
+        """Hand a derived vault key to the agent"""
+        self.request("add", vault, key=key.decode())
+
+    def lock(self, vault=None):
+        """Make the agent forget one vault key, or all of them"""
+        self.request("lock", vault)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+class AgentCrypto:
+    """CryptoManager stand-in that forwards key operations to the agent"""
+
+    # Every call is a round trip over one socket, so decrypting on several
+    # threads would only queue them up behind each other
+    thread_safe = False
+
+    def __init__(self, client, vault):
+        self.client = client
+        self.vault = vault
+        self.key = None  # The key never leaves the agent
+
+    def encrypt(self, data):
+        return self.client.request("encrypt", self.vault, data=data)["token"].encode()
+
+    def decrypt(self, token):
+        if isinstance(token, bytes):
+            token = token.decode()
+        return self.client.request("decrypt", self.vault, token=token)["data"]
+
+    def blind_index(self, name):
+        return self.client.request("index", self.vault, name=name)["index"]
+
+    def derive_subkey(self, purpose, length=32):
+        response = self.client.request("subkey", self.vault, purpose=purpose, length=length)
+        return base64.b64decode(response["key"])
+
+def connect_agent():
+    """Return a connected AgentClient, or None if no agent is running"""
+    client = AgentClient()
+    return client if client.connect() else None
+
+def start_agent(ttl=DEFAULT_TTL, socket_path=None):
+    """Launch the agent as a detached background process"""
+    import subprocess
+    socket_path = socket_path or default_socket_path()
+    client = AgentClient(socket_path)
+    if client.connect():
+        client.close()
+        return False  # Already running
+
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--ttl", str(ttl), "--socket", socket_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    # Wait briefly for the socket to appear
+    for _ in range(50):
+        if client.connect():
+            client.close()
+            return True
+        time.sleep(0.1)
+    raise RuntimeError("noSwag agent did not start.")
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="noSwag unlock agent")
+    parser.add_argument("command", choices=["start", "stop", "status", "lock", "serve"])
+    parser.add_argument("--ttl", type=int, default=DEFAULT_TTL, help="idle seconds before keys are forgotten")
+    parser.add_argument("--socket", default=None, help="socket path")
+    args = parser.parse_args()
+
+    if not agent_supported():
+        print("The noSwag agent needs Unix domain sockets, which this system lacks.")
+        return 1
+
+    socket_path = args.socket or default_socket_path()
+    if args.command == "serve":
+        UnlockAgent(socket_path, args.ttl).run()
+        return 0
+    if args.command == "start":
+        if start_agent(args.ttl, socket_path):
+            print(f"noSwag agent started ({socket_path}).")
+        else:
+            print("noSwag agent is already running.")
+        return 0
+
+    client = AgentClient(socket_path)
+    if not client.connect():
+        print("noSwag agent is not running.")
+        return 0 if args.command == "stop" else 1
+    try:
+        if args.command == "status":
+            print(f"noSwag agent is running with {client.request('status')['vaults']} unlocked vault(s).")
+        elif args.command == "lock":
+            client.lock()
+            print("All vault keys forgotten.")
+        elif args.command == "stop":
+            client.request("stop")
+            print("noSwag agent stopped.")
+    finally:
+        client.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
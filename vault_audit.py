@@ -0,0 +1,136 @@
+# vault_audit.py - finds reused, weak and old passwords across a vault in one pass
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+from breach_corpus import default_corpus, sha1_hex
+from password_generator import PasswordGenerator
+from vault_file import atomic_write
+
+DEFAULT_MAX_AGE_DAYS = 365
+# Entries scoring below this on the 0-4 strength scale are reported as weak
+DEFAULT_MIN_SCORE = 3
+
+# Bump when strength scoring changes, so cached scores are recomputed
+SCORE_VERSION = 1
+
+class VaultAudit:
+    def __init__(self, storage, max_age_days=DEFAULT_MAX_AGE_DAYS, min_score=DEFAULT_MIN_SCORE):
+        self.storage = storage
+        self.max_age_days = max_age_days
+        self.min_score = min_score
+
+    def _cache_path(self):
+        return self.storage._sidecar_path(".audit")
+
+    def _load_scores(self, crypto):
+        """Read the encrypted strength scores kept from earlier audits"""
+        try:
+            with open(self._cache_path(), 'rb') as f:
+                cache = json.loads(crypto.decrypt(f.read()))
+        except Exception:
+            # Missing, damaged or from another vault key: scores are just recomputed
+            return {}
+        return cache.get("scores", {}) if cache.get("version") == SCORE_VERSION else {}
+
+    def _save_scores(self, crypto, scores):
+        payload = json.dumps({"version": SCORE_VERSION, "scores": scores})
+        atomic_write(self._cache_path(), crypto.encrypt(payload))
+
+    def run(self):
+        """Decrypt every entry once and return the audit report"""
+        started = time.perf_counter()
+        crypto = self.storage.crypto
+        key = crypto.derive_subkey("noswag-audit")
+        cached = self._load_scores(crypto)
+        scores = {}
+        generator = PasswordGenerator()
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+
+        # Keyed hashes group equal passwords without keeping them as dict keys
+        groups = {}
+        breach_hashes = {}  # keyed hash -> SHA-1 for the breach corpus
+        corpus = default_corpus()
+        weak = []
+        old = []
+        total = 0
+        scored = 0
+        for site, entry in self.storage.iter_entries():
+            total += 1
+            password = entry.get("password", "")
+            username = entry.get("username", "")
+            digest = hmac.new(key, password.encode(), hashlib.sha256).hexdigest()
+            groups.setdefault(digest, []).append(site)
+            if corpus is not None and digest not in breach_hashes:
+                breach_hashes[digest] = sha1_hex(password)
+
+            # Scores depend on the site and username too (they are guessable inputs)
+            score_key = hmac.new(key, json.dumps([password, site, username]).encode(),
+                                 hashlib.sha256).hexdigest()
+            result = scores.get(score_key) or cached.get(score_key)
+            if result is None:
+                # Breaches are checked below in one batch, and never cached
+                strength = generator.check_password_strength(password, (site, username), breach_count=0)
+                result = [strength["score"], strength["feedback"][:1]]
+                scored += 1
+            scores[score_key] = result
+            if result[0] < self.min_score:
+                weak.append({"site": site, "score": result[0],
+                             "feedback": result[1][0] if result[1] else ""})
+
+            modified = entry.get("modified") or entry.get("created")
+            if modified and modified < cutoff:
+                old.append({"site": site, "modified": modified})
+
+        # Keep only scores of current entries, so the cache never outgrows the vault
+        if scores.keys() != cached.keys():
+            self._save_scores(crypto, scores)
+
+        breached = []
+        if corpus is not None:
+            counts = corpus.counts(breach_hashes.values())
+            for digest, sha1 in breach_hashes.items():
+                if sha1 in counts:
+                    breached += [{"site": site, "count": counts[sha1]} for site in groups[digest]]
+
+        reused = sorted((sorted(sites) for sites in groups.values() if len(sites) > 1),
+                        key=lambda sites: (-len(sites), sites[0]))
+        return {
+            "total": total,
+            "reused": reused,
+            "weak": sorted(weak, key=lambda item: (item["score"], item["site"])),
+            "old": sorted(old, key=lambda item: item["modified"]),
+            "breached": sorted(breached, key=lambda item: (-item["count"], item["site"])),
+            "breach_corpus": corpus.path if corpus is not None else None,
+            "max_age_days": self.max_age_days,
+            "min_score": self.min_score,
+            "scored": scored,
+            "seconds": time.perf_counter() - started,
+        }
+
+def format_report(report):
+    """Render an audit report as readable text"""
+    lines = [f"Audited {report['total']} entries in {report['seconds']:.2f}s"]
+
+    reused_entries = sum(len(sites) for sites in report["reused"])
+    lines.append(f"\nReused passwords: {reused_entries} entries share {len(report['reused'])} passwords")
+    for sites in report["reused"]:
+        lines.append(f"  {len(sites)} sites: {', '.join(sites)}")
+
+    lines.append(f"\nWeak passwords (score below {report['min_score']}/4): {len(report['weak'])}")
+    for item in report["weak"]:
+        hint = f" - {item['feedback']}" if item["feedback"] else ""
+        lines.append(f"  {item['site']} (score {item['score']}/4){hint}")
+
+    if report["breach_corpus"] is None:
+        lines.append("\nBreached passwords: not checked (set NOSWAG_BREACH_CORPUS to a downloaded corpus)")
+    else:
+        lines.append(f"\nBreached passwords: {len(report['breached'])}")
+        for item in report["breached"]:
+            lines.append(f"  {item['site']} (seen {item['count']:,} times)")
+
+    lines.append(f"\nNot changed in over {report['max_age_days']} days: {len(report['old'])}")
+    for item in report["old"]:
+        lines.append(f"  {item['site']} (last changed {item['modified'][:10]})")
+    return "\n".join(lines)
@@ -0,0 +1,107 @@
+# vault_backup.py - chunked, encrypted vault backups that stream in both directions
+import base64
+import json
+import os
+import struct
+from crypto_manager import CryptoManager, calibrate_kdf
+
+MAGIC = b"NSWGBAK1"
+DEFAULT_CHUNK_SIZE = 500
+
+# File layout: [magic][length][header JSON] then [length][Fernet token]
+# chunks, ending with a chunk that marks the end of the backup. Chunks
+# are numbered inside the ciphertext, so dropped, reordered or truncated
+# chunks are detected on restore.
+_LENGTH = struct.Struct(">I")
+
+class VaultBackup:
+    def __init__(self, password, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.password = password
+        self.chunk_size = chunk_size
+
+    def _write_block(self, f, data):
+        f.write(_LENGTH.pack(len(data)))
+        f.write(data)
+
+    def _read_block(self, f):
+        header = f.read(_LENGTH.size)
+        if len(header) < _LENGTH.size:
+            raise ValueError("Backup file is truncated.")
+        (length,) = _LENGTH.unpack(header)
+        data = f.read(length)
+        if len(data) < length:
+            raise ValueError("Backup file is truncated.")
+        return data
+
+    def write(self, path, entries):
+        """Stream (site, entry) pairs into an encrypted backup; return the count"""
+        crypto = CryptoManager(kdf=calibrate_kdf())
+        crypto.set_master_password(self.password)
+        header = {
+            "version": 1,
+            "salt": crypto.get_salt_b64(),
+            "kdf": crypto.kdf,
+            "wrapped_key": crypto.wrapped_key.decode(),
+        }
+
+        count = 0
+        sequence = 0
+        # Owner-only permissions from the moment the file exists
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            self._write_block(f, json.dumps(header).encode())
+
+            chunk = []
+            for site, entry in entries:
+                chunk.append(dict(entry, site=site))
+                if len(chunk) >= self.chunk_size:
+                    self._write_block(f, crypto.encrypt(json.dumps({"seq": sequence, "entries": chunk})))
+                    count += len(chunk)
+                    sequence += 1
+                    chunk = []
+            if chunk:
+                self._write_block(f, crypto.encrypt(json.dumps({"seq": sequence, "entries": chunk})))
+                count += len(chunk)
+                sequence += 1
+
+            trailer = {"seq": sequence, "end": True, "count": count}
+            self._write_block(f, crypto.encrypt(json.dumps(trailer)))
+        return count
+
+    def read_chunks(self, path):
+        """Yield lists of (site, entry) pairs, one decrypted chunk at a time"""
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("Not a noSwag backup file.")
+            header = json.loads(self._read_block(f))
+            crypto = CryptoManager(
+                self.password,
+                base64.b64decode(header["salt"]),
+                header["kdf"],
+                header["wrapped_key"].encode()
+            )
+
+            sequence = 0
+            count = 0
+            while True:
+                chunk = json.loads(crypto.decrypt(self._read_block(f)))
+                if chunk["seq"] != sequence:
+                    raise ValueError("Backup chunks are out of order or missing.")
+                sequence += 1
+                if chunk.get("end"):
+                    if chunk["count"] != count:
+                        raise ValueError("Backup entry count does not match.")
+                    return
+
+                entries = []
+                for record in chunk["entries"]:
+                    site = record.pop("site")
+                    entries.append((site, record))
+                count += len(entries)
+                yield entries
+
+    def read(self, path):
+        """Yield (site, entry) pairs from a backup, one at a time"""
+        for chunk in self.read_chunks(path):
+            yield from chunk
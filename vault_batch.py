@@ -0,0 +1,200 @@
+# vault_batch.py - verify, migrate and re-key many vault files across worker processes
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cryptography.fernet import InvalidToken
+
+from crypto_manager import DEFAULT_TARGET_MS, calibrate_kdf, crypto_from_metadata, describe_kdf
+from storage_backend import SQLITE_EXTENSIONS, open_storage
+from vault_backup import MAGIC as BACKUP_MAGIC, VaultBackup
+
+JOBS = ("verify", "migrate", "rotate-kdf")
+
+def _is_backup(path):
+    with open(path, 'rb') as f:
+        return f.read(len(BACKUP_MAGIC)) == BACKUP_MAGIC
+
+def _unlock(path, password, read_only=False):
+    """Open and unlock a vault; return (storage, seconds spent deriving its key)"""
+    storage = open_storage(path)
+    if not storage.user_exists():
+        raise ValueError("No vault found.")
+    start = time.perf_counter()
+    # Unlocked directly rather than through load_user_data, which may
+    # re-wrap the key; a read-only unlock also skips last login, log repair
+    # and re-indexing, so verifying a vault never writes to it
+    crypto = crypto_from_metadata(storage.read_key_metadata(), password)
+    kdf_seconds = time.perf_counter() - start
+    if storage.unlock_with(crypto, read_only) is None:
+        storage.close()
+        raise InvalidToken()
+    return storage, kdf_seconds
+
+def _verify(path, password, result):
+    if _is_backup(path):
+        # Every chunk is authenticated, so reading the backup through is the check
+        result["entries"] = sum(len(chunk) for chunk in VaultBackup(password).read_chunks(path))
+        return
+    storage, result["kdf_seconds"] = _unlock(path, password, read_only=True)
+    try:
+        result["entries"] = sum(1 for _ in storage.iter_entries())
+    finally:
+        storage.close()
+
+def _migrate(path, password, result, extension, kdf):
+    base, _ = os.path.splitext(path)
+    target_path = base + extension
+    if os.path.exists(target_path):
+        raise ValueError(f"{target_path} already exists.")
+    storage, result["kdf_seconds"] = _unlock(path, password, read_only=True)
+    try:
+        if hasattr(storage, "convert") and not target_path.lower().endswith(SQLITE_EXTENSIONS):
+            # Same key, same records: only the file layout changes
+            storage.convert(target_path).close()
+            result["entries"] = sum(1 for _ in storage.iter_entries())
+        else:
+            target = open_storage(target_path)
+            target.initialize_new_user(storage.get_user_email(), password, kdf)
+            try:
+                with target.transaction() as txn:
+                    for site, entry in storage.iter_entries():
+                        txn.put_entry(site, entry)
+                result["entries"] = len(txn)
+            finally:
+                target.close()
+    finally:
+        storage.close()
+    result["target"] = target_path
+
+def _rotate_kdf(path, password, result, kdf):
+    storage, result["kdf_seconds"] = _unlock(path, password)
+    try:
+        storage.change_master_password(password, kdf)
+    finally:
+        storage.close()
+
+def run_job(job, path, password, options):
+    """Run one job on one vault; a plain function, so it can run in a worker process"""
+    result = {"job": job, "path": path, "ok": False, "error": None,
+              "entries": None, "kdf_seconds": None, "seconds": 0.0}
+    start = time.perf_counter()
+    try:
+        if job == "verify":
+            _verify(path, password, result)
+        elif job == "migrate":
+            _migrate(path, password, result, options["extension"], options["kdf"])
+        elif job == "rotate-kdf":
+            _rotate_kdf(path, password, result, options["kdf"])
+        else:
+            raise ValueError(f"Unknown job: {job}")
+        result["ok"] = True
+    except InvalidToken:
+        result["error"] = "wrong password or damaged file"
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+class VaultBatch:
+    """Runs one job over many vaults, each vault in its own worker process"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+
+    def run(self, job, vaults, on_result=None, **options):
+        """Run job on [(path, password), ...]; return the results in the order given"""
+        if job not in JOBS:
+            raise ValueError(f"Unknown job: {job}")
+        if job == "migrate" and options.get("extension") not in (".json", ".nsv", ".db"):
+            raise ValueError("migrate needs an extension of .json, .nsv or .db.")
+        if job in ("rotate-kdf", "migrate") and options.get("kdf") is None:
+            # Calibrated once here, also for migrations that create a new
+            # vault: workers timing the KDF side by side would share the
+            # CPU and pick parameters that are too weak
+            algorithm = options.get("algorithm") or os.getenv("NOSWAG_KDF", "pbkdf2-sha256")
+            target_ms = options.get("target_ms") or int(os.getenv("NOSWAG_KDF_TARGET_MS", DEFAULT_TARGET_MS))
+            options["kdf"] = calibrate_kdf(algorithm, target_ms)
+
+        results = [None] * len(vaults)
+        # Spawned rather than forked, so workers never inherit a lock held by another thread
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(min(self.workers, max(len(vaults), 1)), mp_context=context) as pool:
+            futures = {pool.submit(run_job, job, path, password, options): i
+                       for i, (path, password) in enumerate(vaults)}
+            for done, future in enumerate(as_completed(futures), 1):
+                result = results[futures[future]] = future.result()
+                if on_result is not None:
+                    on_result(done, len(vaults), result)
+        return results
+
+def format_result(done, total, result):
+    """Render one progress line"""
+    status = "ok" if result["ok"] else f"FAILED: {result['error']}"
+    details = []
+    if result["entries"] is not None:
+        details.append(f"{result['entries']} entries")
+    if result["kdf_seconds"] is not None:
+        details.append(f"key {result['kdf_seconds']:.2f}s")
+    details.append(f"total {result['seconds']:.2f}s")
+    if result.get("target"):
+        details.append(f"-> {result['target']}")
+    return f"[{done}/{total}] {result['path']}: {status} ({', '.join(details)})"
+
+def main():
+    import argparse
+    import getpass
+    parser = argparse.ArgumentParser(description="Verify, migrate or re-key many noSwag vaults in parallel")
+    parser.add_argument("job", choices=JOBS,
+                        help="verify: decrypt every entry (vaults or backups); migrate: convert to --to; "
+                             "rotate-kdf: re-wrap keys under freshly calibrated KDF parameters")
+    parser.add_argument("paths", nargs="+", help="vault or backup files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPUs)")
+    parser.add_argument("--to", dest="extension", choices=[".json", ".nsv", ".db"],
+                        help="target format for migrate; files are written next to the originals")
+    parser.add_argument("--kdf", default=os.getenv("NOSWAG_KDF", "pbkdf2-sha256"),
+                        choices=["pbkdf2-sha256", "scrypt"],
+                        help="algorithm for rotate-kdf and for vaults migrate creates")
+    parser.add_argument("--target-ms", type=int, default=int(os.getenv("NOSWAG_KDF_TARGET_MS", DEFAULT_TARGET_MS)),
+                        help="unlock time to calibrate rotate-kdf and migrate for")
+    parser.add_argument("--each", action="store_true", help="ask for a password per file instead of one for all")
+    args = parser.parse_args()
+    if args.job == "migrate" and not args.extension:
+        parser.error("migrate needs --to")
+
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        print(f"Not found: {', '.join(missing)}")
+        return 1
+    if args.each:
+        vaults = [(path, getpass.getpass(f"Password for {path}: ")) for path in args.paths]
+    else:
+        password = getpass.getpass("Password (used for every file): ")
+        vaults = [(path, password) for path in args.paths]
+
+    options = {}
+    if args.job == "migrate":
+        options["extension"] = args.extension
+    if args.job in ("migrate", "rotate-kdf"):
+        options["kdf"] = calibrate_kdf(args.kdf, args.target_ms)
+    if args.job == "rotate-kdf":
+        print(f"Re-wrapping keys with {describe_kdf(options['kdf'])}.")
+
+    batch = VaultBatch(args.workers)
+    start = time.perf_counter()
+    results = batch.run(args.job, vaults, lambda done, total, result: print(format_result(done, total, result)),
+                        **options)
+    elapsed = time.perf_counter() - start
+
+    failed = sum(not result["ok"] for result in results)
+    busy = sum(result["seconds"] for result in results)
+    # busy / elapsed is how many vaults were being worked on at once, on average
+    print(f"{len(results) - failed} of {len(results)} done in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.1f} vaults/s, {busy / elapsed:.1f} running at once, "
+          f"{batch.workers} max).")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# vault_container.py - compact binary vault file, an alternative to data.json
+import base64
+import json
+import mmap
+import os
+import struct
+import sys
+from itertools import accumulate
+from vault_file import atomic_write
+
+MAGIC = b"NSWGVLT\x00"
+CONTAINER_VERSION = 1
+CONTAINER_EXTENSIONS = (".nsv",)
+
+# Fixed header: magic, container version, KDF id, three KDF parameters
+# (PBKDF2: iterations, 0, 0 / scrypt: n, r, p) and the 16-byte salt.
+# Then a length-prefixed JSON block for the remaining metadata and user
+# fields, and the records in columns: a record count, every 32-byte
+# record id (the blind index digest), every ciphertext length, and the
+# raw ciphertexts back to back. Fernet tokens are stored without their
+# base64 layer, and the columns parse with a handful of slicing calls.
+_HEADER = struct.Struct(">8sHBIII16s")
+_LENGTH = struct.Struct(">I")
+RECORD_ID_SIZE = 32
+
+KDF_IDS = {"pbkdf2-sha256": 1, "scrypt": 2}
+KDF_NAMES = {value: key for key, value in KDF_IDS.items()}
+
+def is_container(path):
+    """Check whether a file starts with the container magic"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return path.lower().endswith(CONTAINER_EXTENSIONS)
+
+def _kdf_fields(kdf):
+    if kdf["algorithm"] == "scrypt":
+        return KDF_IDS["scrypt"], kdf["n"], kdf["r"], kdf["p"]
+    return KDF_IDS["pbkdf2-sha256"], kdf["iterations"], 0, 0
+
+def _kdf_dict(kdf_id, a, b, c):
+    if KDF_NAMES.get(kdf_id) == "scrypt":
+        return {"algorithm": "scrypt", "n": a, "r": b, "p": c}
+    return {"algorithm": "pbkdf2-sha256", "iterations": a}
+
+def token_of(record):
+    """Return the Fernet token for a record held as a token or as raw ciphertext"""
+    if isinstance(record, bytes):
+        return base64.urlsafe_b64encode(record).decode()
+    return record
+
+def raw_of(record):
+    """Return the raw ciphertext for a record held as a token or as raw ciphertext"""
+    if isinstance(record, bytes):
+        return record
+    return base64.urlsafe_b64decode(record)
+
+def encode_container(data):
+    """Serialize a 2.0 vault document into container bytes"""
+    metadata = dict(data["metadata"])
+    if "records" not in data:
+        raise ValueError("Only 2.0 vaults can be stored in a container; upgrade first.")
+
+    salt = base64.b64decode(metadata.pop("salt"))
+    kdf = metadata.pop("kdf", None) or {
+        "algorithm": "pbkdf2-sha256",
+        "iterations": metadata.pop("iterations", 100000)
+    }
+    block = json.dumps({"metadata": metadata, "user": data["user"]}, separators=(",", ":")).encode()
+
+    records = data["records"]
+    record_ids = b"".join(bytes.fromhex(record_id) for record_id in records)
+    if len(record_ids) != RECORD_ID_SIZE * len(records):
+        raise ValueError("Vault records must be keyed by blind index; log in once to re-key them.")
+    ciphertexts = [raw_of(record) for record in records.values()]
+
+    return b"".join([
+        _HEADER.pack(MAGIC, CONTAINER_VERSION, *_kdf_fields(kdf), salt),
+        _LENGTH.pack(len(block)),
+        block,
+        _LENGTH.pack(len(records)),
+        record_ids,
+        struct.pack(f">{len(ciphertexts)}I", *map(len, ciphertexts)),
+    ] + ciphertexts)
+
+def decode_container(buffer):
+    """Parse container bytes (or an mmap) back into a vault document"""
+    magic, version, kdf_id, a, b, c, salt = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a noSwag vault container.")
+    if version > CONTAINER_VERSION:
+        raise ValueError(f"Unsupported container version: {version}")
+
+    pos = _HEADER.size
+    (length,) = _LENGTH.unpack_from(buffer, pos)
+    pos += _LENGTH.size
+    block = json.loads(bytes(buffer[pos:pos + length]))
+    pos += length
+
+    metadata = block["metadata"]
+    metadata["salt"] = base64.b64encode(salt).decode()
+    metadata["kdf"] = _kdf_dict(kdf_id, a, b, c)
+
+    (count,) = _LENGTH.unpack_from(buffer, pos)
+    pos += _LENGTH.size
+    record_ids = buffer[pos:pos + RECORD_ID_SIZE * count].hex()
+    pos += RECORD_ID_SIZE * count
+    lengths = struct.unpack_from(f">{count}I", buffer, pos)
+    pos += _LENGTH.size * count
+
+    # Records stay raw ciphertext; token_of() re-adds the base64 layer
+    # only for the records that actually get decrypted
+    width = RECORD_ID_SIZE * 2
+    ends = list(accumulate(lengths, initial=pos))
+    records = {
+        record_ids[i * width:(i + 1) * width]: buffer[ends[i]:ends[i + 1]]
+        for i in range(count)
+    }
+
+    return {"metadata": metadata, "user": block["user"], "records": records}
+
+def read_container(path):
+    """Read a container through a memory map instead of parsing JSON text"""
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return decode_container(mm)
+
+def write_container(path, data):
+    """Atomically write a vault document as a container"""
+    atomic_write(path, encode_container(data))
+
+def main():
+    import argparse
+    import getpass
+    parser = argparse.ArgumentParser(description="Convert a noSwag vault between data.json and the binary container")
+    parser.add_argument("source", help="existing vault, e.g. data.json")
+    parser.add_argument("target", help="new vault, e.g. data.nsv (or .json to convert back)")
+    args = parser.parse_args()
+
+    from storage_manager import StorageManager
+    if os.path.exists(args.target):
+        print(f"{args.target} already exists; refusing to overwrite it.")
+        return 1
+
+    storage = StorageManager(args.source)
+    if storage.load_user_data(getpass.getpass("Enter master password: ")) is None:
+        return 1
+    storage.convert(args.target)
+    print(f"Converted {args.source} ({os.path.getsize(args.source)} bytes) "
+          f"to {args.target} ({os.path.getsize(args.target)} bytes).")
+    print(f"Set NOSWAG_VAULT={args.target} to use it, then remove {args.source}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
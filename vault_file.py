@@ -0,0 +1,111 @@
+# vault_file.py - crash-safe writes and advisory locking for vault files
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; locking becomes a no-op there
+    fcntl = None
+
+LOCK_SH = getattr(fcntl, "LOCK_SH", 0)
+LOCK_EX = getattr(fcntl, "LOCK_EX", 0)
+LOCK_UN = getattr(fcntl, "LOCK_UN", 0)
+
+def atomic_write(path, payload):
+    """Replace path with payload so readers see either the old or the new file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".noswag-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Make the rename itself durable
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class VaultFileLock:
+    """Reentrant advisory lock: shared for readers, exclusive for one writer"""
+
+    def __init__(self, path):
+        # A separate lock file, since atomic_write replaces the vault's inode
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+        self._exclusive = False
+
+    def _flock(self, operation):
+        if fcntl is not None:
+            fcntl.flock(self._fd, operation)
+
+    def acquire(self, exclusive=False):
+        """Take the lock, upgrading a held shared lock if exclusive is asked for"""
+        self._thread_lock.acquire()
+        upgraded = False
+        try:
+            if self._depth == 0:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                self._flock(LOCK_EX if exclusive else LOCK_SH)
+                self._exclusive = exclusive
+            elif exclusive and not self._exclusive:
+                self._flock(LOCK_EX)
+                self._exclusive = upgraded = True
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._depth += 1
+        return upgraded
+
+    def release(self, upgraded=False):
+        """Drop one level of the lock, downgrading an upgrade taken by acquire"""
+        try:
+            self._depth -= 1
+            if self._depth == 0:
+                self._flock(LOCK_UN)
+                self._exclusive = False
+            elif upgraded:
+                self._flock(LOCK_SH)
+                self._exclusive = False
+        finally:
+            self._thread_lock.release()
+
+    def shared(self):
+        """Context manager for reading: other readers may hold it too"""
+        return _LockHold(self, False)
+
+    def exclusive(self):
+        """Context manager for writing: no other process reads or writes meanwhile"""
+        return _LockHold(self, True)
+
+    def close(self):
+        """Close the lock file; the lock must not be held"""
+        with self._thread_lock:
+            if self._fd is not None and self._depth == 0:
+                os.close(self._fd)
+                self._fd = None
+
+class _LockHold:
+    def __init__(self, lock, exclusive):
+        self.lock = lock
+        self.exclusive = exclusive
+        self.upgraded = False
+
+    def __enter__(self):
+        self.upgraded = self.lock.acquire(self.exclusive)
+        return self.lock
+
+    def __exit__(self, *exc):
+        self.lock.release(self.upgraded)
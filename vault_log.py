@@ -0,0 +1,112 @@
+# vault_log.py - append-only log of encrypted vault records
+import hashlib
+import hmac
+import os
+import struct
+
+OP_PUT = b"P"
+OP_DELETE = b"D"
+OP_BATCH = b"B"
+
+# Frame layout: [payload length][payload][HMAC-SHA256 of length + payload]
+# Payload layout: [op][record id length][record id][record token]
+# A batch payload carries [length][payload] pairs for several operations
+# in one frame, so they survive or vanish together on a crash
+_LENGTH = struct.Struct(">I")
+MAC_SIZE = 32
+
+class VaultLog:
+    def __init__(self, file_path, mac_key):
+        self.file_path = file_path
+        self.mac_key = mac_key
+
+    def _mac(self, header, payload):
+        """Authenticate a frame so torn or tampered records are detected"""
+        return hmac.new(self.mac_key, header + payload, hashlib.sha256).digest()
+
+    def _payload(self, op, record_id, token):
+        """Serialize one operation"""
+        rid = record_id.encode()
+        return op + bytes([len(rid)]) + rid + token
+
+    def _parse(self, payload):
+        """Split a payload back into (op, record_id, token)"""
+        rid_end = 2 + payload[1]
+        return payload[:1], payload[2:rid_end].decode(), payload[rid_end:]
+
+    def _frame(self, payload):
+        """Wrap a payload with its length and MAC"""
+        header = _LENGTH.pack(len(payload))
+        return header + payload + self._mac(header, payload)
+
+    def append(self, op, record_id, token=b""):
+        """Durably append a put or delete operation and return the frame size"""
+        return self._write(self._frame(self._payload(op, record_id, token)))
+
+    def append_batch(self, operations):
+        """Durably append (op, record_id, token) operations as one atomic frame"""
+        body = b"".join(
+            _LENGTH.pack(len(payload)) + payload
+            for payload in (self._payload(*operation) for operation in operations)
+        )
+        return self._write(self._frame(self._payload(OP_BATCH, "", body)))
+
+    def _write(self, frame):
+        """Append a frame with a single write and fsync"""
+        # Owner-only, like the snapshot atomic_write creates next to it
+        fd = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        with os.fdopen(fd, 'ab') as f:
+            f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(frame)
+
+    def read(self, offset=0):
+        """Yield (op, record_id, token, end_offset) for each operation in intact frames after offset"""
+        if not os.path.exists(self.file_path):
+            return
+            
+        with open(self.file_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        
+        pos = 0
+        while pos + _LENGTH.size <= len(data):
+            (length,) = _LENGTH.unpack_from(data, pos)
+            end = pos + _LENGTH.size + length + MAC_SIZE
+            if end > len(data):
+                break  # Torn tail record
+            
+            header = data[pos:pos + _LENGTH.size]
+            payload = data[pos + _LENGTH.size:end - MAC_SIZE]
+            if not hmac.compare_digest(data[end - MAC_SIZE:end], self._mac(header, payload)):
+                break  # Corrupt record, nothing after it can be trusted
+            
+            pos = end
+            op, record_id, token = self._parse(payload)
+            if op != OP_BATCH:
+                yield op, record_id, token, offset + pos
+                continue
+            
+            inner = 0
+            while inner < len(token):
+                (length,) = _LENGTH.unpack_from(token, inner)
+                inner += _LENGTH.size
+                yield self._parse(token[inner:inner + length]) + (offset + pos,)
+                inner += length
+
+    def size(self):
+        """Return the current log size in bytes"""
+        try:
+            return os.path.getsize(self.file_path)
+        except FileNotFoundError:
+            return 0
+
+    def truncate(self, offset=0):
+        """Cut the log at offset, dropping a torn tail or compacted records"""
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r+b') as f:
+            f.truncate(offset)
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,379 @@
+# vault_server.py - serves many users' vaults from one directory over a local HTTP/JSON API
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import re
+import secrets
+import signal
+import socket
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import unquote
+
+from breach_corpus import breached_sites
+from crypto_manager import DEFAULT_TARGET_MS, CryptoManager, calibrate_kdf, unwrap_data_key
+from storage_backend import open_storage
+
+DEFAULT_TTL = 900           # Forget a session's key after 15 idle minutes
+DEFAULT_PORT = 8750
+VAULT_EXTENSIONS = (".json", ".nsv", ".db")
+MAX_BODY = 1024 * 1024
+
+# User names become file names, so only plain ones are accepted; no dots,
+# as user "bob.nsv" (bob.nsv.json) would share bob.nsv's log and lock files
+USER_PATTERN = re.compile(r"^[A-Za-z0-9_@-]{1,64}$")
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+def default_socket_path():
+    """Return the server socket path, overridable with NOSWAG_SERVER_SOCK"""
+    return os.getenv("NOSWAG_SERVER_SOCK") or os.path.join(
+        os.path.expanduser("~"), ".noswag", "server.sock"
+    )
+
+def _create_vault(path, email, master_password, kdf):
+    """Create a vault file; runs in a worker process because it derives a key"""
+    return open_storage(path).initialize_new_user(email, master_password, kdf)
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Session:
+    def __init__(self, user, ttl):
+        self.user = user
+        self.ttl = ttl
+        self.last_used = time.monotonic()
+
+    def expired(self, now):
+        return now - self.last_used > self.ttl
+
+class Vault:
+    """An open vault: its storage, the thread running its calls and the sessions using it"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        # One thread per vault runs its calls one at a time; SQLite
+        # connections may only be used by the thread that opened them
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="noswag-vault")
+        self.sessions = 0
+
+    async def call(self, func, *args):
+        """Run a blocking storage call on the vault's thread, off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def close(self):
+        """Close the storage, forgetting its key, and stop the vault's thread"""
+        try:
+            await self.call(self.storage.close)
+        finally:
+            self.executor.shutdown(wait=False)
+
+class VaultServer:
+    def __init__(self, directory, ttl=DEFAULT_TTL, workers=None, extension=".json", kdf=None):
+        if extension not in VAULT_EXTENSIONS:
+            raise ValueError(f"Vault format must be one of {', '.join(VAULT_EXTENSIONS)}.")
+        self.directory = directory
+        self.extension = extension  # Format of newly registered vaults
+        self.ttl = ttl
+        self.workers = workers
+        self.kdf = kdf  # KDF parameters of new vaults; calibrated when serving starts
+        self._pool = None
+        self._vaults = {}    # user -> Vault, only while a session holds its key
+        self._sessions = {}  # token -> Session
+        self._opening = {}   # user -> asyncio.Lock, so one unlock at a time opens the vault
+
+    def vault_path(self, user):
+        """Return the vault file of a user; existing files keep whatever format they have"""
+        if not isinstance(user, str) or not USER_PATTERN.match(user):
+            raise HTTPError(400, "Invalid user name.")
+        for extension in VAULT_EXTENSIONS:
+            path = os.path.join(self.directory, user + extension)
+            if os.path.exists(path):
+                return path
+        return os.path.join(self.directory, user + self.extension)
+
+    async def _in_pool(self, func, *args):
+        """Run CPU-heavy key derivation in a worker process, so other users are not stalled"""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    # Operations
+
+    async def register(self, user, email, password):
+        path = self.vault_path(user)
+        if os.path.exists(path):
+            raise HTTPError(409, "A vault for this user already exists.")
+        if not email or not password or len(password) < 8:
+            raise HTTPError(400, "An email and a master password of at least 8 characters are required.")
+        async with self._opening.setdefault(user, asyncio.Lock()):
+            if os.path.exists(path):
+                raise HTTPError(409, "A vault for this user already exists.")
+            await self._in_pool(_create_vault, path, email, password, self.kdf)
+        return {"user": user}
+
+    async def unlock(self, user, password):
+        path = self.vault_path(user)
+        if not os.path.exists(path) or not isinstance(password, str):
+            raise HTTPError(401, "Unknown user or wrong master password.")
+
+        async with self._opening.setdefault(user, asyncio.Lock()):
+            vault = self._vaults.get(user)
+            if vault is not None:
+                await self._check_password(vault, password)
+            else:
+                vault = Vault(open_storage(path))
+                try:
+                    key, salt = await self._check_password(vault, password)
+                    # Entries are only ever decrypted with the key checked here
+                    if await vault.call(vault.storage.unlock_with, CryptoManager.from_key(key, salt)) is None:
+                        raise HTTPError(401, "Unknown user or wrong master password.")
+                except BaseException:
+                    await vault.close()
+                    raise
+                self._vaults[user] = vault
+
+            token = secrets.token_urlsafe(32)
+            self._sessions[token] = Session(user, self.ttl)
+            vault.sessions += 1
+        return {"token": token, "expires_in": self.ttl}
+
+    async def _check_password(self, vault, password):
+        """Derive the data key from password in a worker process; return (key, salt)"""
+        metadata = await vault.call(vault.storage.read_key_metadata)
+        try:
+            key = await self._in_pool(unwrap_data_key, metadata, password)
+        except Exception:
+            raise HTTPError(401, "Unknown user or wrong master password.")
+        if vault.storage.crypto is not None and key != vault.storage.crypto.key:
+            raise HTTPError(401, "Unknown user or wrong master password.")
+        return key, base64.b64decode(metadata["salt"])
+
+    async def lock(self, token):
+        session = self._sessions.pop(token, None)
+        if session is not None:
+            await self._release(session.user)
+        return {}
+
+    async def _release(self, user):
+        """Drop a session's hold on its vault; the last one closes it and forgets the key"""
+        # Taken like unlock does, so a vault is never closed under a session being opened
+        async with self._opening.setdefault(user, asyncio.Lock()):
+            vault = self._vaults.get(user)
+            if vault is None:
+                return
+            vault.sessions -= 1
+            if vault.sessions <= 0:
+                del self._vaults[user]
+                await vault.close()
+
+    def _session(self, headers):
+        auth = headers.get("authorization", "")
+        token = auth[7:] if auth.lower().startswith("bearer ") else None
+        session = self._sessions.get(token)
+        if session is None or session.expired(time.monotonic()):
+            raise HTTPError(401, "Session expired or unknown; unlock the vault again.")
+        session.last_used = time.monotonic()
+        return token, self._vaults[session.user]
+
+    async def expire_sessions(self):
+        """Forget idle sessions, and the keys of vaults no session uses any more"""
+        while True:
+            await asyncio.sleep(min(self.ttl, 30))
+            now = time.monotonic()
+            for token, session in list(self._sessions.items()):
+                if session.expired(now):
+                    del self._sessions[token]
+                    await self._release(session.user)
+
+    # HTTP
+
+    async def dispatch(self, method, path, headers, body):
+        """Route one request; returns (status, payload)"""
+        parts = [unquote(part) for part in path.split("?", 1)[0].strip("/").split("/")]
+        try:
+            request = json.loads(body) if body else {}
+        except ValueError:
+            raise HTTPError(400, "The request body is not valid JSON.")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "The request body must be a JSON object.")
+
+        if parts == ["status"] and method == "GET":
+            return 200, {"vaults": len(self._vaults), "sessions": len(self._sessions)}
+        if parts == ["vaults"] and method == "POST":
+            return 201, await self.register(request.get("user"), request.get("email"), request.get("password"))
+        if parts == ["sessions"] and method == "POST":
+            return 201, await self.unlock(request.get("user"), request.get("password"))
+
+        token, vault = self._session(headers)
+        storage = vault.storage
+        if parts == ["sessions"] and method == "DELETE":
+            return 200, await self.lock(token)
+        if parts == ["entries"] and method == "GET":
+            return 200, {"sites": sorted(await vault.call(storage.list_sites))}
+        if len(parts) == 2 and parts[0] == "entries":
+            site = parts[1]
+            if method == "GET":
+                entry = await vault.call(storage.get_password, site)
+                if entry is None:
+                    raise HTTPError(404, f"No password found for '{site}'.")
+                return 200, dict(entry, site=site)
+            if method == "PUT":
+                if not isinstance(request.get("password"), str) or not request["password"]:
+                    raise HTTPError(400, "A password is required.")
+                await vault.call(storage.save_password, site, request.get("username", ""),
+                                 request["password"], request.get("notes", ""))
+                # Saved either way; the client decides what to tell its user
+                breached = await vault.call(breached_sites, [(site, request["password"])])
+                return 200, {"site": site, "breached": breached.get(site, 0)}
+            if method == "DELETE":
+                if not await vault.call(storage.delete_password, site):
+                    raise HTTPError(404, f"No password found for '{site}'.")
+                return 200, {"site": site}
+        raise HTTPError(404 if method in ("GET", "PUT", "POST", "DELETE") else 405, "No such endpoint.")
+
+    def _peer_allowed(self, writer):
+        """On the Unix socket, reject peers running as another user where the OS tells us"""
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family == getattr(socket, "AF_UNIX", None) and \
+                hasattr(socket, "SO_PEERCRED"):
+            creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+            _, uid, _ = struct.unpack("3i", creds)
+            return uid == os.getuid()
+        return True
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until the client closes it"""
+        if not self._peer_allowed(writer):
+            writer.close()
+            return
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if length > MAX_BODY:
+                    status, payload, keep_alive = 413, {"error": "Request body too large."}, False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, payload = await self.dispatch(method, target, headers, body)
+                    except HTTPError as e:
+                        status, payload = e.status, {"error": str(e)}
+                    except ValueError as e:
+                        # Storage errors such as a concurrent change by another process
+                        status, payload = 409, {"error": str(e)}
+                    except Exception as e:
+                        status, payload = 500, {"error": f"Internal error: {e}"}
+
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass  # Malformed request or the client went away
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=None, host=None, port=DEFAULT_PORT, ready=None):
+        """Serve until cancelled, on a Unix socket or (with host) a TCP port"""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if self.kdf is None:
+            # Calibrated once, before any work: timed in a worker while
+            # others derive keys, it would pick parameters that are too weak
+            self.kdf = calibrate_kdf(os.getenv("NOSWAG_KDF", "pbkdf2-sha256"),
+                                     int(os.getenv("NOSWAG_KDF_TARGET_MS", DEFAULT_TARGET_MS)))
+        # Workers are spawned, not forked: forking while the pool's own
+        # threads hold its queue lock can leave a worker deadlocked
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        if host is not None:
+            server = await asyncio.start_server(self.handle, host, port)
+        else:
+            directory = os.path.dirname(socket_path)
+            if directory:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            # Only the owning user may reach the socket
+            old_umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(self.handle, socket_path)
+            finally:
+                os.umask(old_umask)
+
+        expiry = asyncio.create_task(self.expire_sessions())
+        try:
+            async with server:
+                if ready is not None:
+                    ready.set()
+                await server.serve_forever()
+        finally:
+            expiry.cancel()
+            for user in list(self._vaults):
+                await self._vaults.pop(user).close()
+            self._sessions.clear()
+            self._pool.shutdown(cancel_futures=True)
+            if host is None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve many noSwag vaults from one directory")
+    parser.add_argument("directory", help="directory holding one vault file per user")
+    parser.add_argument("--socket", default=None, help="Unix socket path (the default)")
+    parser.add_argument("--port", type=int, default=None,
+                        help=f"listen on 127.0.0.1 instead, e.g. {DEFAULT_PORT}")
+    parser.add_argument("--ttl", type=int, default=DEFAULT_TTL, help="idle seconds before a session expires")
+    parser.add_argument("--workers", type=int, default=None, help="key derivation processes (default: CPUs)")
+    parser.add_argument("--format", default=".json", choices=VAULT_EXTENSIONS, help="format of new vaults")
+    args = parser.parse_args()
+
+    if args.port is None and not hasattr(socket, "AF_UNIX"):
+        print("Unix domain sockets are not available here; use --port.")
+        return 1
+
+    server = VaultServer(args.directory, args.ttl, args.workers, args.format)
+    socket_path = args.socket or default_socket_path()
+    host = "127.0.0.1" if args.port is not None else None
+    print(f"Serving vaults in {args.directory} on "
+          f"{f'http://{host}:{args.port}' if host else socket_path}")
+
+    async def run():
+        task = asyncio.create_task(server.serve(socket_path, host, args.port or DEFAULT_PORT))
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, task.cancel)
+            except (NotImplementedError, RuntimeError):
+                pass
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    print("Server stopped.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# verification_codes.py - pending email verification codes with expiry and rate limits
+import heapq
+import hmac
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CODE_TTL = 600              # seconds a code stays valid
+MAX_ATTEMPTS = 5            # wrong guesses before a code is thrown away
+MAX_CODES = 100000          # pending codes kept at most; the soonest to expire go first
+
+# Token buckets: each email may request EMAIL_BURST codes at once and then
+# one per EMAIL_REFILL seconds; the whole store GLOBAL_BURST at once and
+# then GLOBAL_RATE per second
+EMAIL_BURST = 3
+EMAIL_REFILL = 60
+GLOBAL_BURST = 100
+GLOBAL_RATE = 10
+MAX_BUCKETS = 100000        # per-email buckets remembered (least recently used dropped)
+
+class RateLimitError(ValueError):
+    """Raised when codes are requested faster than the limits allow"""
+
+class TokenBucket:
+    def __init__(self, capacity, rate, now):
+        self.capacity = capacity
+        self.rate = rate  # tokens added per second
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        """Spend one token if one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class CodeStore:
+    """In-memory pending codes; expired ones leave through a min-heap ordered by expiry"""
+
+    def __init__(self, ttl=CODE_TTL, max_attempts=MAX_ATTEMPTS, max_codes=MAX_CODES,
+                 email_burst=EMAIL_BURST, email_refill=EMAIL_REFILL,
+                 global_burst=GLOBAL_BURST, global_rate=GLOBAL_RATE, clock=time.time):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.max_codes = max_codes
+        self.email_burst = email_burst
+        self.email_refill = email_refill
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # email -> TokenBucket
+        self._global = TokenBucket(global_burst, global_rate, clock())
+        self._codes = {}               # email -> [code, expires, attempts, sequence]
+        self._heap = []                # (expires, sequence, email); stale items are skipped
+        self._sequence = itertools.count()
+
+    def _allow(self, email, now):
+        bucket = self._buckets.get(email)
+        if bucket is None:
+            bucket = self._buckets[email] = TokenBucket(self.email_burst, 1 / self.email_refill, now)
+            if len(self._buckets) > MAX_BUCKETS:
+                # The least recently used bucket has long refilled, so forgetting it is harmless
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(email)
+        if not bucket.take(now):
+            raise RateLimitError("Too many codes requested for this email; please wait a minute.")
+        if not self._global.take(now):
+            raise RateLimitError("Too many verification requests right now; please try again shortly.")
+
+    def add(self, email, code):
+        """Store a new code for email, replacing any earlier one"""
+        with self._lock:
+            now = self.clock()
+            self._allow(email, now)
+            self._purge(now)
+            self._put(email, code, now + self.ttl)
+            while self._count() > self.max_codes:
+                self._evict_soonest()
+
+    def verify(self, email, code):
+        """Check a code in constant time; a code works once and only until it expires"""
+        with self._lock:
+            now = self.clock()
+            self._purge(now)
+            stored = self._get(email)
+            if stored is None:
+                return False
+            stored_code, expires, attempts = stored
+            if expires <= now:
+                self._delete(email)
+                return False
+            if hmac.compare_digest(stored_code.encode(), str(code).encode()):
+                self._delete(email)
+                return True
+            if attempts + 1 >= self.max_attempts:
+                self._delete(email)
+            else:
+                self._count_attempt(email)
+            return False
+
+    def purge_expired(self):
+        """Drop expired codes; return how many were removed"""
+        with self._lock:
+            return self._purge(self.clock())
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    def close(self):
+        pass
+
+    # Storage of the codes themselves; SQLiteCodeStore overrides these
+
+    def _put(self, email, code, expires):
+        sequence = next(self._sequence)
+        self._codes[email] = [code, expires, 0, sequence]
+        heapq.heappush(self._heap, (expires, sequence, email))
+
+    def _get(self, email):
+        entry = self._codes.get(email)
+        return None if entry is None else tuple(entry[:3])
+
+    def _delete(self, email):
+        # The heap item stays behind and is skipped when it surfaces
+        self._codes.pop(email, None)
+
+    def _count_attempt(self, email):
+        self._codes[email][2] += 1
+
+    def _count(self):
+        return len(self._codes)
+
+    def _pop_heap(self):
+        """Remove the heap top; return True if it was the live entry for its email"""
+        _, sequence, email = heapq.heappop(self._heap)
+        entry = self._codes.get(email)
+        if entry is not None and entry[3] == sequence:
+            del self._codes[email]
+            return True
+        return False
+
+    def _purge(self, now):
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            removed += self._pop_heap()
+        # Replaced and used codes leave stale heap items; rebuild once they dominate
+        if len(self._heap) > 2 * len(self._codes) + 64:
+            self._heap = [(entry[1], entry[3], email) for email, entry in self._codes.items()]
+            heapq.heapify(self._heap)
+        return removed
+
+    def _evict_soonest(self):
+        while self._heap and not self._pop_heap():
+            pass
+
+class SQLiteCodeStore(CodeStore):
+    """Pending codes kept in a SQLite file, so they survive a restart"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS codes (
+        email TEXT PRIMARY KEY,
+        code TEXT NOT NULL,
+        expires REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS codes_expires ON codes (expires);
+    """
+
+    def __init__(self, path, **limits):
+        super().__init__(**limits)
+        self.path = path
+        # Codes are secrets too: owner-only permissions from the start
+        if not os.path.exists(path):
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        # Kept in step with every change, since COUNT(*) would scan the table
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM codes").fetchone()[0]
+
+    def _put(self, email, code, expires):
+        updated = self._conn.execute("UPDATE codes SET code = ?, expires = ?, attempts = 0 WHERE email = ?",
+                                     (code, expires, email)).rowcount
+        if not updated:
+            self._conn.execute("INSERT INTO codes (email, code, expires) VALUES (?, ?, ?)", (email, code, expires))
+            self._rows += 1
+
+    def _get(self, email):
+        return self._conn.execute("SELECT code, expires, attempts FROM codes WHERE email = ?",
+                                  (email,)).fetchone()
+
+    def _delete(self, email):
+        self._rows -= self._conn.execute("DELETE FROM codes WHERE email = ?", (email,)).rowcount
+
+    def _count_attempt(self, email):
+        self._conn.execute("UPDATE codes SET attempts = attempts + 1 WHERE email = ?", (email,))
+
+    def _count(self):
+        return self._rows
+
+    def _purge(self, now):
+        # The expires index turns this into a range delete, like popping a heap
+        removed = self._conn.execute("DELETE FROM codes WHERE expires <= ?", (now,)).rowcount
+        self._rows -= removed
+        return removed
+
+    def _evict_soonest(self):
+        self._rows -= self._conn.execute("DELETE FROM codes WHERE email = "
+                                         "(SELECT email FROM codes ORDER BY expires LIMIT 1)").rowcount
+
+    def close(self):
+        self._conn.close()
+
+def open_code_store(path=None, **limits):
+    """Return a SQLite-backed store for path, or an in-memory one"""
+    return SQLiteCodeStore(path, **limits) if path else CodeStore(**limits)